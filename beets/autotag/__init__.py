@@ -30,6 +30,8 @@ from .hooks import (  # noqa
     Distance,
 )
 from .match import tag_item, tag_album, Proposal  # noqa
+from .match import search_album_candidates, score_album_candidates  # noqa
+from .match import match_by_id  # noqa
 from .match import Recommendation  # noqa
 
 # Global logger.
@@ -18,7 +18,9 @@ from __future__ import division, absolute_import, print_function
 
 from collections import namedtuple
 from functools import total_ordering
+from threading import Thread
 import re
+import sys
 
 from beets import logging
 from beets import plugins
@@ -598,6 +600,60 @@ def tracks_for_id(track_id):
             yield t
 
 
+def _mb_candidates(search, *args):
+    """Call the MusicBrainz search function `search` with `args` and
+    return a list of its results, logging API errors.
+    """
+    try:
+        return list(search(*args))
+    except mb.MusicBrainzAPIError as exc:
+        exc.log(log)
+        return []
+
+
+def _gather_candidates(sources):
+    """Call the functions in `sources`, which search one metadata
+    source each, and return a list of all their results in the order of
+    `sources`.
+
+    With the `parallel_sources` option, the sources are searched at the
+    same time in separate threads, so a lookup takes as long as the
+    slowest source instead of all of them together. The sources must
+    then be thread-safe. An exception raised by a source is raised
+    again here once all the sources are done.
+    """
+    if len(sources) < 2 or not config['import']['parallel_sources']:
+        return [candidate for source in sources for candidate in source()]
+
+    results = [()] * len(sources)
+    errors = [None] * len(sources)
+
+    def search(index):
+        try:
+            results[index] = list(sources[index]())
+        except Exception as exc:  # noqa: B902
+            # Sources are plugin code that may raise anything. Nothing is
+            # swallowed: the error is raised again in the calling thread.
+            log.debug(u'candidate source failed: {0}', exc, exc_info=True)
+            errors[index] = (exc, sys.exc_info()[2])
+
+    threads = [Thread(target=search, args=(i,)) for i in range(len(sources))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        # Using a timeout allows us to receive KeyboardInterrupt
+        # exceptions during the join().
+        while thread.is_alive():
+            thread.join(1)
+
+    for error in errors:
+        if error:
+            exc, tb = error
+            six.reraise(type(exc), exc, tb)
+    return [candidate for result in results for candidate in result]
+
+
 @plugins.notify_info_yielded(u'albuminfo_received')
 def album_candidates(items, artist, album, va_likely, extra_tags):
     """Search for album matches. ``items`` is a list of Item objects
@@ -608,28 +664,25 @@ def album_candidates(items, artist, album, va_likely, extra_tags):
     is an optional dictionary of additional tags used to further
     constrain the search.
     """
+    sources = []
 
     # Base candidates if we have album and artist to match.
     if artist and album:
-        try:
-            for candidate in mb.match_album(artist, album, len(items),
-                                            extra_tags):
-                yield candidate
-        except mb.MusicBrainzAPIError as exc:
-            exc.log(log)
+        sources.append(lambda: _mb_candidates(
+            mb.match_album, artist, album, len(items), extra_tags
+        ))
 
     # Also add VA matches from MusicBrainz where appropriate.
     if va_likely and album:
-        try:
-            for candidate in mb.match_album(None, album, len(items),
-                                            extra_tags):
-                yield candidate
-        except mb.MusicBrainzAPIError as exc:
-            exc.log(log)
+        sources.append(lambda: _mb_candidates(
+            mb.match_album, None, album, len(items), extra_tags
+        ))
 
     # Candidates from plugins.
-    for candidate in plugins.candidates(items, artist, album, va_likely,
-                                        extra_tags):
+    sources += plugins.candidate_sources(items, artist, album, va_likely,
+                                         extra_tags)
+
+    for candidate in _gather_candidates(sources):
         yield candidate
 
 
@@ -639,15 +692,14 @@ def item_candidates(item, artist, title):
     ``artist`` and ``title`` are strings and either reflect the item or
     are specified by the user.
     """
+    sources = []
 
     # MusicBrainz candidates.
     if artist and title:
-        try:
-            for candidate in mb.match_track(artist, title):
-                yield candidate
-        except mb.MusicBrainzAPIError as exc:
-            exc.log(log)
+        sources.append(lambda: _mb_candidates(mb.match_track, artist, title))
 
     # Plugin candidates.
-    for candidate in plugins.item_candidates(item, artist, title):
+    sources += plugins.item_candidate_sources(item, artist, title)
+
+    for candidate in _gather_candidates(sources):
         yield candidate
@@ -407,39 +407,82 @@ def tag_album(items, search_artist=None, search_album=None,
     The recommendation is calculated from the match quality of the
     candidates.
     """
+    id_proposal = None
+    if not search_ids:
+        # Try search based on current ID.
+        id_info = match_by_id(items)
+        if id_info:
+            id_proposal = score_album_candidates(items, [id_info])
+
+    cur_artist, cur_album, infos = search_album_candidates(
+        items, search_artist, search_album, search_ids, id_proposal
+    )
+    scored = id_proposal.candidates if id_proposal else ()
+    return cur_artist, cur_album, score_album_candidates(items, infos,
+                                                         scored)
+
+
+def score_album_candidates(items, infos, scored=()):
+    """Compare `items` with each of the `AlbumInfo` objects in `infos`
+    and return a `Proposal` containing the `AlbumMatch` candidates,
+    sorted by distance, and a recommendation. `scored` may hold matches
+    for `items` that were already computed, which are included as they
+    are.
+
+    This is the CPU-bound part of `tag_album`; it does not query the
+    metadata backends.
+    """
+    # The output result (distance, AlbumInfo) tuples (keyed by MB album
+    # ID).
+    candidates = dict((match.info.album_id, match) for match in scored)
+    for info in infos:
+        _add_candidate(items, candidates, info)
+
+    log.debug(u'Evaluating {0} candidates.', len(candidates))
+    # Sort and get the recommendation.
+    candidates = _sort_candidates(candidates.values())
+    rec = _recommendation(candidates)
+    return Proposal(candidates, rec)
+
+
+def search_album_candidates(items, search_artist=None, search_album=None,
+                            search_ids=[], id_proposal=None):
+    """Search the metadata backends for albums matching `items` and
+    return a tuple of the current artist name, the current album name,
+    and a list of the `AlbumInfo` objects found, which still need to be
+    scored with `score_album_candidates`. The parameters are those of
+    `tag_album`.
+
+    `id_proposal` is the scored `Proposal` for the album found by the
+    items' own ID with `match_by_id`, if any. The search is skipped if
+    it is a strong match, and leaves out its candidates otherwise.
+    """
     # Get current metadata.
     likelies, consensus = current_metadata(items)
     cur_artist = likelies['artist']
     cur_album = likelies['album']
     log.debug(u'Tagging {0} - {1}', cur_artist, cur_album)
 
-    # The output result (distance, AlbumInfo) tuples (keyed by MB album
-    # ID).
-    candidates = {}
+    infos = []
 
     # Search by explicit ID.
     if search_ids:
         for search_id in search_ids:
             log.debug(u'Searching for album ID: {0}', search_id)
-            for id_candidate in hooks.albums_for_id(search_id):
-                _add_candidate(items, candidates, id_candidate)
+            infos.extend(hooks.albums_for_id(search_id))
 
     # Use existing metadata or text search.
     else:
-        # Try search based on current ID.
-        id_info = match_by_id(items)
-        if id_info:
-            _add_candidate(items, candidates, id_info)
-            rec = _recommendation(list(candidates.values()))
+        if id_proposal:
+            rec = id_proposal.recommendation
             log.debug(u'Album ID match recommendation is {0}', rec)
-            if candidates and not config['import']['timid']:
+            if id_proposal.candidates and not config['import']['timid']:
                 # If we have a very good MBID match, return immediately.
                 # Otherwise, this match will compete against metadata-based
                 # matches.
                 if rec == Recommendation.strong:
                     log.debug(u'ID match.')
-                    return cur_artist, cur_album, \
-                        Proposal(list(candidates.values()), rec)
+                    return cur_artist, cur_album, infos
 
         # Search terms.
         if not (search_artist and search_album):
@@ -459,19 +502,18 @@ def tag_album(items, search_artist=None, search_album=None,
                      any(item.comp for item in items))
         log.debug(u'Album might be VA: {0}', va_likely)
 
-        # Get the results from the data sources.
-        for matched_candidate in hooks.album_candidates(items,
-                                                        search_artist,
-                                                        search_album,
-                                                        va_likely,
-                                                        extra_tags):
-            _add_candidate(items, candidates, matched_candidate)
-
-    log.debug(u'Evaluating {0} candidates.', len(candidates))
-    # Sort and get the recommendation.
-    candidates = _sort_candidates(candidates.values())
-    rec = _recommendation(candidates)
-    return cur_artist, cur_album, Proposal(candidates, rec)
+        # Get the results from the data sources, except for the ID
+        # match, which is already scored.
+        scored = set(match.info.album_id for match in
+                     (id_proposal.candidates if id_proposal else ()))
+        infos.extend(info for info in hooks.album_candidates(items,
+                                                             search_artist,
+                                                             search_album,
+                                                             va_likely,
+                                                             extra_tags)
+                     if info.album_id not in scored)
+
+    return cur_artist, cur_album, infos
 
 
 def tag_item(item, search_artist=None, search_title=None,
@@ -18,7 +18,7 @@ Library.
 """
 from __future__ import division, absolute_import, print_function
 
-from .db import Model, Database
+from .db import Model, Database, QueryCache
 from .query import Query, FieldQuery, MatchQuery, AndQuery, OrQuery
 from .types import Type
 from .queryparse import query_from_strings
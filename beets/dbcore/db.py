@@ -19,21 +19,25 @@ from __future__ import division, absolute_import, print_function
 
 import time
 import os
-from collections import defaultdict
+import itertools
+from collections import defaultdict, OrderedDict
 import threading
 import sqlite3
 import contextlib
+import hashlib
 
 import beets
 from beets.util import functemplate
-from beets.util import py3_path
+from beets.util import py3_path, lazy_property
 from beets.dbcore import types
-from .query import MatchQuery, NullSort, TrueQuery
+from .query import AndQuery, FullTextQuery, MatchQuery, NullSort, \
+    RegexpQuery, TrueQuery
 import six
 if six.PY2:
     from collections import Mapping
 else:
     from collections.abc import Mapping
+    buffer = memoryview  # Python 3 name for blob values.
 
 
 class DBAccessError(Exception):
@@ -45,6 +49,27 @@ class DBAccessError(Exception):
     """
 
 
+class WriteConflictError(Exception):
+    """A transaction that has read from the database could not start
+    writing because another transaction modified the database after
+    the read. Nothing was written by the failed transaction; it can be
+    retried. Transactions that read and then write should be opened
+    with `write=True` to avoid this.
+    """
+
+
+class ComputedFieldError(ValueError):
+    """A field that is computed in Python, and not stored in the
+    database, was used where SQL needs a column or attribute.
+    """
+
+
+class CursorError(ValueError):
+    """The object that a page of results should continue after is not
+    among the results.
+    """
+
+
 class FormattedMapping(Mapping):
     """A `dict`-like formatted view of a model.
 
@@ -58,10 +83,13 @@ class FormattedMapping(Mapping):
     def __init__(self, model, for_path=False):
         self.for_path = for_path
         self.model = model
-        self.model_keys = model.keys(True)
+
+    @lazy_property
+    def model_keys(self):
+        return self.model.keys(True)
 
     def __getitem__(self, key):
-        if key in self.model_keys:
+        if key in self.model:
             return self._get_formatted(self.model, key)
         else:
             raise KeyError(key)
@@ -95,6 +123,8 @@ class LazyConvertDict(object):
     """Lazily convert types for attributes fetched from the database
     """
 
+    __slots__ = ('data', 'model_cls', '_converted')
+
     def __init__(self, model_cls):
         """Initialize the object empty
         """
@@ -107,6 +137,14 @@ class LazyConvertDict(object):
         """
         self.data = data
 
+    def init_missing(self, data, skip=()):
+        """Add base data for the keys that have no value yet, except
+        for those in `skip`
+        """
+        for key, value in data.items():
+            if key not in self and key not in skip:
+                self.data[key] = value
+
     def _convert(self, key, value):
         """Convert the attribute type according the the SQL type
         """
@@ -176,7 +214,173 @@ class LazyConvertDict(object):
     def __contains__(self, key):
         """Determine whether `key` is an attribute on this object.
         """
-        return key in self.keys()
+        return key in self._converted or key in self.data
+
+    def __iter__(self):
+        """Iterate over the available field names (excluding computed
+        fields).
+        """
+        return iter(self.keys())
+
+
+_UNSET = object()
+"""A placeholder for fixed fields that have no value.
+"""
+
+
+class FixedValues(object):
+    """Lazily convert the fixed attributes of a model, stored compactly.
+
+    Values live in a single list indexed by each field's position in
+    the shared map given by `model_cls._field_positions()`, instead of
+    in dictionaries of their own. A bit mask records which positions
+    already hold converted values; the others hold the raw values from
+    the database and are converted on first access.
+    """
+
+    __slots__ = ('model_cls', '_values', '_converted')
+
+    def __init__(self, model_cls):
+        """Initialize the object empty
+        """
+        self.model_cls = model_cls
+        self._values = []
+        self._converted = 0
+
+    def init(self, data):
+        """Set the base data that should be lazily converted. `data`
+        may be a dict or an `sqlite3.Row`; keys that are not fixed
+        fields are ignored.
+        """
+        positions = self.model_cls._field_positions()
+        values = [_UNSET] * len(positions)
+        for key in data.keys():
+            pos = positions.get(key)
+            if pos is not None:
+                values[pos] = data[key]
+        self._values = values
+        self._converted = 0
+
+    def init_missing(self, data, skip=()):
+        """Add base data for the keys that have no value yet, except
+        for those in `skip`
+        """
+        for key in data.keys():
+            if key not in self and key not in skip:
+                pos = self._position(key)
+                if pos is not None:
+                    self._values[pos] = data[key]
+
+    def _position(self, key):
+        """Get the position of the field `key` in the value list, making
+        room for it if needed, or None if `key` is not a fixed field.
+        """
+        pos = self.model_cls._field_positions().get(key)
+        if pos is not None and pos >= len(self._values):
+            self._values.extend([_UNSET] * (pos + 1 - len(self._values)))
+        return pos
+
+    def __setitem__(self, key, value):
+        """Set an attribute value, assume it's already converted
+        """
+        pos = self._position(key)
+        if pos is None:
+            raise KeyError(key)
+        self._values[pos] = value
+        self._converted |= 1 << pos
+
+    def __getitem__(self, key):
+        """Get an attribute value, converting the type on demand
+        if needed
+        """
+        pos = self.model_cls._field_positions().get(key)
+        if pos is None or pos >= len(self._values):
+            return None
+        value = self._values[pos]
+        if value is _UNSET:
+            return None
+        if not self._converted >> pos & 1:
+            value = self.model_cls._type(key).from_sql(value)
+            self._values[pos] = value
+            self._converted |= 1 << pos
+        return value
+
+    def __delitem__(self, key):
+        """Delete both converted and base data
+        """
+        pos = self.model_cls._field_positions().get(key)
+        if pos is not None and pos < len(self._values):
+            self._values[pos] = _UNSET
+            self._converted &= ~(1 << pos)
+
+    def keys(self):
+        """Get a list of available field names for this object.
+        """
+        values = self._values
+        return [key for key, pos in self.model_cls._field_positions().items()
+                if pos < len(values) and values[pos] is not _UNSET]
+
+    def copy(self):
+        """Create a copy of the object.
+        """
+        new = self.__class__(self.model_cls)
+        new._values = list(self._values)
+        new._converted = self._converted
+        return new
+
+    def __getstate__(self):
+        """Get the state for pickling. Values are stored by field name
+        since positions may differ in another process, and `_UNSET`
+        would not be recognized after unpickling.
+        """
+        values = {}
+        converted = []
+        for key, pos in self.model_cls._field_positions().items():
+            if pos < len(self._values) and self._values[pos] is not _UNSET:
+                values[key] = self._values[pos]
+                if self._converted >> pos & 1:
+                    converted.append(key)
+        return self.model_cls, values, converted
+
+    def __setstate__(self, state):
+        """Restore the state returned by `__getstate__`.
+        """
+        self.model_cls, values, converted = state
+        self.init(values)
+        positions = self.model_cls._field_positions()
+        for key in converted:
+            self._converted |= 1 << positions[key]
+
+    # Act like a dictionary.
+
+    def update(self, values):
+        """Assign all values in the given dict.
+        """
+        for key, value in values.items():
+            self[key] = value
+
+    def items(self):
+        """Iterate over (key, value) pairs that this object contains.
+        Computed fields are not included.
+        """
+        for key in self:
+            yield key, self[key]
+
+    def get(self, key, default=None):
+        """Get the value for a given key or `default` if it does not
+        exist.
+        """
+        if key in self:
+            return self[key]
+        else:
+            return default
+
+    def __contains__(self, key):
+        """Determine whether `key` is an attribute on this object.
+        """
+        pos = self.model_cls._field_positions().get(key)
+        return pos is not None and pos < len(self._values) and \
+            self._values[pos] is not _UNSET
 
     def __iter__(self):
         """Iterate over the available field names (excluding computed
@@ -211,6 +415,9 @@ class Model(object):
     flags are used to track which fields need to be stored.
     """
 
+    __slots__ = ('_db', '_dirty', '_values_fixed', '_values_flex',
+                 '_partial', '__weakref__')
+
     # Abstract components (to be provided by subclasses).
 
     _table = None
@@ -245,12 +452,34 @@ class Model(object):
     do not relate to any specific field.
     """
 
+    _indexes = {}
+    """Secondary indexes on the model's table. The keys are index names
+    and the values are tuples of the fixed fields to index.
+    """
+
     _always_dirty = False
     """By default, fields only become "dirty" when their value actually
     changes. Enabling this flag marks fields as dirty even when the new
     value is the same as the old value (e.g., `o.f = o.f`).
     """
 
+    @classmethod
+    def _field_positions(cls):
+        """Get the map from fixed field names to their positions in the
+        compact storage of `FixedValues`. The map is shared by all
+        objects of the class and only ever grows, so positions stay
+        valid when fields are added to `_fields` later.
+        """
+        positions = cls.__dict__.get('_positions')
+        if positions is None:
+            positions = {}
+            cls._positions = positions
+        if len(positions) < len(cls._fields):
+            for key in cls._fields:
+                if key not in positions:
+                    positions[key] = len(positions)
+        return positions
+
     @classmethod
     def _getters(cls):
         """Return a mapping from field names to getter functions.
@@ -274,8 +503,13 @@ class Model(object):
         """
         self._db = db
         self._dirty = set()
-        self._values_fixed = LazyConvertDict(self)
-        self._values_flex = LazyConvertDict(self)
+        self._values_fixed = FixedValues(type(self))
+        self._values_flex = LazyConvertDict(type(self))
+
+        # If the object was fetched with only some of its fields, the
+        # set of their names; the others are loaded on first access.
+        # False for complete objects.
+        self._partial = False
 
         # Initial contents.
         self.update(values)
@@ -295,6 +529,22 @@ class Model(object):
 
         return obj
 
+    def __getstate__(self):
+        """Get the state of the object for pickling: its values and dirty
+        flags. The database is left out since it cannot be pickled, so
+        an unpickled object is not associated with any database.
+        """
+        if self._partial:
+            self._load_missing()
+        return self._values_fixed, self._values_flex, self._dirty
+
+    def __setstate__(self, state):
+        """Restore the state returned by `__getstate__`.
+        """
+        self._db = None
+        self._partial = False
+        self._values_fixed, self._values_flex, self._dirty = state
+
     def __repr__(self):
         return '{0}({1})'.format(
             type(self).__name__,
@@ -332,6 +582,7 @@ class Model(object):
         new._values_fixed = self._values_fixed.copy()
         new._values_flex = self._values_flex.copy()
         new._dirty = self._dirty.copy()
+        new._partial = self._partial
         return new
 
     # Essential field accessors.
@@ -353,15 +604,26 @@ class Model(object):
         if key in getters:  # Computed.
             return getters[key](self)
         elif key in self._fields:  # Fixed.
+            if key not in self._values_fixed and self._unfetched(key):
+                self._load_missing()
             if key in self._values_fixed:
                 return self._values_fixed[key]
             else:
                 return self._type(key).null
         elif key in self._values_flex:  # Flexible.
             return self._values_flex[key]
+        elif self._unfetched(key):
+            self._load_missing()
+            return self[key]
         else:
             raise KeyError(key)
 
+    def _unfetched(self, key):
+        """Check whether `key` was left out when the object was fetched
+        with a projection, so its value (or absence) is not known yet.
+        """
+        return bool(self._partial) and key not in self._partial
+
     def _setitem(self, key, value):
         """Assign the value for a field, return whether new and old value
         differ.
@@ -371,6 +633,9 @@ class Model(object):
             source = self._values_fixed
         else:
             source = self._values_flex
+        if key not in source and self._unfetched(key):
+            # Compare against the stored value.
+            self._load_missing()
 
         # If the field has a type, filter the value.
         value = self._type(key).normalize(value)
@@ -392,6 +657,8 @@ class Model(object):
     def __delitem__(self, key):
         """Remove a flexible attribute from the model.
         """
+        if key not in self._values_flex and self._unfetched(key):
+            self._load_missing()
         if key in self._values_flex:  # Flexible.
             del self._values_flex[key]
             self._dirty.add(key)  # Mark for dropping on store.
@@ -407,6 +674,8 @@ class Model(object):
         `computed` parameter controls whether computed (plugin-provided)
         fields are included in the key list.
         """
+        if self._partial:
+            self._load_missing()
         base_keys = list(self._fields) + list(self._values_flex.keys())
         if computed:
             return base_keys + list(self._getters().keys())
@@ -447,7 +716,13 @@ class Model(object):
     def __contains__(self, key):
         """Determine whether `key` is an attribute on this object.
         """
-        return key in self.keys(True)
+        if key in self._fields or key in self._values_flex or \
+                key in self._getters():
+            return True
+        if self._unfetched(key):
+            self._load_missing()
+            return key in self._values_flex
+        return False
 
     def __iter__(self):
         """Iterate over the available field names (excluding computed
@@ -485,50 +760,46 @@ class Model(object):
         :param fields: the fields to be stored. If not specified, all fields
         will be.
         """
+        self._check_db()
+        self._db._store_changes([self], fields)
+
+    def _sql_value(self, key):
+        """Get the value of a fixed field converted for storage in the
+        database. Null values are stored as SQL NULL.
+        """
+        value = self[key]
+        if value is None:
+            return None
+        return self._type(key).to_sql(value)
+
+    def _pending_changes(self, fields=None):
+        """Collect the modifications that need to be written to the
+        database and mark the object as clean.
+
+        Return a triple: a list of `(key, value)` pairs for the dirty
+        fixed fields among `fields` (with values converted for SQL), a
+        list of `(key, value)` pairs for the modified or added flexible
+        attributes, and a list of the deleted flexible attribute keys.
+        """
         if fields is None:
             fields = self._fields
-        self._check_db()
 
-        # Build assignments for query.
-        assignments = []
-        subvars = []
+        fixed = []
         for key in fields:
             if key != 'id' and key in self._dirty:
-                self._dirty.remove(key)
-                assignments.append(key + '=?')
-                value = self._type(key).to_sql(self[key])
-                subvars.append(value)
-        assignments = ','.join(assignments)
+                fixed.append((key, self._sql_value(key)))
 
-        with self._db.transaction() as tx:
-            # Main table update.
-            if assignments:
-                query = 'UPDATE {0} SET {1} WHERE id=?'.format(
-                    self._table, assignments
-                )
-                subvars.append(self.id)
-                tx.mutate(query, subvars)
-
-            # Modified/added flexible attributes.
-            for key, value in self._values_flex.items():
-                if key in self._dirty:
-                    self._dirty.remove(key)
-                    tx.mutate(
-                        'INSERT INTO {0} '
-                        '(entity_id, key, value) '
-                        'VALUES (?, ?, ?);'.format(self._flex_table),
-                        (self.id, key, value),
-                    )
+        flex = []
+        for key, value in self._values_flex.items():
+            if key in self._dirty:
+                flex.append((key, value))
 
-            # Deleted flexible attributes.
-            for key in self._dirty:
-                tx.mutate(
-                    'DELETE FROM {0} '
-                    'WHERE entity_id=? AND key=?'.format(self._flex_table),
-                    (self.id, key)
-                )
+        flex_keys = set(self._values_flex.keys())
+        deleted = [key for key in self._dirty
+                   if key not in self._fields and key not in flex_keys]
 
         self.clear_dirty()
+        return fixed, flex, deleted
 
     def load(self):
         """Refresh the object's metadata from the library database.
@@ -536,16 +807,43 @@ class Model(object):
         self._check_db()
         stored_obj = self._db._get(type(self), self.id)
         assert stored_obj is not None, u"object {0} not in DB".format(self.id)
-        self._values_fixed = LazyConvertDict(self)
-        self._values_flex = LazyConvertDict(self)
+        self._values_fixed = FixedValues(type(self))
+        self._values_flex = LazyConvertDict(type(self))
+        self._partial = False
         self.update(dict(stored_obj))
         self.clear_dirty()
 
+    def _load_missing(self):
+        """Fetch the fields that were left out when the object was
+        fetched with a projection (see `Database._fetch`). Values that
+        have been assigned or deleted in the meantime are kept.
+        """
+        self._partial = False
+        if not self._db or not self.id:
+            return
+        with self._db.transaction() as tx:
+            rows = tx.query(
+                'SELECT * FROM {0} WHERE id=?'.format(self._table),
+                (self.id,)
+            )
+            flex_rows = tx.query(
+                'SELECT key, value FROM {0} WHERE entity_id=?'.format(
+                    self._flex_table
+                ),
+                (self.id,)
+            )
+        if rows:
+            self._values_fixed.init_missing(dict(rows[0]))
+        self._values_flex.init_missing(
+            dict((row['key'], row['value']) for row in flex_rows),
+            self._dirty,
+        )
+
     def remove(self):
         """Remove the object's associated rows from the database.
         """
         self._check_db()
-        with self._db.transaction() as tx:
+        with self._db.transaction(write=True) as tx:
             tx.mutate(
                 'DELETE FROM {0} WHERE id=?'.format(self._table),
                 (self.id,)
@@ -566,19 +864,7 @@ class Model(object):
         if db:
             self._db = db
         self._check_db(False)
-
-        with self._db.transaction() as tx:
-            new_id = tx.mutate(
-                'INSERT INTO {0} DEFAULT VALUES'.format(self._table)
-            )
-            self.id = new_id
-            self.added = time.time()
-
-            # Mark every non-null field as dirty and store.
-            for key in self:
-                if self[key] is not None:
-                    self._dirty.add(key)
-            self.store()
+        self._db._insert_objects([self])
 
     # Formatting and templating.
 
@@ -620,18 +906,47 @@ class Model(object):
 
 # Database controller and supporting interfaces.
 
+_SKIPPED = object()
+"""A placeholder for result positions that do not hold an object.
+"""
+
+
 class Results(object):
     """An item query result set. Iterating over the collection lazily
     constructs LibModel objects that reflect database rows.
+
+    Rows are not fetched all at once. The result set starts out with
+    just the ids of the matching rows; the full rows and their flexible
+    attributes are then pulled from the database in chunks of
+    `chunk_size` entities as the results are consumed. This keeps the
+    time to the first result and the memory footprint bounded even for
+    very large libraries.
+
+    Materialized objects are kept in a slot per result position, so
+    random access (``results[n]``) and slicing (``results[a:b]``) only
+    build the objects in the chunks they touch. Iterating keeps them
+    too; use `stream` to go over the results once without keeping
+    them.
+
+    When the result set is restricted to a list of `fields`, only those
+    columns and flexible attributes are fetched. The objects then load
+    their other fields from the database when they are first accessed.
+    """
+
+    chunk_size = 256
+    """The number of entities whose rows are fetched from the database
+    in a single round trip.
     """
-    def __init__(self, model_class, rows, db, flex_rows,
-                 query=None, sort=None):
+
+    def __init__(self, model_class, ids, db, query=None, sort=None,
+                 fields=None):
         """Create a result set that will construct objects of type
         `model_class`.
 
         `model_class` is a subclass of `LibModel` that will be
-        constructed. `rows` is a query result: a list of mappings. The
-        new objects will be associated with the database `db`.
+        constructed. `ids` is the list of ids of the matching rows, in
+        the order emitted from the database. The new objects will be
+        associated with the database `db`.
 
         If `query` is provided, it is used as a predicate to filter the
         results for a "slow query" that cannot be evaluated by the
@@ -639,58 +954,130 @@ class Results(object):
         full list of results before returning. This means it is a "slow
         sort" and all objects must be built before returning the first
         one.
+
+        If `fields` is a list of field names, only those fields are
+        fetched up front.
         """
         self.model_class = model_class
-        self.rows = rows
+        self.ids = ids
         self.db = db
         self.query = query
         self.sort = sort
-        self.flex_rows = flex_rows
+        self.fields = fields
+
+        # The materialized objects, one slot for each position in `ids`.
+        # A slot is None until the chunk containing it is fetched. Rows
+        # that fail a slow query (or have disappeared from the database
+        # in the meantime) are marked with `_SKIPPED`.
+        self._slots = [None] * len(ids)
+
+        # The fully materialized and sorted object list for a slow sort.
+        self._sorted = None
+
+    def _fetch_chunk(self, ids):
+        """Fetch the rows and flexible attributes for a list of entity
+        ids. Return a list of (row, flex_values) pairs in the order of
+        `ids`. Ids whose rows have disappeared from the database in the
+        meantime are mapped to None.
+        """
+        subvals = list(ids)
+        placeholders = ','.join('?' * len(ids))
+        columns = '*'
+        flex_clause = ''
+        flex_subvals = []
+        if self.fields is not None:
+            fixed = self.model_class._fields
+            columns = ', '.join(
+                ['id'] + [f for f in self.fields if f in fixed and f != 'id']
+            )
+            flex_subvals = [f for f in self.fields if f not in fixed]
+            flex_clause = ' AND key IN ({0})'.format(
+                ','.join('?' * len(flex_subvals))
+            )
+
+        with self.db.transaction() as tx:
+            rows = tx.query(
+                'SELECT {0} FROM {1} WHERE id IN ({2})'.format(
+                    columns, self.model_class._table, placeholders
+                ),
+                subvals,
+            )
+            if self.fields is not None and not flex_subvals:
+                flex_rows = []
+            else:
+                flex_rows = tx.query(
+                    'SELECT entity_id, key, value FROM {0} '
+                    'WHERE entity_id IN ({1}){2}'.format(
+                        self.model_class._flex_table, placeholders,
+                        flex_clause
+                    ),
+                    subvals + flex_subvals,
+                )
 
-        # We keep a queue of rows we haven't yet consumed for
-        # materialization. We preserve the original total number of
-        # rows.
-        self._rows = rows
-        self._row_count = len(rows)
+        rows_by_id = dict((row['id'], row) for row in rows)
+        flex_attrs = self._get_indexed_flex_attrs(flex_rows)
+        return [(rows_by_id[id], flex_attrs.get(id, {}))
+                if id in rows_by_id else None
+                for id in ids]
 
-        # The materialized objects corresponding to rows that have been
-        # consumed.
-        self._objects = []
+    def _build_chunk(self, chunk):
+        """Fetch and construct the objects for the `chunk`th group of
+        `chunk_size` positions. Return a list with an object, or
+        `_SKIPPED`, for each position.
+        """
+        start = chunk * self.chunk_size
+        ids = self.ids[start:start + self.chunk_size]
+        objs = []
+        for pair in self._fetch_chunk(ids):
+            obj = _SKIPPED
+            if pair is not None:
+                obj = self._make_model(*pair)
+                # If there is a slow-query predicate, ensure that the
+                # object passes it.
+                if self.query and not self.query.match(obj):
+                    obj = _SKIPPED
+            objs.append(obj)
+        return objs
+
+    def _load_chunk(self, chunk):
+        """Materialize the objects for the `chunk`th group of
+        `chunk_size` positions and store them in their slots.
+        """
+        start = chunk * self.chunk_size
+        objs = self._build_chunk(chunk)
+        self._slots[start:start + len(objs)] = objs
+
+    def _slot(self, pos):
+        """Get the object at position `pos` in the database order,
+        fetching its chunk if necessary. Return `_SKIPPED` if there is
+        no object at that position.
+        """
+        if self._slots[pos] is None:
+            self._load_chunk(pos // self.chunk_size)
+        return self._slots[pos]
 
     def _get_objects(self):
         """Construct and generate Model objects for they query. The
         objects are returned in the order emitted from the database; no
         slow sort is applied.
 
-        For performance, this generator caches materialized objects to
-        avoid constructing them more than once. This way, iterating over
-        a `Results` object a second time should be much faster than the
-        first.
+        For performance, materialized objects are cached in their slots
+        to avoid constructing them more than once. This way, iterating
+        over a `Results` object a second time should be much faster
+        than the first.
         """
-
-        # Index flexible attributes by the item ID, so we have easier access
-        flex_attrs = self._get_indexed_flex_attrs()
-
-        index = 0  # Position in the materialized objects.
-        while index < len(self._objects) or self._rows:
-            # Are there previously-materialized objects to produce?
-            if index < len(self._objects):
-                yield self._objects[index]
-                index += 1
-
-            # Otherwise, we consume another row, materialize its object
-            # and produce it.
-            else:
-                while self._rows:
-                    row = self._rows.pop(0)
-                    obj = self._make_model(row, flex_attrs.get(row['id'], {}))
-                    # If there is a slow-query predicate, ensurer that the
-                    # object passes it.
-                    if not self.query or self.query.match(obj):
-                        self._objects.append(obj)
-                        index += 1
-                        yield obj
-                        break
+        for pos in range(len(self._slots)):
+            obj = self._slot(pos)
+            if obj is not _SKIPPED:
+                yield obj
+
+    def _get_sorted(self):
+        """Get the list of all objects in slow-sorted order. The list is
+        built once and reused afterwards.
+        """
+        if self._sorted is None:
+            self._sorted = self.sort.sort(list(self._get_objects()))
+        return self._sorted
 
     def __iter__(self):
         """Construct and generate Model objects for all matching
@@ -698,18 +1085,40 @@ class Results(object):
         """
         if self.sort:
             # Slow sort. Must build the full list first.
-            objects = self.sort.sort(list(self._get_objects()))
-            return iter(objects)
+            return iter(self._get_sorted())
 
         else:
             # Objects are pre-sorted (i.e., by the database).
             return self._get_objects()
 
-    def _get_indexed_flex_attrs(self):
+    def stream(self):
+        """Generate the matching objects, in sorted order, without
+        keeping them in the result set.
+
+        Iterating over the result set itself caches every object it
+        builds, so a full pass ends up holding all of them. This is
+        meant for callers that go over the results only once, such as
+        listing or exporting them: only one chunk of objects is alive at
+        a time. A slow sort still needs the full list.
+        """
+        if self.sort:
+            for obj in self._get_sorted():
+                yield obj
+            return
+
+        for chunk in range(0, len(self._slots), self.chunk_size):
+            objs = self._slots[chunk:chunk + self.chunk_size]
+            if None in objs:
+                objs = self._build_chunk(chunk // self.chunk_size)
+            for obj in objs:
+                if obj is not _SKIPPED:
+                    yield obj
+
+    def _get_indexed_flex_attrs(self, flex_rows):
         """ Index flexible attributes by the entity id they belong to
         """
         flex_values = dict()
-        for row in self.flex_rows:
+        for row in flex_rows:
             if row['entity_id'] not in flex_values:
                 flex_values[row['entity_id']] = dict()
 
@@ -720,31 +1129,30 @@ class Results(object):
     def _make_model(self, row, flex_values={}):
         """ Create a Model object for the given row
         """
-        cols = dict(row)
-        values = dict((k, v) for (k, v) in cols.items()
-                      if not k[:4] == 'flex')
-
-        # Construct the Python object
-        obj = self.model_class._awaken(self.db, values, flex_values)
+        # Construct the Python object. Only the row's fixed fields are
+        # kept, so it can be passed as is.
+        obj = self.model_class._awaken(self.db, row, flex_values)
+        if self.fields is not None:
+            obj._partial = frozenset(self.fields) | frozenset(['id'])
         return obj
 
     def __len__(self):
         """Get the number of matching objects.
         """
-        if not self._rows:
+        if self._sorted is not None:
             # Fully materialized. Just count the objects.
-            return len(self._objects)
+            return len(self._sorted)
 
         elif self.query:
             # A slow query. Fall back to testing every object.
             count = 0
-            for obj in self:
+            for obj in self._get_objects():
                 count += 1
             return count
 
         else:
             # A fast query. Just count the rows.
-            return self._row_count
+            return len(self.ids)
 
     def __nonzero__(self):
         """Does this result contain any objects?
@@ -754,25 +1162,66 @@ class Results(object):
     def __bool__(self):
         """Does this result contain any objects?
         """
+        if self.query:
+            # Avoid testing every object against a slow query.
+            return any(True for obj in self._get_objects())
         return bool(len(self))
 
     def __getitem__(self, n):
-        """Get the nth item in this result set. This is inefficient: all
-        items up to n are materialized and thrown away.
+        """Get the nth item in this result set, or a list of items for a
+        slice.
+
+        For fast queries, only the chunks containing the requested
+        positions are materialized. A slow query has to be evaluated on
+        all the preceding objects, and a slow sort needs the full list.
         """
-        if not self._rows and not self.sort:
-            # Fully materialized and already in order. Just look up the
-            # object.
-            return self._objects[n]
+        if self.sort:
+            objects = self._get_sorted()
+
+        elif self.query:
+            # The position of a match is only known once all preceding
+            # rows have been tested. Materialized objects are reused.
+            if isinstance(n, slice) and \
+                    all(i is None or i >= 0
+                        for i in (n.start, n.stop, n.step)):
+                return list(itertools.islice(
+                    self._get_objects(), n.start, n.stop, n.step
+                ))
+            elif isinstance(n, six.integer_types) and n >= 0:
+                objects = list(itertools.islice(
+                    self._get_objects(), n + 1
+                ))
+            else:
+                objects = list(self._get_objects())
+
+        elif isinstance(n, slice):
+            objects = (self._slot(pos)
+                       for pos in range(*n.indices(len(self._slots))))
+            return [obj for obj in objects if obj is not _SKIPPED]
+
+        else:
+            pos = n + len(self._slots) if n < 0 else n
+            if 0 <= pos < len(self._slots) and \
+                    self._slot(pos) is not _SKIPPED:
+                return self._slots[pos]
+            objects = []
 
-        it = iter(self)
         try:
-            for i in range(n):
-                next(it)
-            return next(it)
-        except StopIteration:
+            return objects[n]
+        except IndexError:
             raise IndexError(u'result index {0} out of range'.format(n))
 
+    def store_all(self, fields=None):
+        """Save the pending changes of all the objects in this result set
+        in a single batch (see `Database.store_many`). Objects that have
+        not been materialized yet cannot have changes and are skipped.
+        """
+        self.db.store_many(
+            [obj for obj in self._slots
+             if obj is not None and obj is not _SKIPPED],
+            fields,
+        )
+
     def get(self):
         """Return the first matching object, or None if no objects
         match.
@@ -784,24 +1233,113 @@ class Results(object):
             return None
 
 
+class ReadWriteLock(object):
+    """A lock that lets any number of threads read at the same time but
+    gives a writer exclusive access.
+
+    A writer waits for the active readers to finish, and new readers
+    wait while a writer is active or waiting, so writers are not
+    starved. The thread holding the write lock may also read.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        """Wait for shared access unless the current thread is already
+        the writer. Return whether a read lock was taken, in which case
+        it must be given up with `release_read`.
+        """
+        thread_id = threading.current_thread().ident
+        with self._cond:
+            if self._writer == thread_id:
+                return False
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+            return True
+
+    def release_read(self):
+        """Give up shared access.
+        """
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """A context manager that holds a read lock unless the current
+        thread is already the writer.
+        """
+        owned = self.acquire_read()
+        try:
+            yield
+        finally:
+            if owned:
+                self.release_read()
+
+    def acquire_write(self, blocking=True):
+        """Wait for exclusive access and return True. The write lock is
+        not reentrant. If `blocking` is false, return False instead of
+        waiting when the lock is taken.
+        """
+        with self._cond:
+            busy = self._writer is not None or self._readers
+            if busy and not blocking:
+                return False
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = threading.current_thread().ident
+            return True
+
+    def release_write(self):
+        """Give up exclusive access.
+        """
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+
 class Transaction(object):
     """A context manager for safe, concurrent access to the database.
     All SQL commands should be executed through a transaction.
+
+    Read-only transactions (which only `query`) from different threads
+    may proceed at the same time. The first query takes a shared read
+    lock that is held until the outermost transaction in the thread
+    ends, so all of its queries see the same state of the database. A
+    transaction takes the database's write lock instead when it first
+    modifies the database (via `mutate`, `mutate_many` or `script`) and
+    holds it until the outermost transaction ends, so writers are
+    serialized.
+
+    A transaction created with `write` set takes the write lock as soon
+    as it begins, so everything it reads stays current until it has
+    written. A transaction that only starts writing after it has read
+    raises `WriteConflictError` if another thread modified the database
+    in between.
     """
-    def __init__(self, db):
+    def __init__(self, db, write=False):
         self.db = db
+        self.write = write
+        self._reading = False
+        self._writing = False
+        self._modified = False
+        self._read_generation = None
 
     def __enter__(self):
         """Begin a transaction. This transaction may be created while
         another is active in a different thread.
         """
         with self.db._tx_stack() as stack:
-            first = not stack
             stack.append(self)
-        if first:
-            # Beginning a "root" transaction, which corresponds to an
-            # SQLite transaction.
-            self.db._db_lock.acquire()
+        if self.write:
+            self._begin_write(modify=False)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -814,13 +1352,82 @@ class Transaction(object):
             empty = not stack
         if empty:
             # Ending a "root" transaction. End the SQLite transaction.
-            self.db._connection().commit()
-            self.db._db_lock.release()
+            try:
+                self.db._connection().commit()
+            finally:
+                if self._modified:
+                    # Results read by other threads during the write
+                    # may predate the commit.
+                    self.db._generation += 1
+                    self._modified = False
+                self._read_generation = None
+                if self._reading:
+                    self._reading = False
+                    self.db._db_lock.release_read()
+                if self._writing:
+                    self._writing = False
+                    self.db._db_lock.release_write()
+
+    def _root(self):
+        """Get the outermost active transaction in the thread.
+        """
+        with self.db._tx_stack() as stack:
+            return stack[0] if stack else None
+
+    def _begin_read(self):
+        """Take a read lock for the thread's root transaction if it
+        does not hold the read or write lock yet.
+        """
+        root = self._root()
+        if root and not root._reading and not root._writing:
+            root._reading = self.db._db_lock.acquire_read()
+            root._read_generation = self.db._generation
+
+    def try_write(self):
+        """Take the write lock for the thread's root transaction only if
+        that does not mean waiting, and return whether the transaction
+        may write. A root transaction that has already read cannot take
+        it without giving up its consistent view, so it may not write.
+        """
+        root = self._root()
+        if root is None or root._reading:
+            return False
+        if not root._writing:
+            if not self.db._db_lock.acquire_write(blocking=False):
+                return False
+            root._writing = True
+        return True
+
+    def _begin_write(self, modify=True):
+        """Take the write lock for the thread's root transaction, which
+        corresponds to an SQLite transaction, if it does not already
+        hold it. Unless `modify` is false, the write counts as a
+        modification of the database's contents.
+        """
+        root = self._root()
+        if root and not root._writing:
+            if root._reading:
+                # Upgrade: a reader cannot wait for the other readers,
+                # so it gives up its read lock and fails if another
+                # thread writes before it gets the write lock.
+                root._reading = False
+                self.db._db_lock.release_read()
+            self.db._db_lock.acquire_write()
+            if root._read_generation not in (None, self.db._generation):
+                self.db._db_lock.release_write()
+                raise WriteConflictError(
+                    u'database modified by another transaction')
+            root._writing = True
+        if modify:
+            if root:
+                root._modified = True
+            self.db._generation += 1
 
     def query(self, statement, subvals=()):
         """Execute an SQL statement with substitution values and return
         a list of rows from the database.
         """
+        self._begin_read()
         cursor = self.db._connection().execute(statement, subvals)
         return cursor.fetchall()
 
@@ -828,9 +1435,24 @@ class Transaction(object):
         """Execute an SQL statement with substitution values and return
         the row ID of the last affected row.
         """
+        cursor = self._execute('execute', statement, subvals)
+        return cursor.lastrowid
+
+    def mutate_many(self, statement, seq_of_subvals):
+        """Execute an SQL statement once for every sequence of
+        substitution values in `seq_of_subvals`.
+        """
+        self._execute('executemany', statement, seq_of_subvals)
+
+    def _execute(self, method, statement, args, modify=True):
+        """Run a mutating statement using the connection method named
+        `method` and return the cursor. Writes to bookkeeping tables,
+        like the persistent query cache, pass a false `modify` so they
+        do not invalidate cached query results.
+        """
+        self._begin_write(modify)
         try:
-            cursor = self.db._connection().execute(statement, subvals)
-            return cursor.lastrowid
+            return getattr(self.db._connection(), method)(statement, args)
         except sqlite3.OperationalError as e:
             # In two specific cases, SQLite reports an error while accessing
             # the underlying database file. We surface these exceptions as
@@ -843,9 +1465,531 @@ class Transaction(object):
 
     def script(self, statements):
         """Execute a string containing multiple SQL statements."""
+        self._begin_write()
         self.db._connection().executescript(statements)
 
 
+class QueryCache(object):
+    """A size-bounded cache of the ids selected by query statements,
+    evicting the least recently used entries. Entries are tagged with
+    the database's generation, which changes whenever the database is
+    modified, and are discarded once it differs.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(sql, subvals):
+        # Blob values are passed to SQLite as (unhashable) buffers.
+        return sql, tuple(bytes(v) if isinstance(v, buffer) else v
+                          for v in subvals)
+
+    def get(self, sql, subvals, generation):
+        """Get the cached list of ids for the statement or None.
+        """
+        key = self._key(sql, subvals)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, sql, subvals, generation, ids):
+        """Remember the ids selected by the statement as of the
+        given database generation.
+        """
+        key = self._key(sql, subvals)
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.size:
+                self._entries.popitem(last=False)
+            self._entries[key] = (generation, tuple(ids))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get a dictionary with the cache's size and its hit and miss
+        counts.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.size,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def _is_busy(exc):
+    """Check whether an `sqlite3.OperationalError` means that another
+    connection holds a conflicting lock on the database.
+    """
+    return exc.args[0] in ('database is locked', 'database is busy')
+
+
+class PersistentQueryCache(object):
+    """A cache of the ids selected by query statements that is stored
+    in the database itself, so that it outlives the process. Entries
+    are tagged with a counter that triggers on the model tables
+    increment whenever their contents change, so results are only
+    reused while the database is unchanged. Stale entries are dropped
+    when new ones are stored, and only the `size` most recently stored
+    entries are kept.
+
+    Caching is opportunistic: a query never waits for (or blocks) a
+    writer just to store its result. If another thread or process is
+    writing, the result is not stored.
+    """
+
+    table = 'query_cache'
+    counter_table = 'query_cache_counter'
+
+    size = 1000
+    """The maximum number of entries kept in the cache table.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(sql, subvals):
+        # Python's string hashes differ between processes, so the key
+        # is identified by a digest of its representation instead.
+        key = QueryCache._key(sql, subvals)
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def counter(self, tx):
+        """Get the database's modification counter.
+        """
+        rows = tx.query('SELECT counter FROM {0}'.format(self.counter_table))
+        return rows[0][0]
+
+    def get(self, tx, sql, subvals, counter):
+        """Get the stored list of ids for the statement, if it was
+        stored when the modification counter was `counter`, or None.
+        """
+        rows = tx.query(
+            'SELECT ids FROM {0} WHERE fingerprint = ? AND counter = ?'
+            .format(self.table),
+            (self._fingerprint(sql, subvals), counter)
+        )
+        with self._lock:
+            if not rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+        ids = rows[0][0]
+        return [int(i) for i in ids.split(',')] if ids else []
+
+    def put(self, sql, subvals, counter, ids):
+        """Store the ids selected by the statement as of the given
+        modification counter, and remove any entries that predate it
+        or exceed the cache's size. Do nothing if the database is busy.
+        """
+        values = (self._fingerprint(sql, subvals), counter,
+                  ','.join(str(i) for i in ids))
+        with self.db.transaction() as tx:
+            if not tx.try_write():
+                return
+            try:
+                with self.db._busy_timeout(0):
+                    tx._execute('execute',
+                                'DELETE FROM {0} WHERE counter < ?'
+                                .format(self.table),
+                                (counter,), modify=False)
+                    tx._execute('execute',
+                                'INSERT OR REPLACE INTO {0} '
+                                '(fingerprint, counter, ids) VALUES (?, ?, ?)'
+                                .format(self.table),
+                                values, modify=False)
+                    tx._execute('execute',
+                                'DELETE FROM {0} WHERE rowid <= (SELECT rowid '
+                                'FROM {0} ORDER BY rowid DESC LIMIT 1 '
+                                'OFFSET ?)'.format(self.table),
+                                (self.size,), modify=False)
+            except DBAccessError:
+                # The library is read-only; just go without the cache.
+                pass
+            except sqlite3.OperationalError as exc:
+                # Another process is writing.
+                if not _is_busy(exc):
+                    raise
+
+    def stats(self):
+        """Get a dictionary with the cache's size and its hit and miss
+        counts.
+        """
+        with self.db.transaction() as tx:
+            size = tx.query('SELECT COUNT(*) FROM {0}'.format(self.table))
+        with self._lock:
+            return {'size': size[0][0],
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class QueryPlan(object):
+    """Describes how a query and sort over a model are executed: an SQL
+    statement selecting the ids of the matching objects, in order when
+    possible, and the *slow* parts of the query and sort that have to
+    be evaluated in Python on the objects themselves. Plans are built
+    by `Database._plan`.
+    """
+
+    def __init__(self, db, model_class, query, sort):
+        self.db = db
+        self.model_class = model_class
+        self.query = query
+        self.sort = sort
+
+        where, self.subvals, self.slow_query = self._split_query(query)
+        self.where = where or '1'
+        order_by = sort.order_clause()
+        self.sql = "SELECT id FROM {0} WHERE {1}{2}".format(
+            model_class._table,
+            self.where,
+            " ORDER BY {0}".format(order_by) if order_by else '',
+        )
+        self.slow_sort = sort if sort.is_slow() else None
+
+    @staticmethod
+    def _split_query(query):
+        """Split `query` into an SQL clause, its substitution values,
+        and the slow residue that must be matched in Python (or None).
+        The fast parts of a conjunction still run in SQL when some
+        others are slow.
+        """
+        where, subvals = query.clause()
+        if where:
+            return where, subvals, None
+
+        if isinstance(query, AndQuery):
+            clauses = []
+            subvals = []
+            slow = []
+            for subq in query.subqueries:
+                subq_clause, subq_subvals = subq.clause()
+                if subq_clause:
+                    clauses.append('(' + subq_clause + ')')
+                    subvals += subq_subvals
+                else:
+                    slow.append(subq)
+            if clauses:
+                return ' AND '.join(clauses), subvals, AndQuery(slow)
+
+        return None, (), query
+
+    def _fetch_ids(self, sql=None, subvals=None):
+        """Get the list of ids selected by the plan's statement, or by
+        another `sql` statement with `subvals`.
+        """
+        if sql is None:
+            sql, subvals = self.sql, self.subvals
+
+        cache = self.db.query_cache
+        if cache is None:
+            return self._query_ids(sql, subvals)
+
+        generation = self.db._generation
+        ids = cache.get(sql, subvals, generation)
+        if ids is None:
+            ids = self._query_ids(sql, subvals)
+            cache.put(sql, subvals, generation, ids)
+        return ids
+
+    def _query_ids(self, sql, subvals):
+        stored = self.db.persistent_cache
+        with self.db.transaction() as tx:
+            if stored is None:
+                return [row[0] for row in tx.query(sql, subvals)]
+
+            # Read the counter first: if the database changes while the
+            # query runs, the entry is stored as already stale.
+            counter = stored.counter(tx)
+            ids = stored.get(tx, sql, subvals, counter)
+            if ids is not None:
+                return ids
+            ids = [row[0] for row in tx.query(sql, subvals)]
+
+        # Store the result outside of the reading transaction.
+        stored.put(sql, subvals, counter, ids)
+        return ids
+
+    def _page_sql(self, limit=None, offset=None, after=None):
+        """Build an SQL statement and its substitution values that
+        select a page of the ids: at most `limit` of them, skipping the
+        first `offset`, that come after the object with id `after` in
+        the sort order. Ties in the sort are broken by id, so the pages
+        do not overlap. The plan's query and sort must be fast.
+        """
+        table = self.model_class._table
+        terms = self.sort.order_terms() + [('id', True)]
+        where = [self.where]
+        subvals = list(self.subvals)
+
+        if after is not None:
+            # Look up the sort keys of the object we continue after.
+            with self.db.transaction() as tx:
+                rows = tx.query('SELECT {0} FROM {1} WHERE id = ?'.format(
+                    ', '.join(expr for expr, _ in terms), table
+                ), (after,))
+            if not rows:
+                raise CursorError(u'no {0} with id {1}'.format(
+                    self.model_class.__name__, after
+                ))
+            keys = list(rows[0])
+
+            # Objects come after it if they have equal keys up to some
+            # term, and are beyond it in that term. SQL NULLs sort first.
+            alternatives = []
+            for i, (expr, ascending) in enumerate(terms):
+                clause = [u'{0} IS ?'.format(e) for e, _ in terms[:i]]
+                subvals += keys[:i]
+                if ascending:
+                    clause.append(u'({0} > ? OR (? IS NULL AND {0} IS NOT '
+                                  u'NULL))'.format(expr))
+                else:
+                    clause.append(u'({0} < ? OR ({0} IS NULL AND ? IS NOT '
+                                  u'NULL))'.format(expr))
+                subvals += [keys[i], keys[i]]
+                alternatives.append(u'(' + u' AND '.join(clause) + u')')
+            where.append(u'(' + u' OR '.join(alternatives) + u')')
+
+        sql = u'SELECT id FROM {0} WHERE {1} ORDER BY {2} LIMIT ? OFFSET ?'\
+            .format(
+                table,
+                u' AND '.join(u'(' + w + u')' for w in where),
+                u', '.join(u'{0} {1}'.format(expr, 'ASC' if asc else 'DESC')
+                           for expr, asc in terms),
+            )
+        subvals += [-1 if limit is None else limit, offset or 0]
+        return sql, subvals
+
+    def results(self, fields=None, limit=None, offset=None, after=None):
+        """Execute the plan and return a `Results` object. If `fields`
+        is a list of field names, only those fields are fetched up
+        front.
+
+        The results can be restricted to a page of at most `limit`
+        objects that skips the first `offset` ones and starts after the
+        object whose id is `after` (which must exist). When the query
+        and sort are fast, the page is selected in SQL.
+        """
+        paged = limit is not None or offset or after is not None
+        if paged and (self.slow_query or self.slow_sort or
+                      self.sort.order_terms() is None):
+            return self._page_slow(fields, limit, offset, after)
+
+        if self.slow_query or self.slow_sort:
+            # Matching and sorting in Python would load the other
+            # fields of every object one by one.
+            fields = None
+
+        if paged:
+            ids = self._fetch_ids(*self._page_sql(limit, offset, after))
+        else:
+            ids = self._fetch_ids()
+
+        # Only the ids are fetched up front. The full rows and their
+        # flexible attributes are streamed in chunks by `Results` as
+        # they are consumed.
+        return Results(self.model_class, ids, self.db,
+                       self.slow_query, self.slow_sort, fields)
+
+    def _page_slow(self, fields, limit, offset, after):
+        """Select a page of the results (see `results`) in Python.
+        """
+        objs = list(Results(self.model_class, self._fetch_ids(), self.db,
+                            self.slow_query, self.slow_sort))
+        if after is not None:
+            ids = [obj.id for obj in objs]
+            if after not in ids:
+                raise CursorError(u'no {0} with id {1} in the results'.format(
+                    self.model_class.__name__, after
+                ))
+            objs = objs[ids.index(after) + 1:]
+        objs = objs[offset or 0:]
+        if limit is not None:
+            objs = objs[:limit]
+        return Results(self.model_class, [obj.id for obj in objs], self.db,
+                       fields=fields)
+
+    def _field_expr(self, field, cast=False):
+        """Get an SQL expression for the value of `field`, a fixed field
+        or a flexible attribute, in the plan's table. Flexible attributes
+        are converted by their type's `sql_cast` if `cast` is true, and
+        give None if the type has no SQL conversion.
+        """
+        model_cls = self.model_class
+        if field in model_cls._fields:
+            return u'{0}.{1}'.format(model_cls._table, field)
+        if field in model_cls._getters():
+            raise ComputedFieldError(u'cannot aggregate computed field {0}'
+                                     .format(field))
+        value = (u"(SELECT {0}.value FROM {0} WHERE {0}.entity_id = {1}.id "
+                 u"AND {0}.key = '{2}')").format(model_cls._flex_table,
+                                                 model_cls._table,
+                                                 field.replace("'", "''"))
+        field_type = model_cls._types.get(field)
+        if cast and field_type:
+            value = field_type.sql_cast(value)
+        return value
+
+    def aggregate(self, sums=(), distinct=(), group_by=None, order_by=None):
+        """Compute statistics over the matching objects: their number,
+        the totals of the fields in `sums`, and the numbers of distinct
+        (non-null) values of the fields in `distinct`. Return a
+        dictionary with a `count` and `sum` and `distinct` dictionaries
+        mapping the field names to their statistics.
+
+        If `group_by` is a field, return a list of `(value, stats)` pairs
+        with the statistics for every value of the field instead. The
+        groups are ordered by value, or by the smallest value of the
+        `order_by` field in each group.
+
+        The statistics are computed in SQL unless the query is slow or
+        a summed field's type cannot be converted in SQL.
+        """
+        totals = None if self.slow_query else \
+            [self._field_expr(f, True) for f in sums]
+        if totals is None or None in totals:
+            return self._aggregate_slow(sums, distinct, group_by, order_by)
+
+        columns = [u'COUNT(*)']
+        columns += [u'TOTAL({0})'.format(total) for total in totals]
+        columns += [u'COUNT(DISTINCT {0})'.format(self._field_expr(f))
+                    for f in distinct]
+        sql = u'FROM {0} WHERE {1}'.format(self.model_class._table,
+                                           self.where)
+        if group_by:
+            columns.insert(0, self._field_expr(group_by) + u' AS grp')
+            sql += u' GROUP BY grp ORDER BY {0}'.format(
+                u'MIN({0})'.format(self._field_expr(order_by))
+                if order_by else u'grp'
+            )
+
+        with self.db.transaction() as tx:
+            rows = tx.query(u'SELECT {0} {1}'.format(u', '.join(columns), sql),
+                            self.subvals)
+
+        def stats(values):
+            values = list(values)
+            return {
+                'count': values[0],
+                'sum': dict(zip(sums, values[1:len(sums) + 1])),
+                'distinct': dict(zip(distinct, values[len(sums) + 1:])),
+            }
+
+        if not group_by:
+            return stats(rows[0])
+        field_type = self.model_class._type(group_by)
+        groups = []
+        for row in rows:
+            # `sqlite3.Row` cannot be sliced on Python 2.
+            row = tuple(row)
+            groups.append((None if row[0] is None
+                           else field_type.from_sql(row[0]),
+                           stats(row[1:])))
+        return groups
+
+    def _aggregate_slow(self, sums, distinct, group_by, order_by):
+        """Compute the statistics of `aggregate` in Python.
+        """
+        groups = OrderedDict()
+        orders = {}
+        for obj in self.results():
+            group = obj.get(group_by) if group_by else None
+            if group not in groups:
+                groups[group] = (0, dict((f, 0.0) for f in sums),
+                                 dict((f, set()) for f in distinct))
+            count, totals, values = groups[group]
+            groups[group] = (count + 1, totals, values)
+            for field in sums:
+                try:
+                    totals[field] += float(obj.get(field) or 0)
+                except (TypeError, ValueError):
+                    pass
+            for field in distinct:
+                if obj.get(field) is not None:
+                    values[field].add(obj.get(field))
+            if order_by:
+                value = obj.get(order_by)
+                if orders.get(group) is None or \
+                        (value is not None and value < orders[group]):
+                    orders[group] = value
+
+        def stats(count, totals, values):
+            return {
+                'count': count,
+                'sum': totals,
+                'distinct': dict((f, len(v)) for f, v in values.items()),
+            }
+
+        if not group_by:
+            return stats(*groups.get(None, (0, dict((f, 0.0) for f in sums),
+                                            dict((f, ()) for f in distinct))))
+
+        def key(group):
+            value = orders.get(group) if order_by else group
+            return (value is not None, value)
+        return [(group, stats(*groups[group]))
+                for group in sorted(groups, key=key)]
+
+    def explain(self):
+        """Get SQLite's query plan for the SQL statement as a list of
+        strings, indented to show their nesting.
+        """
+        with self.db.transaction() as tx:
+            rows = tx.query('EXPLAIN QUERY PLAN ' + self.sql, self.subvals)
+        depths = {}
+        lines = []
+        for row in rows:
+            # The plan's rows are `(id, parent, notused, detail)` since
+            # SQLite 3.24 and `(selectid, order, from, detail)` before,
+            # without the nesting.
+            if 'parent' in row.keys():
+                depth = depths[row[0]] = depths.get(row[1], -1) + 1
+            else:
+                depth = 0
+            lines.append('  ' * depth + row[3])
+        return lines
+
+    def profile(self):
+        """Execute the plan one phase at a time. Return the list of
+        matching objects and a list of `(phase, seconds)` pairs timing
+        the SQL query (`fetch`), the construction of the objects
+        (`materialize`), the slow query (`filter`), and the slow sort
+        (`sort`).
+        """
+        timings = []
+        start = time.time()
+        ids = self._fetch_ids()
+        timings.append(('fetch', time.time() - start))
+
+        start = time.time()
+        objs = list(Results(self.model_class, ids, self.db))
+        timings.append(('materialize', time.time() - start))
+
+        start = time.time()
+        if self.slow_query:
+            objs = [obj for obj in objs if self.slow_query.match(obj)]
+        timings.append(('filter', time.time() - start))
+
+        start = time.time()
+        if self.slow_sort:
+            objs = self.slow_sort.sort(objs)
+        timings.append(('sort', time.time() - start))
+
+        return objs, timings
+
+
 class Database(object):
     """A container for Model objects that wraps an SQLite database as
     the backend.
@@ -858,9 +2002,11 @@ class Database(object):
     supports_extensions = hasattr(sqlite3.Connection, 'enable_load_extension')
     """Whether or not the current version of SQLite supports extensions"""
 
-    def __init__(self, path, timeout=5.0):
+    def __init__(self, path, timeout=5.0, fts=False, persistent_cache=False,
+                 cached_statements=None):
         self.path = path
         self.timeout = timeout
+        self.cached_statements = cached_statements
 
         self._connections = {}
         self._tx_stacks = defaultdict(list)
@@ -876,14 +2022,49 @@ class Database(object):
         # capability: where SQLite was compiled without HAVE_USLEEP, its
         # backoff algorithm in the case of contention was causing
         # whole-second sleeps (!) that would trigger its internal
-        # timeout. Using this lock ensures only one SQLite transaction
-        # is active at a time.
-        self._db_lock = threading.Lock()
+        # timeout. Using this lock ensures only one writing SQLite
+        # transaction is active at a time, and that reads do not run
+        # concurrently with it, even in WAL mode: a reader that goes on
+        # to write must not have seen an older snapshot.
+        self._db_lock = ReadWriteLock()
+
+        # A counter incremented by every modification of the database,
+        # and an optional `QueryCache` that depends on it.
+        self._generation = 0
+        self.query_cache = None
 
         # Set up database schema.
         for model_cls in self._models:
             self._make_table(model_cls._table, model_cls._fields)
             self._make_attribute_table(model_cls._flex_table)
+            self._make_indexes(model_cls._table, model_cls._indexes)
+
+        # Set up (or tear down) the full-text search tables, which map
+        # table names to `(fts_table, fields)` pairs.
+        self._fts_tables = {}
+        for model_cls in self._models:
+            fields = [f for f in model_cls._search_fields
+                      if f in model_cls._fields]
+            if fts and fields:
+                fts_table = self._make_fts_table(model_cls._table, fields)
+                if fts_table:
+                    self._fts_tables[model_cls._table] = (fts_table, fields)
+            else:
+                self._drop_fts_table(model_cls._table)
+
+        # Set up (or tear down) the query cache stored in the database.
+        # If another process is writing, leave the schema as it is for
+        # now and go without the cache.
+        self.persistent_cache = None
+        try:
+            if persistent_cache:
+                self._make_persistent_cache()
+                self.persistent_cache = PersistentQueryCache(self)
+            else:
+                self._drop_persistent_cache()
+        except sqlite3.OperationalError as exc:
+            if not _is_busy(exc):
+                raise
 
     # Primitive access control: connections and transactions.
 
@@ -910,9 +2091,10 @@ class Database(object):
         # Make a new connection. The `sqlite3` module can't use
         # bytestring paths here on Python 3, so we need to
         # provide a `str` using `py3_path`.
-        conn = sqlite3.connect(
-            py3_path(self.path), timeout=self.timeout
-        )
+        options = {'timeout': self.timeout}
+        if self.cached_statements is not None:
+            options['cached_statements'] = self.cached_statements
+        conn = sqlite3.connect(py3_path(self.path), **options)
 
         if self.supports_extensions:
             conn.enable_load_extension(True)
@@ -921,6 +2103,9 @@ class Database(object):
             for path in self._extensions:
                 conn.load_extension(path)
 
+        # Support regular expression queries in SQL.
+        conn.create_function('regexp', 2, RegexpQuery.sqlite_regexp)
+
         # Access SELECT results like dictionaries.
         conn.row_factory = sqlite3.Row
         return conn
@@ -933,6 +2118,20 @@ class Database(object):
         with self._shared_map_lock:
             self._connections.clear()
 
+    @contextlib.contextmanager
+    def _busy_timeout(self, timeout):
+        """A context manager that makes the thread's connection wait at
+        most `timeout` seconds for other connections' locks.
+        """
+        conn = self._connection()
+        conn.execute('PRAGMA busy_timeout = {0:d}'.format(int(timeout * 1000)))
+        try:
+            yield
+        finally:
+            conn.execute('PRAGMA busy_timeout = {0:d}'.format(
+                int(self.timeout * 1000)
+            ))
+
     @contextlib.contextmanager
     def _tx_stack(self):
         """A context manager providing access to the current thread's
@@ -943,11 +2142,12 @@ class Database(object):
         with self._shared_map_lock:
             yield self._tx_stacks[thread_id]
 
-    def transaction(self):
+    def transaction(self, write=False):
         """Get a :class:`Transaction` object for interacting directly
-        with the underlying SQLite database.
+        with the underlying SQLite database. Pass `write` for
+        transactions that modify the database after reading from it.
         """
-        return Transaction(self)
+        return Transaction(self, write)
 
     def load_extension(self, path):
         """Load an SQLite extension into all open connections."""
@@ -999,7 +2199,7 @@ class Database(object):
             tx.script(setup_sql)
 
     def _make_attribute_table(self, flex_table):
-        """Create a table and associated index for flexible attributes
+        """Create a table and associated indexes for flexible attributes
         for the given entity (if they don't exist).
         """
         with self.transaction() as tx:
@@ -1012,48 +2212,365 @@ class Database(object):
                     UNIQUE(entity_id, key) ON CONFLICT REPLACE);
                 CREATE INDEX IF NOT EXISTS {0}_by_entity
                     ON {0} (entity_id);
+                CREATE INDEX IF NOT EXISTS {0}_by_key
+                    ON {0} (key, value);
                 """.format(flex_table))
 
+    def _make_indexes(self, table, indexes):
+        """Create or replace the secondary indexes on `table` so that
+        they match `indexes`, a mapping from index names to sequences of
+        column names. An index is named `{table}_by_{name}` in the
+        database. Indexes that are not in `indexes` are left alone: they
+        may belong to a plugin that is not loaded this time.
+        """
+        prefix = '{0}_by_'.format(table)
+        wanted = dict(('{0}{1}'.format(prefix, name), tuple(columns))
+                      for name, columns in indexes.items())
+
+        # Get current indexes.
+        current = {}
+        with self.transaction() as tx:
+            for row in tx.query('PRAGMA index_list({0})'.format(table)):
+                name = row['name']
+                if name.startswith(prefix):
+                    info = tx.query('PRAGMA index_info({0})'.format(name))
+                    current[name] = tuple(r['name'] for r in info)
+
+        setup_sql = ''
+        for name, columns in wanted.items():
+            if current.get(name) != columns:
+                if name in current:
+                    setup_sql += 'DROP INDEX {0};\n'.format(name)
+                setup_sql += 'CREATE INDEX {0} ON {1} ({2});\n'.format(
+                    name, table, ', '.join(columns)
+                )
+
+        if setup_sql:
+            with self.transaction() as tx:
+                tx.script(setup_sql)
+
+    def _make_fts_table(self, table, fields):
+        """Set up an SQLite FTS5 table indexing the given text columns
+        of `table` for substring search, along with triggers that keep
+        it in sync with the table. Return the name of the full-text
+        table, or None if this SQLite lacks FTS5 or its trigram
+        tokenizer.
+        """
+        fts_table = '{0}_fts'.format(table)
+        try:
+            with self.transaction() as tx:
+                columns = [row[1] for row in tx.query(
+                    'PRAGMA table_info({0})'.format(fts_table)
+                )]
+                triggers = [row[0] for row in tx.query(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                    "AND tbl_name = ?", (table,)
+                )]
+        except sqlite3.OperationalError:
+            # The table exists, but FTS5 is not available.
+            return None
+        if columns == list(fields) and set(triggers).issuperset(
+                '{0}_{1}'.format(fts_table, action)
+                for action in ('insert', 'delete', 'update')):
+            # Table exists and indexes the right columns.
+            return fts_table
+
+        cols = ', '.join(fields)
+        new_values = ', '.join('new.' + f for f in fields)
+        old_values = ', '.join('old.' + f for f in fields)
+        setup_sql = self._drop_fts_sql(table) + """
+            CREATE VIRTUAL TABLE {0} USING fts5(
+                {2}, content='{1}', content_rowid='id', tokenize='trigram');
+            CREATE TRIGGER {0}_insert AFTER INSERT ON {1} BEGIN
+                INSERT INTO {0} (rowid, {2}) VALUES (new.id, {3});
+            END;
+            CREATE TRIGGER {0}_delete AFTER DELETE ON {1} BEGIN
+                INSERT INTO {0} ({0}, rowid, {2})
+                    VALUES ('delete', old.id, {4});
+            END;
+            CREATE TRIGGER {0}_update AFTER UPDATE OF {2} ON {1} BEGIN
+                INSERT INTO {0} ({0}, rowid, {2})
+                    VALUES ('delete', old.id, {4});
+                INSERT INTO {0} (rowid, {2}) VALUES (new.id, {3});
+            END;
+            INSERT INTO {0} ({0}) VALUES ('rebuild');
+            """.format(fts_table, table, cols, new_values, old_values)
+        try:
+            with self.transaction() as tx:
+                tx.script(setup_sql)
+        except sqlite3.OperationalError:
+            # No FTS5 module or trigram tokenizer.
+            return None
+        return fts_table
+
+    def _drop_fts_table(self, table):
+        """Remove the full-text search table for `table` and its
+        triggers, if they exist.
+        """
+        with self.transaction() as tx:
+            rows = tx.query("SELECT name FROM sqlite_master WHERE name = ?",
+                            ('{0}_fts'.format(table),))
+        if rows:
+            try:
+                with self.transaction() as tx:
+                    tx.script(self._drop_fts_sql(table))
+            except sqlite3.OperationalError:
+                # FTS5 is not available to drop the table.
+                pass
+
+    @staticmethod
+    def _drop_fts_sql(table):
+        return """
+            DROP TRIGGER IF EXISTS {0}_fts_insert;
+            DROP TRIGGER IF EXISTS {0}_fts_delete;
+            DROP TRIGGER IF EXISTS {0}_fts_update;
+            DROP TABLE IF EXISTS {0}_fts;
+            """.format(table)
+
+    def _persistent_cache_tables(self):
+        """Get the names of the tables whose changes invalidate the
+        persistent query cache.
+        """
+        tables = []
+        for model_cls in self._models:
+            tables += [model_cls._table, model_cls._flex_table]
+        return tables
+
+    def _make_persistent_cache(self):
+        """Set up the tables of the persistent query cache and the
+        triggers that count modifications of the model tables, if they
+        do not exist yet. The database is only written to when something
+        is missing.
+        """
+        with self.transaction() as tx:
+            existing = set(row[0] for row in tx.query(
+                "SELECT name FROM sqlite_master "
+                "WHERE type IN ('table', 'trigger')"
+            ))
+
+        setup_sql = ''
+        if PersistentQueryCache.table not in existing:
+            setup_sql += """
+                CREATE TABLE {0} (
+                    fingerprint TEXT PRIMARY KEY,
+                    counter INTEGER,
+                    ids TEXT);
+                """.format(PersistentQueryCache.table)
+        if PersistentQueryCache.counter_table not in existing:
+            setup_sql += """
+                CREATE TABLE {0} (counter INTEGER);
+                INSERT INTO {0} (counter) VALUES (0);
+                """.format(PersistentQueryCache.counter_table)
+        for table in self._persistent_cache_tables():
+            for action in ('insert', 'update', 'delete'):
+                name = '{0}_count_{1}'.format(table, action)
+                if name in existing:
+                    continue
+                setup_sql += """
+                    CREATE TRIGGER {0}
+                        AFTER {1} ON {2} BEGIN
+                        UPDATE {3} SET counter = counter + 1;
+                    END;
+                    """.format(name, action.upper(), table,
+                               PersistentQueryCache.counter_table)
+        if setup_sql:
+            with self.transaction() as tx:
+                tx.script(setup_sql)
+
+    def _drop_persistent_cache(self):
+        """Remove the persistent query cache and its triggers, if they
+        exist.
+        """
+        with self.transaction() as tx:
+            rows = tx.query("SELECT name FROM sqlite_master WHERE name = ?",
+                            (PersistentQueryCache.counter_table,))
+        if not rows:
+            return
+
+        setup_sql = """
+            DROP TABLE IF EXISTS {0};
+            DROP TABLE IF EXISTS {1};
+            """.format(PersistentQueryCache.table,
+                       PersistentQueryCache.counter_table)
+        for table in self._persistent_cache_tables():
+            for action in ('insert', 'update', 'delete'):
+                setup_sql += 'DROP TRIGGER IF EXISTS {0}_count_{1};\n'.format(
+                    table, action
+                )
+        with self.transaction() as tx:
+            tx.script(setup_sql)
+
+    # Adding and storing.
+
+    def add_many(self, objs):
+        """Add many new Model objects to the database in a single
+        transaction. This is equivalent to calling `add(db)` on each
+        object, but much faster for large batches. The objects' `id` and
+        `added` fields are set along with any current field values.
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj._db = self
+        self._insert_objects(objs)
+
+    def _insert_objects(self, objs):
+        """Insert rows for the given new Model objects and their flexible
+        attributes.
+
+        The rows for all objects of a model class are inserted with a
+        single `executemany` call over the class's fixed columns. Only
+        the first row is inserted on its own: this takes the write lock
+        and determines the id for the rest of the batch, whose ids are
+        then assigned consecutively.
+        """
+        by_class = defaultdict(list)
+        for obj in objs:
+            by_class[type(obj)].append(obj)
+
+        with self.transaction(write=True) as tx:
+            for model_cls, objs in by_class.items():
+                columns = tuple(key for key in model_cls._fields
+                                if key != 'id')
+                rows = []
+                for obj in objs:
+                    obj.added = time.time()
+                    rows.append([obj._sql_value(key) for key in columns])
+
+                first_id = tx.mutate(
+                    'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                        model_cls._table,
+                        ','.join(columns),
+                        ','.join('?' * len(columns)),
+                    ),
+                    rows[0],
+                )
+                if len(rows) > 1:
+                    tx.mutate_many(
+                        'INSERT INTO {0} (id, {1}) VALUES (?, {2})'.format(
+                            model_cls._table,
+                            ','.join(columns),
+                            ','.join('?' * len(columns)),
+                        ),
+                        ([first_id + i] + row
+                         for i, row in enumerate(rows[1:], 1)),
+                    )
+
+                flex_rows = []
+                for i, obj in enumerate(objs):
+                    obj.id = first_id + i
+                    for key, value in obj._values_flex.items():
+                        if value is not None:
+                            flex_rows.append((obj.id, key, value))
+                    obj.clear_dirty()
+                if flex_rows:
+                    tx.mutate_many(
+                        'INSERT INTO {0} '
+                        '(entity_id, key, value) '
+                        'VALUES (?, ?, ?);'.format(model_cls._flex_table),
+                        flex_rows,
+                    )
+
+    # Storing.
+
+    def store_many(self, objs, fields=None):
+        """Save the pending changes of many Model objects in a single
+        transaction. This is equivalent to calling `store(fields)` on
+        each object, but much faster for large batches.
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj._check_db()
+        self._store_changes(objs, fields)
+
+    def _store_changes(self, objs, fields=None):
+        """Write the pending changes of the given Model objects to the
+        database.
+
+        Objects are grouped by table and by the set of fixed fields they
+        modify, so that every group is written with a single
+        `executemany` call for each kind of statement.
+        """
+        updates = defaultdict(list)
+        flex_updates = defaultdict(list)
+        flex_deletes = defaultdict(list)
+        for obj in objs:
+            fixed, flex, deleted = obj._pending_changes(fields)
+            if fixed:
+                fixed.sort()
+                keys = tuple(key for key, _ in fixed)
+                subvals = [value for _, value in fixed] + [obj.id]
+                updates[obj._table, keys].append(subvals)
+            for key, value in flex:
+                flex_updates[obj._flex_table].append((obj.id, key, value))
+            for key in deleted:
+                flex_deletes[obj._flex_table].append((obj.id, key))
+
+        with self.transaction(write=True) as tx:
+            # Main table updates.
+            for (table, keys), subvals in updates.items():
+                tx.mutate_many(
+                    'UPDATE {0} SET {1} WHERE id=?'.format(
+                        table, ','.join(key + '=?' for key in keys)
+                    ),
+                    subvals,
+                )
+
+            # Modified/added flexible attributes.
+            for flex_table, subvals in flex_updates.items():
+                tx.mutate_many(
+                    'INSERT INTO {0} '
+                    '(entity_id, key, value) '
+                    'VALUES (?, ?, ?);'.format(flex_table),
+                    subvals,
+                )
+
+            # Deleted flexible attributes.
+            for flex_table, subvals in flex_deletes.items():
+                tx.mutate_many(
+                    'DELETE FROM {0} '
+                    'WHERE entity_id=? AND key=?'.format(flex_table),
+                    subvals,
+                )
+
     # Querying.
 
-    def _fetch(self, model_cls, query=None, sort=None):
-        """Fetch the objects of type `model_cls` matching the given
-        query. The query may be given as a string, string sequence, a
-        Query object, or None (to fetch everything). `sort` is an
-        `Sort` object.
+    def _plan(self, model_cls, query=None, sort=None):
+        """Build the `QueryPlan` for fetching the objects of type
+        `model_cls` matching the given query, a Query object or None (to
+        fetch everything), in the order given by `sort`, a `Sort`
+        object or None.
         """
         query = query or TrueQuery()  # A null query.
         sort = sort or NullSort()  # Unsorted.
-        where, subvals = query.clause()
-        order_by = sort.order_clause()
-
-        sql = ("SELECT * FROM {0} WHERE {1} {2}").format(
-            model_cls._table,
-            where or '1',
-            "ORDER BY {0}".format(order_by) if order_by else '',
-        )
+        if model_cls._table in self._fts_tables:
+            # Answer substring searches from the full-text index.
+            fts_table, fields = self._fts_tables[model_cls._table]
+            query = FullTextQuery.rewrite(query, fts_table, fields)
+        return QueryPlan(self, model_cls, query, sort)
+
+    def _fetch(self, model_cls, query=None, sort=None, fields=None,
+               limit=None, offset=None, after=None):
+        """Fetch the objects of type `model_cls` matching the given
+        query. The query may be given as a string, string sequence, a
+        Query object, or None (to fetch everything). `sort` is an
+        `Sort` object. If `fields` is a list of field names, only those
+        fields are fetched up front; the objects load the others when
+        they are first accessed.
 
-        # Fetch flexible attributes for items matching the main query.
-        # Doing the per-item filtering in python is faster than issuing
-        # one query per item to sqlite.
-        flex_sql = ("""
-            SELECT * FROM {0} WHERE entity_id IN
-                (SELECT id FROM {1} WHERE {2});
-            """.format(
-                model_cls._flex_table,
-                model_cls._table,
-                where or '1',
-            )
+        `limit`, `offset` and `after` select a page of the results: see
+        `QueryPlan.results`.
+        """
+        return self._plan(model_cls, query, sort).results(
+            fields, limit, offset, after
         )
 
-        with self.transaction() as tx:
-            rows = tx.query(sql, subvals)
-            flex_rows = tx.query(flex_sql, subvals)
-
-        return Results(
-            model_cls, rows, self, flex_rows,
-            None if where else query,  # Slow query component.
-            sort if sort.is_slow() else None,  # Slow sort component.
+    def _aggregate(self, model_cls, query=None, sums=(), distinct=(),
+                   group_by=None, order_by=None):
+        """Compute statistics over the objects of type `model_cls`
+        matching the given query (see `QueryPlan.aggregate`).
+        """
+        return self._plan(model_cls, query).aggregate(
+            sums, distinct, group_by, order_by
         )
 
     def _get(self, model_cls, id):
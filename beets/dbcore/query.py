@@ -17,7 +17,10 @@
 """
 from __future__ import division, absolute_import, print_function
 
+import copy
 import re
+import threading
+from collections import OrderedDict
 from operator import mul
 from beets import util
 from datetime import datetime, timedelta
@@ -99,6 +102,11 @@ class FieldQuery(Query):
     same matching functionality in SQLite.
     """
 
+    flex_source = None
+    """For a query on a flexible attribute, the `(table, flex_table,
+    field_type)` triple set by `use_flex_table`.
+    """
+
     def __init__(self, field, pattern, fast=True):
         self.field = field
         self.pattern = pattern
@@ -110,10 +118,67 @@ class FieldQuery(Query):
     def clause(self):
         if self.fast:
             return self.col_clause()
+        elif self.flex_source:
+            # Matching a flexattr via its attribute table.
+            return self.flex_clause()
         else:
-            # Matching a flexattr. This is a slow query.
+            # Matching a flexattr or computed field. This is a slow query.
+            return None, ()
+
+    def use_flex_table(self, table, flex_table, field_type=None):
+        """Evaluate this (non-fast) query in SQL by looking the field up
+        as a flexible attribute in `flex_table`, whose `entity_id`
+        column refers to the `id` of rows in `table`. If the attribute
+        has a declared `Type`, it is passed as `field_type` and its
+        `sql_cast` converts the stored text before comparing.
+        """
+        self.flex_source = (table, flex_table, field_type)
+
+    def flex_clause(self):
+        """Generate an SQLite expression that applies `col_clause` to
+        the flexible attribute's value, converted by the SQL cast of its
+        type. Objects without the attribute match exactly when the query
+        matches a missing value in Python. Return (None, ()) if the
+        query has no SQL implementation, or if it is a string query on
+        an attribute whose type converts the stored text.
+        """
+        table, flex_table, field_type = self.flex_source
+        value = u'{0}.value'.format(flex_table)
+        if field_type is not None:
+            cast = field_type.sql_cast(value)
+            if cast is None:
+                return None, ()
+            if cast != value and isinstance(self, StringFieldQuery):
+                # String queries match the text of the converted value
+                # in Python, which SQL cannot reproduce (the stored
+                # text "1e3" is the Integer 0, for example).
+                return None, ()
+            value = cast
+
+        # Build the same clause against the value column.
+        value_query = copy.copy(self)
+        value_query.field = value
+        clause, subvals = value_query.col_clause()
+        if not clause:
             return None, ()
 
+        # Select the matching entities through the attribute table's
+        # (key, value) index.
+        entities = (u'{1}.id IN (SELECT {0}.entity_id FROM {0} '
+                    u'WHERE {0}.key = ?{{0}})').format(flex_table, table)
+        clause = entities.format(u' AND ({0})'.format(clause))
+        subvals = [self.field] + list(subvals)
+
+        try:
+            match_missing = self.match({})
+        except (AttributeError, KeyError, TypeError, ValueError):
+            # This query cannot tell us what to do with a missing value.
+            return None, ()
+        if match_missing:
+            clause = u'NOT {0} OR {1}'.format(entities.format(u''), clause)
+            subvals = [self.field] + subvals
+        return clause, subvals
+
     @classmethod
     def value_match(cls, pattern, value):
         """Determine whether the value matches the pattern. Both
@@ -220,6 +285,12 @@ class RegexpQuery(StringFieldQuery):
                                                  u"a regular expression",
                                                  format(exc))
 
+    # Compiled patterns for the SQL REGEXP function, most recently used
+    # last, and the lock protecting them across connection threads.
+    _compiled = OrderedDict()
+    _compiled_lock = threading.Lock()
+    _compiled_size = 128
+
     @staticmethod
     def _normalize(s):
         """Normalize a Unicode string's representation (used on both
@@ -231,6 +302,25 @@ class RegexpQuery(StringFieldQuery):
     def string_match(cls, pattern, value):
         return pattern.search(cls._normalize(value)) is not None
 
+    def col_clause(self):
+        return u'{0} REGEXP ?'.format(self.field), [self.pattern.pattern]
+
+    @classmethod
+    def sqlite_regexp(cls, pattern, value):
+        """Implement the SQL `value REGEXP pattern` operator in the same
+        way as `value_match`. Compiled patterns are kept in a small LRU
+        cache, so each pattern is compiled only once per query rather
+        than once per row.
+        """
+        with cls._compiled_lock:
+            compiled = cls._compiled.pop(pattern, None)
+            if compiled is None:
+                compiled = re.compile(pattern)
+                if len(cls._compiled) >= cls._compiled_size:
+                    cls._compiled.popitem(last=False)
+            cls._compiled[pattern] = compiled
+        return cls.value_match(compiled, value)
+
 
 class BooleanQuery(MatchQuery):
     """Matches a boolean field. Pattern should either be a boolean or a
@@ -316,6 +406,9 @@ class NumericQuery(FieldQuery):
         value = item[self.field]
         if isinstance(value, six.string_types):
             value = self._convert(value)
+        if value is None:
+            # Like NULL in SQL, a null value matches no number.
+            return False
 
         if self.point is not None:
             return value == self.point
@@ -493,6 +586,67 @@ class NotQuery(Query):
         return hash(('not', hash(self.subquery)))
 
 
+class FullTextQuery(Query):
+    """Answer a substring `AnyFieldQuery` from a full-text index.
+
+    `fts_table` is an SQLite FTS5 table using the trigram tokenizer
+    whose rowids are the ids of the queried table and whose columns
+    include all of the subquery's fields. Patterns shorter than a
+    trigram cannot be looked up in the index and fall back to the
+    subquery's own clause.
+    """
+
+    def __init__(self, subquery, fts_table):
+        self.subquery = subquery
+        self.fts_table = fts_table
+
+    def clause(self):
+        pattern = self.subquery.pattern
+        if len(pattern) < 3:
+            return self.subquery.clause()
+        clause = u'id IN (SELECT rowid FROM {0} WHERE {0} MATCH ?)'.format(
+            self.fts_table
+        )
+        # Quote the pattern as a single FTS5 string.
+        return clause, [u'"{0}"'.format(pattern.replace(u'"', u'""'))]
+
+    def match(self, item):
+        return self.subquery.match(item)
+
+    def __repr__(self):
+        return "{0.__class__.__name__}({0.subquery!r}, {0.fts_table!r})" \
+            .format(self)
+
+    def __eq__(self, other):
+        return super(FullTextQuery, self).__eq__(other) and \
+            self.subquery == other.subquery and \
+            self.fts_table == other.fts_table
+
+    def __hash__(self):
+        return hash(('fts', hash(self.subquery)))
+
+    @classmethod
+    def rewrite(cls, query, fts_table, fields):
+        """Return `query` with every `AnyFieldQuery` of substrings over
+        some of `fields` replaced by a `FullTextQuery` on `fts_table`.
+        Parts of the query that do not change are shared, not copied.
+        """
+        if isinstance(query, AnyFieldQuery):
+            if query.query_class is SubstringQuery and \
+                    set(query.fields).issubset(fields):
+                return cls(query, fts_table)
+        elif isinstance(query, (AndQuery, OrQuery)):
+            subqueries = [cls.rewrite(q, fts_table, fields)
+                          for q in query.subqueries]
+            if any(a is not b for a, b in zip(subqueries, query.subqueries)):
+                return type(query)(subqueries)
+        elif isinstance(query, NotQuery):
+            subquery = cls.rewrite(query.subquery, fts_table, fields)
+            if subquery is not query.subquery:
+                return NotQuery(subquery)
+        return query
+
+
 class TrueQuery(Query):
     """A query that always matches."""
 
@@ -771,6 +925,14 @@ class Sort(object):
         """
         return None
 
+    def order_terms(self):
+        """Get the list of `(expression, ascending)` pairs that the SQL
+        fragment orders by, where `expression` is an SQL expression and
+        `ascending` a boolean, or None if the sort is not (completely)
+        performed in SQL. Keyset pagination compares these expressions.
+        """
+        return None
+
     def sort(self, items):
         """Sort the list of objects and return a list.
         """
@@ -824,6 +986,15 @@ class MultipleSort(Sort):
 
         return ", ".join(order_strings)
 
+    def order_terms(self):
+        terms = []
+        for sort in self.sorts:
+            sort_terms = sort.order_terms()
+            if sort_terms is None:
+                return None
+            terms += sort_terms
+        return terms
+
     def is_slow(self):
         for sort in self.sorts:
             if sort.is_slow():
@@ -895,35 +1066,94 @@ class FieldSort(Sort):
             self.field == other.field and \
             self.ascending == other.ascending
 
+    def _order_expr(self):
+        """Get the SQL expression to order by, or None if the sort is
+        slow.
+        """
+        return None
+
+    def _order_by(self, expr):
+        """Build an ORDER BY term for the SQL expression `expr`.
+        """
+        order = "ASC" if self.ascending else "DESC"
+        return "{0} {1}".format(expr, order)
+
+    def order_clause(self):
+        expr = self._order_expr()
+        if expr is None:
+            return None
+        return self._order_by(expr)
+
+    def order_terms(self):
+        expr = self._order_expr()
+        if expr is None:
+            return None
+        return [(expr, self.ascending)]
+
 
 class FixedFieldSort(FieldSort):
     """Sort object to sort on a fixed field.
     """
 
-    def order_clause(self):
-        order = "ASC" if self.ascending else "DESC"
+    def _order_expr(self):
         if self.case_insensitive:
-            field = '(CASE ' \
-                    'WHEN TYPEOF({0})="text" THEN LOWER({0}) ' \
-                    'WHEN TYPEOF({0})="blob" THEN LOWER({0}) ' \
-                    'ELSE {0} END)'.format(self.field)
+            return '(CASE ' \
+                   'WHEN TYPEOF({0})="text" THEN LOWER({0}) ' \
+                   'WHEN TYPEOF({0})="blob" THEN LOWER({0}) ' \
+                   'ELSE {0} END)'.format(self.field)
         else:
-            field = self.field
-        return "{0} {1}".format(field, order)
+            return self.field
 
 
 class SlowFieldSort(FieldSort):
     """A sort criterion by some model field other than a fixed field:
-    i.e., a computed or flexible field.
+    i.e., a computed or flexible field. Sorts on flexible attributes
+    are performed in SQL once `use_flex_table` has been called.
     """
 
+    flex_source = None
+    """The `(table, flex_table, field_type)` triple set by
+    `use_flex_table`.
+    """
+
+    def use_flex_table(self, table, flex_table, field_type=None):
+        """Sort by the field as a flexible attribute in `flex_table`,
+        whose `entity_id` column refers to the `id` of rows in `table`.
+        Values of an attribute with a `Type` (`field_type`) are ordered
+        by its `sql_cast`, so numbers sort as numbers. Objects without
+        the attribute come first in ascending order, before any value.
+        """
+        self.flex_source = (table, flex_table, field_type)
+
+    def _order_expr(self):
+        if not self.flex_source:
+            return None
+        table, flex_table, field_type = self.flex_source
+        value = (u"(SELECT {0}.value FROM {0} WHERE {0}.entity_id = {1}.id "
+                 u"AND {0}.key = '{2}')").format(flex_table, table,
+                                                 self.field.replace("'", "''"))
+        cast = field_type.sql_cast(value) if field_type else value
+        if cast is None:
+            return None
+        if cast != value:
+            # Keep objects without the attribute first rather than
+            # sorting them as the type's null (like 0).
+            value = u'(CASE WHEN {0} IS NULL THEN NULL ELSE {1} END)' \
+                .format(value, cast)
+        elif self.case_insensitive:
+            value = u'LOWER({0})'.format(value)
+        return value
+
     def is_slow(self):
-        return True
+        return self.flex_source is None
 
 
 class NullSort(Sort):
     """No sorting. Leave results unsorted."""
 
+    def order_terms(self):
+        return []
+
     def sort(self, items):
         return items
 
@@ -148,6 +148,10 @@ def construct_query_part(model_cls, prefixes, query_part):
     elif issubclass(query_class, query.FieldQuery):
         key = key.lower()
         out_query = query_class(key.lower(), pattern, key in model_cls._fields)
+        if not out_query.fast and key not in model_cls._getters():
+            # A flexible attribute: match it in the attribute table.
+            out_query.use_flex_table(model_cls._table, model_cls._flex_table,
+                                     model_cls._types.get(key))
 
     # Non-field (named) query.
     else:
@@ -196,6 +200,10 @@ def construct_sort_part(model_cls, part, case_insensitive=True):
     else:
         # Flexible or computed.
         sort = query.SlowFieldSort(field, is_ascending, case_insensitive)
+        if field not in model_cls._getters():
+            # A flexible attribute: sort on the attribute table.
+            sort.use_flex_table(model_cls._table, model_cls._flex_table,
+                                model_cls._types.get(field))
     return sort
 
 
@@ -117,6 +117,16 @@ class Type(object):
         """
         return model_value
 
+    def sql_cast(self, expr):
+        """Build an SQL expression that converts `expr`, the text stored
+        for a flexible attribute of this type, into the value that
+        queries and sorts should compare, like `from_sql` does in
+        Python. The base implementation uses the text as it is. Return
+        None if the conversion cannot be expressed in SQL; queries,
+        sorts and sums on the field are then evaluated in Python.
+        """
+        return expr
+
 
 # Reusable types.
 
@@ -139,6 +149,17 @@ class Integer(Type):
         except TypeError:
             return self.null
 
+    def sql_cast(self, expr):
+        # Mirror `parse`, which `from_sql` uses for the stored text:
+        # only integer literals convert, anything else (including
+        # "2.5") is null. Rounding in SQL would disagree with Python.
+        text = u'TRIM({0})'.format(expr)
+        null = u'NULL' if self.null is None else six.text_type(self.null)
+        return (u"(CASE WHEN {0} GLOB '[0-9]*' AND {0} NOT GLOB '*[^0-9]*' "
+                u"OR {0} GLOB '[+-][0-9]*' "
+                u"AND SUBSTR({0}, 2) NOT GLOB '*[^0-9]*' "
+                u"THEN CAST({0} AS INTEGER) ELSE {1} END)").format(text, null)
+
 
 class PaddedInt(Integer):
     """An integer field that is formatted with a given number of digits,
@@ -194,6 +215,27 @@ class Float(Type):
     def format(self, value):
         return u'{0:.{1}f}'.format(value or 0, self.digits)
 
+    def sql_cast(self, expr):
+        # Mirror `parse` for decimal literals with an optional exponent;
+        # other text (including "inf", which `float` accepts) is null
+        # rather than the numeric prefix `CAST` would read.
+        text = u'LOWER(TRIM({0}))'.format(expr)
+        exp = u'INSTR({0}, \'e\')'.format(text)
+        mantissa = u'(CASE WHEN {1} THEN SUBSTR({0}, 1, {1} - 1) ' \
+                   u'ELSE {0} END)'.format(text, exp)
+        exponent = u'SUBSTR({0}, {1} + 1)'.format(text, exp)
+        null = u'NULL' if self.null is None else repr(float(self.null))
+        return (u"(CASE WHEN LTRIM({0}, '+-') GLOB '*[0-9]*' "
+                u"AND LTRIM({0}, '+-') NOT GLOB '*[^0-9.]*' "
+                u"AND LTRIM({0}, '+-') NOT GLOB '*.*.*' "
+                u"AND LENGTH({0}) - LENGTH(LTRIM({0}, '+-')) <= 1 "
+                u"AND ({1} = 0 OR {2} GLOB '[0-9]*' "
+                u"AND {2} NOT GLOB '*[^0-9]*' "
+                u"OR {2} GLOB '[+-][0-9]*' "
+                u"AND SUBSTR({2}, 2) NOT GLOB '*[^0-9]*') "
+                u"THEN CAST({3} AS REAL) ELSE {4} END)").format(
+                    mantissa, exp, exponent, text, null)
+
 
 class NullFloat(Float):
     """Same as `Float`, but does not normalize `None` to `0.0`.
@@ -221,6 +263,12 @@ class Boolean(Type):
     def parse(self, string):
         return str2bool(string)
 
+    def sql_cast(self, expr):
+        # Mirror `str2bool`.
+        return (u"(CASE WHEN {0} IS NULL THEN NULL "
+                u"WHEN LOWER({0}) IN ('yes', '1', 'true', 't', 'y') THEN 1 "
+                u"ELSE 0 END)").format(expr)
+
 
 # Shared instances of common types.
 DEFAULT = Default()
@@ -23,12 +23,14 @@ import os
 import re
 import pickle
 import itertools
+import json
 from collections import defaultdict
 from tempfile import mkdtemp
 from bisect import insort, bisect_left
 from contextlib import contextmanager
 import shutil
 import time
+import multiprocessing
 
 from beets import logging
 from beets import autotag
@@ -286,12 +288,14 @@ class ImportSession(object):
         """
         self.logger.info(u'import started {0}', time.asctime())
         self.set_config(config['import'])
+        processes = self.scoring_processes()
 
         # Set up the pipeline.
         if self.query is None:
             stages = [read_tasks(self)]
         else:
             stages = [query_tasks(self)]
+        names = None
 
         # In pretend mode, just log what would otherwise be imported.
         if self.config['pretend']:
@@ -308,22 +312,46 @@ class ImportSession(object):
             # also add the music to the library database, so later
             # stages need to read and write data from there.
             if self.config['autotag']:
-                stages += [lookup_candidates(self), user_query(self)]
+                if processes:
+                    # Compare the candidates with the items in worker
+                    # processes.
+                    stages += self._ordered_stages([(
+                        'lookup_candidates',
+                        lambda: search_candidates(self),
+                    )])
+                    stages += [pipeline.ordered(
+                        [score_candidates() for _ in range(processes)],
+                        QUEUE_SIZE,
+                    )]
+                else:
+                    stages += self._ordered_stages([(
+                        'lookup_candidates',
+                        lambda: lookup_candidates(self),
+                    )])
+                stages += [user_query(self)]
             else:
                 stages += [import_asis(self)]
 
-            # Plugin stages.
-            for stage_func in plugins.early_import_stages():
-                stages.append(plugin_stage(self, stage_func))
-            for stage_func in plugins.import_stages():
-                stages.append(plugin_stage(self, stage_func))
+            # Plugin stages, named after their plugins in the pipeline
+            # statistics.
+            stage_funcs = plugins.early_import_stages() + \
+                plugins.import_stages()
+            names = [None] * len(stages)
+            names += [_plugin_name(stage_func) for stage_func in stage_funcs]
+            stages += self._ordered_stages([(
+                _plugin_name(stage_func),
+                lambda stage_func=stage_func: plugin_stage(self, stage_func),
+            ) for stage_func in stage_funcs])
 
             stages += [manipulate_files(self)]
 
-        pl = pipeline.Pipeline(stages)
+        pl = pipeline.Pipeline(stages, names)
 
         # Run the pipeline.
         plugins.send('import_begin', session=self)
+        if processes:
+            pipeline.start_process_pool(processes, _init_scoring_process,
+                                        (config.flatten(),))
         try:
             if config['threaded']:
                 pl.run_parallel(QUEUE_SIZE)
@@ -332,6 +360,88 @@ class ImportSession(object):
         except ImportAbort:
             # User aborted operation. Silently stop.
             pass
+        finally:
+            if processes:
+                pipeline.stop_process_pool()
+            self.report_pipeline(pl)
+
+    def report_pipeline(self, pl):
+        """Write the statistics of the finished pipeline `pl` to the
+        import log and, if the `pipeline_report` option is set, to that
+        file as JSON.
+        """
+        report = pl.report()
+        if report['elapsed'] is None:
+            return
+        self.logger.info(u'import pipeline finished in {0:.2f}s',
+                         report['elapsed'])
+        for stage in report['stages']:
+            self.logger.info(
+                u'stage {0[name]} ({0[workers]} workers): {0[messages]} '
+                u'messages, busy {0[busy]:.2f}s, waiting for input '
+                u'{0[wait_in]:.2f}s and output {0[wait_out]:.2f}s, '
+                u'queue up to {0[max_queue]}',
+                stage
+            )
+
+        path = self.config['pipeline_report'].get()
+        if path:
+            path = normpath(path)
+            try:
+                with open(syspath(path), 'w') as f:
+                    json.dump(report, f, indent=2)
+            except (IOError, OSError) as exc:
+                self.logger.warning(u'could not write pipeline report to '
+                                    u'{0}: {1}', displayable_path(path), exc)
+
+    def stage_workers(self, name):
+        """Get the number of parallel workers for the pipeline stage
+        called `name`: ``lookup_candidates`` or the name of the plugin
+        that provides the stage. The `workers` option is either a
+        number for all such stages or a mapping from stage names to
+        numbers. Stages run by a single worker when the pipeline is not
+        threaded.
+        """
+        if not config['threaded']:
+            return 1
+        workers = self.config['workers']
+        value = workers.get()
+        if isinstance(value, dict):
+            if name not in value:
+                return 1
+            workers = workers[name]
+        return max(workers.get(int), 1)
+
+    def scoring_processes(self):
+        """Get the number of worker processes that compare album
+        candidates with the items, according to the `processes` option,
+        or 0 if the comparison happens in the candidate lookup. Worker
+        processes are only used when the pipeline is threaded.
+        """
+        if not config['threaded'] or self.config['pretend'] or \
+                not self.config['autotag']:
+            return 0
+        processes = self.config['processes'].get()
+        if processes == 'auto':
+            return multiprocessing.cpu_count()
+        return max(self.config['processes'].get(int), 0)
+
+    def _ordered_stages(self, stages):
+        """Build the pipeline stages for the given sequence of
+        `(name, factory)` pairs, where `factory` makes the stage's
+        coroutine. Stages with more than one worker get one coroutine
+        per worker and pass on the tasks in their original order.
+        """
+        out = []
+        for name, factory in stages:
+            workers = self.stage_workers(name)
+            if workers > 1:
+                out.append(pipeline.ordered(
+                    [factory() for _ in range(workers)], QUEUE_SIZE
+                ))
+            else:
+                out.append(factory())
+        return out
 
     # Incremental and resumed imports
 
@@ -463,6 +573,9 @@ class ImportTask(BaseImportTask):
         self.cur_album = None
         self.cur_artist = None
         self.candidates = []
+        self.candidate_infos = None  # Candidates not yet scored.
+        self._id_only = False  # `candidate_infos` is the ID match.
+        self._id_proposal = None  # Scored ID match awaiting the others.
         self.rec = None
         self.should_remove_duplicates = False
         self.should_merge_duplicates = False
@@ -632,15 +745,76 @@ class ImportTask(BaseImportTask):
             tasks = [t for inner in tasks for t in inner]
         return tasks
 
-    def lookup_candidates(self):
+    def lookup_candidates(self, score=True):
         """Retrieve and store candidates for this album. User-specified
         candidate IDs are stored in self.search_ids: if present, the
         initial lookup is restricted to only those IDs.
+
+        If `score` is false, the candidates are only searched for and
+        kept in `candidate_infos`; `score_candidates` must then be
+        called to compare them with the items. An album found by the
+        items' own ID is kept there alone at first, since a strong
+        match makes the search for others unnecessary.
+        """
+        if score:
+            artist, album, prop = autotag.tag_album(
+                self.items, search_ids=self.search_ids
+            )
+            self.cur_artist = artist
+            self.cur_album = album
+            self.candidates = prop.candidates
+            self.rec = prop.recommendation
+            return
+
+        id_info = None
+        if not self.search_ids:
+            id_info = autotag.match_by_id(self.items)
+        if id_info:
+            self.candidate_infos = [id_info]
+            self._id_only = True
+        else:
+            self._search_candidates()
+
+    def _search_candidates(self, id_proposal=None):
+        """Search for the candidates that still need to be scored,
+        besides those of the scored ID match `id_proposal`, if any.
         """
-        artist, album, prop = \
-            autotag.tag_album(self.items, search_ids=self.search_ids)
+        artist, album, infos = autotag.search_album_candidates(
+            self.items, search_ids=self.search_ids, id_proposal=id_proposal
+        )
         self.cur_artist = artist
         self.cur_album = album
+        self.candidate_infos = infos
+
+    def score_candidates(self, prop=None):
+        """Compare the items with the candidates found by
+        `lookup_candidates` and store the resulting matches and
+        recommendation. A proposal `prop` that was already computed for
+        the items, for instance in a worker process, may be given
+        instead.
+
+        If the candidates were those of the items' own ID and they are
+        not a strong match, the other candidates are searched for and
+        kept in `candidate_infos`: call this again to score them.
+        """
+        if prop is None:
+            prop = autotag.score_album_candidates(self.items,
+                                                  self.candidate_infos)
+        self.candidate_infos = None
+        if self._id_only:
+            self._id_only = False
+            self._search_candidates(prop)
+            if self.candidate_infos:
+                self._id_proposal = prop
+                return
+            self.candidate_infos = None
+        elif self._id_proposal is not None:
+            # Add the ID match to the other candidates.
+            prop = autotag.score_album_candidates(
+                self.items, [],
+                self._id_proposal.candidates + prop.candidates
+            )
+            self._id_proposal = None
         self.candidates = prop.candidates
         self.rec = prop.recommendation
 
@@ -740,7 +914,7 @@ class ImportTask(BaseImportTask):
             if write and (self.apply or self.choice_flag == action.RETAG):
                 item.try_write()
 
-        with session.lib.transaction():
+        with session.lib.transaction(write=True):
             for item in self.imported_items():
                 item.store()
 
@@ -750,7 +924,7 @@ class ImportTask(BaseImportTask):
         """Add the items as an album to the library and remove replaced items.
         """
         self.align_album_level_fields()
-        with lib.transaction():
+        with lib.transaction(write=True):
             self.record_replaced(lib)
             self.remove_replaced(lib)
             self.album = lib.add_album(self.imported_items())
@@ -799,8 +973,11 @@ class ImportTask(BaseImportTask):
                     displayable_path(self.album.path)
                 )
 
+        reimported_items = []
         for item in self.imported_items():
             dup_items = self.replaced_items[item]
+            if dup_items:
+                reimported_items.append(item)
             for dup_item in dup_items:
                 if dup_item.added and dup_item.added != item.added:
                     item.added = dup_item.added
@@ -819,7 +996,7 @@ class ImportTask(BaseImportTask):
                     dup_item.id,
                     displayable_path(item.path)
                 )
-                item.store()
+        lib.store_many(reimported_items)
 
     def remove_replaced(self, lib):
         """Removes all the items from the library that have the same
@@ -890,7 +1067,9 @@ class SingletonImportTask(ImportTask):
         for item in self.imported_items():
             plugins.send('item_imported', lib=lib, item=item)
 
-    def lookup_candidates(self):
+    def lookup_candidates(self, score=True):
+        # Singletons have few candidates, so they are always scored
+        # right away.
         prop = autotag.tag_item(self.item, search_ids=self.search_ids)
         self.candidates = prop.candidates
         self.rec = prop.recommendation
@@ -915,10 +1094,10 @@ class SingletonImportTask(ImportTask):
     duplicate_items = find_duplicates
 
     def add(self, lib):
-        with lib.transaction():
+        with lib.transaction(write=True):
             self.record_replaced(lib)
             self.remove_replaced(lib)
-            lib.add(self.item)
+            lib.add_many([self.item])
             self.reimport_metadata(lib)
 
     def infer_album_fields(self):
@@ -1268,6 +1447,13 @@ def _freshen_items(items):
         item.album_id = None
 
 
+def _plugin_name(stage_func):
+    """Get the name of the plugin providing the import stage function
+    `stage_func`, which is the last component of its module name.
+    """
+    return stage_func.__module__.rsplit('.', 1)[-1]
+
+
 def _extend_pipeline(tasks, *stages):
     # Return pipeline extension for stages with list of tasks
     if type(tasks) == list:
@@ -1331,6 +1517,17 @@ def query_tasks(session):
                 yield task
 
 
+def _start_lookup(session, task):
+    """Announce the candidate lookup for `task` and set its search IDs.
+    """
+    plugins.send('import_task_start', session=session, task=task)
+    log.debug(u'Looking up: {0}', displayable_path(task.paths))
+
+    # Restrict the initial lookup to IDs specified by the user via the -m
+    # option. Currently all the IDs are passed onto the tasks directly.
+    task.search_ids = session.config['search_ids'].as_str_seq()
+
+
 @pipeline.mutator_stage
 def lookup_candidates(session, task):
     """A coroutine for performing the initial MusicBrainz lookup for an
@@ -1343,14 +1540,70 @@ def lookup_candidates(session, task):
         # abstraction.
         return
 
-    plugins.send('import_task_start', session=session, task=task)
-    log.debug(u'Looking up: {0}', displayable_path(task.paths))
+    _start_lookup(session, task)
+    task.lookup_candidates()
 
-    # Restrict the initial lookup to IDs specified by the user via the -m
-    # option. Currently all the IDs are passed onto the tasks directly.
-    task.search_ids = session.config['search_ids'].as_str_seq()
 
-    task.lookup_candidates()
+@pipeline.mutator_stage
+def search_candidates(session, task):
+    """Like `lookup_candidates`, but leave the comparison of album
+    candidates with the items to `score_candidates`.
+    """
+    if task.skip:
+        return
+
+    _start_lookup(session, task)
+    task.lookup_candidates(score=False)
+
+
+@pipeline.mutator_stage
+def score_candidates(task):
+    """A pipeline stage that compares the items of album tasks with the
+    candidates found by `search_candidates` in the pipeline's worker
+    processes. Only the items and candidates are sent to the workers;
+    the task itself stays in this process. If the album found by the
+    items' own ID is not a strong match, the other candidates are
+    searched for here and scored in turn.
+    """
+    while task.candidate_infos is not None:
+        prop = pipeline.run_in_process(
+            _score_album, (task.items, task.candidate_infos)
+        )
+        task.score_candidates(_with_items(prop, task.items))
+
+
+def _score_album(items, infos):
+    """Compare `items` with the album candidates `infos` in a worker
+    process. The worker only has copies of the items, so the matches
+    in the returned proposal refer to items by their index in `items`.
+    """
+    prop = autotag.score_album_candidates(items, infos)
+    indices = dict((id(item), i) for i, item in enumerate(items))
+    return prop._replace(candidates=[match._replace(
+        mapping=dict((indices[id(item)], track)
+                     for item, track in match.mapping.items()),
+        extra_items=[indices[id(item)] for item in match.extra_items],
+    ) for match in prop.candidates])
+
+
+def _with_items(prop, items):
+    """Get the proposal `prop` made by `_score_album` with the indices
+    in its matches replaced by the corresponding `items`.
+    """
+    return prop._replace(candidates=[match._replace(
+        mapping=dict((items[i], track) for i, track in match.mapping.items()),
+        extra_items=[items[i] for i in match.extra_items],
+    ) for match in prop.candidates])
+
+
+def _init_scoring_process(state):
+    """Set up a worker process for `score_candidates` with the flattened
+    configuration `state` of the main process. Plugins take part in
+    scoring, so they are loaded if the worker did not inherit them.
+    """
+    config.set(state)
+    if not plugins.find_plugins():
+        plugins.load_plugins(config['plugins'].as_str_seq())
 
 
 @pipeline.stage
@@ -18,6 +18,7 @@
 from __future__ import division, absolute_import, print_function
 
 import os
+import sqlite3
 import sys
 import unicodedata
 import time
@@ -144,6 +145,10 @@ class DateType(types.Float):
             except ValueError:
                 return self.null
 
+    def sql_cast(self, expr):
+        # Formatted dates have no SQL equivalent.
+        return None
+
 
 class PathType(types.Type):
     """A dbcore type for filesystem paths. These are represented as
@@ -245,6 +250,10 @@ class DurationType(types.Float):
             except ValueError:
                 return self.null
 
+    def sql_cast(self, expr):
+        # M:SS durations have no SQL equivalent.
+        return None
+
 
 # Library-specific sort types.
 
@@ -257,13 +266,19 @@ class SmartArtistSort(dbcore.query.Sort):
         self.ascending = ascending
         self.case_insensitive = case_insensitive
 
-    def order_clause(self):
-        order = "ASC" if self.ascending else "DESC"
+    def _order_expr(self):
         field = 'albumartist' if self.album else 'artist'
-        collate = 'COLLATE NOCASE' if self.case_insensitive else ''
+        collate = ' COLLATE NOCASE' if self.case_insensitive else ''
         return ('(CASE {0}_sort WHEN NULL THEN {0} '
                 'WHEN "" THEN {0} '
-                'ELSE {0}_sort END) {1} {2}').format(field, collate, order)
+                'ELSE {0}_sort END){1}').format(field, collate)
+
+    def order_clause(self):
+        order = "ASC" if self.ascending else "DESC"
+        return '{0} {1}'.format(self._order_expr(), order)
+
+    def order_terms(self):
+        return [(self._order_expr(), self.ascending)]
 
     def sort(self, objs):
         if self.album:
@@ -334,6 +349,8 @@ class LibModel(dbcore.Model):
     """Shared concrete functionality for Items and Albums.
     """
 
+    __slots__ = ()
+
     _format_config_key = None
     """Config key that specifies how an instance should be formatted.
     """
@@ -361,6 +378,22 @@ class LibModel(dbcore.Model):
         assert isinstance(spec, six.text_type)
         return self.evaluate_template(spec)
 
+    @classmethod
+    def format_fields(cls, spec=u''):
+        """Get a list of the fields that formatting an object with `spec`
+        (see `__format__`) refers to. This is suitable as the `fields`
+        projection of `Library.items` and `Library.albums`. Return None,
+        for fetching all fields, if `spec` uses a computed field, which
+        may depend on any other field.
+        """
+        if not spec:
+            spec = beets.config[cls._format_config_key].as_str()
+        variables = template(spec).variables()
+        getters = cls._getters()
+        if any(variable in getters for variable in variables):
+            return None
+        return sorted(variables)
+
     def __str__(self):
         return format(self)
 
@@ -402,7 +435,7 @@ class FormattedItemMapping(dbcore.db.FormattedMapping):
         """
         if self.for_path and key in self.album_keys:
             return self._get_formatted(self.album, key)
-        elif key in self.model_keys:
+        elif key in self.model:
             return self._get_formatted(self.model, key)
         elif key in self.album_keys:
             return self._get_formatted(self.album, key)
@@ -432,6 +465,7 @@ class FormattedItemMapping(dbcore.db.FormattedMapping):
 
 
 class Item(LibModel):
+    __slots__ = ()
     _table = 'items'
     _flex_table = 'item_attributes'
     _fields = {
@@ -520,6 +554,12 @@ class Item(LibModel):
         'data_source': types.STRING,
     }
 
+    _indexes = {
+        'album_id': ('album_id',),
+        'path': ('path',),
+        'mb_trackid': ('mb_trackid',),
+    }
+
     _media_fields = set(MediaFile.readable_fields()) \
         .intersection(_fields.keys())
     """Set of item fields that are backed by `MediaFile` fields.
@@ -550,6 +590,20 @@ class Item(LibModel):
         getters['filesize'] = Item.try_filesize  # In bytes.
         return getters
 
+    @classmethod
+    def format_fields(cls, spec=u''):
+        fields = super(Item, cls).format_fields(spec)
+        if fields is None:
+            return None
+        fields = set(fields)
+        if not fields <= set(cls._fields):
+            # Other keys may be looked up on the item's album.
+            fields.add('album_id')
+        if fields & set(['artist', 'albumartist']):
+            # These fall back to one another (see `FormattedItemMapping`).
+            fields.update(['artist', 'albumartist'])
+        return sorted(fields)
+
     @classmethod
     def from_path(cls, path):
         """Creates a new item from the media file at the specified path.
@@ -694,7 +748,7 @@ class Item(LibModel):
             log.error(u"{0}", exc)
             return False
 
-    def try_sync(self, write, move, with_album=True):
+    def try_sync(self, write, move, with_album=True, store=True):
         """Synchronize the item with the database and, possibly, updates its
         tags on disk and its path (by moving the file).
 
@@ -704,8 +758,13 @@ class Item(LibModel):
         library's directory (if any).
 
         Similar to calling :meth:`write`, :meth:`move`, and :meth:`store`
-        (conditionally).
+        (conditionally). If `store` is `False`, neither the item nor its
+        album (whose art may move along with the item) is stored, and
+        you'll have to store them manually (for example, in a batch with
+        :meth:`Library.store_many`). In that case, the album is returned
+        if its art was moved.
         """
+        album = None
         if write:
             self.try_write()
         if move:
@@ -713,8 +772,11 @@ class Item(LibModel):
             if self._db and self._db.directory in util.ancestry(self.path):
                 log.debug(u'moving {0} to synchronize path',
                           util.displayable_path(self.path))
-                self.move(with_album=with_album)
-        self.store()
+                album = self.move(with_album=with_album, store=store)
+        if store:
+            self.store()
+        elif album is not None and album._dirty:
+            return album
 
     # Files themselves.
 
@@ -812,7 +874,9 @@ class Item(LibModel):
         database, so any dirty fields prior to the move() call will be written
         as a side effect.
         If `store` is `False` however, the item won't be stored and you'll
-        have to manually store it after invoking this method.
+        have to manually store it after invoking this method. The same
+        goes for its album, which is returned if the album was given the
+        opportunity to move its art.
         """
         self._check_db()
         dest = self.destination(basedir=basedir)
@@ -827,17 +891,25 @@ class Item(LibModel):
             self.store()
 
         # If this item is in an album, move its art.
+        album = None
         if with_album:
             album = self.get_album()
             if album:
-                album.move_art(operation)
                 if store:
+                    album.move_art(operation)
                     album.store()
+                else:
+                    # The new path isn't in the database yet, so tell
+                    # the album where its items now live.
+                    album.move_art(operation,
+                                   item_dir=os.path.dirname(self.path))
 
         # Prune vacated directory.
         if operation == MoveOperation.MOVE:
             util.prune_dirs(os.path.dirname(old_path), self._db.directory)
 
+        return album
+
     # Templating.
 
     def destination(self, fragment=False, basedir=None, platform=None,
@@ -921,6 +993,7 @@ class Album(LibModel):
     library. Reflects the library's "albums" table, including album
     art.
     """
+    __slots__ = ()
     _table = 'albums'
     _flex_table = 'album_attributes'
     _always_dirty = True
@@ -971,6 +1044,10 @@ class Album(LibModel):
         'data_source': types.STRING,
     }
 
+    _indexes = {
+        'mb_albumid': ('mb_albumid',),
+    }
+
     _sorts = {
         'albumartist': SmartArtistSort,
         'artist': SmartArtistSort,
@@ -1052,12 +1129,14 @@ class Album(LibModel):
             for item in self.items():
                 item.remove(delete, False)
 
-    def move_art(self, operation=MoveOperation.MOVE):
+    def move_art(self, operation=MoveOperation.MOVE, item_dir=None):
         """Move, copy, link or hardlink (depending on `operation`) any
         existing album art so that it remains in the same directory as
         the items.
 
         `operation` should be an instance of `util.MoveOperation`.
+        `item_dir` overrides the items' directory looked up in the
+        database (see :meth:`art_destination`).
         """
         old_art = self.artpath
         if not old_art:
@@ -1069,7 +1148,7 @@ class Album(LibModel):
             self.artpath = None
             return
 
-        new_art = self.art_destination(old_art)
+        new_art = self.art_destination(old_art, item_dir)
         if new_art == old_art:
             return
 
@@ -1216,12 +1295,9 @@ class Album(LibModel):
         will be.
         """
         # Get modified track fields.
-        track_updates = {}
-        for key in self.item_keys:
-            if key in self._dirty:
-                track_updates[key] = self[key]
+        track_updates = self._track_updates()
 
-        with self._db.transaction():
+        with self._db.transaction(write=True):
             super(Album, self).store(fields)
             if track_updates:
                 for item in self.items():
@@ -1229,6 +1305,16 @@ class Album(LibModel):
                         item[key] = value
                     item.store()
 
+    def _track_updates(self):
+        """Get a dictionary of the modified fields that are also set on
+        the album's items (see `item_keys`).
+        """
+        track_updates = {}
+        for key in self.item_keys:
+            if key in self._dirty:
+                track_updates[key] = self[key]
+        return track_updates
+
     def try_sync(self, write, move):
         """Synchronize the album and its items with the database.
         Optionally, also write any new tags into the files and update
@@ -1309,6 +1395,23 @@ def _sqlite_bytelower(bytestring):
     return buffer(bytes(bytestring).lower())  # noqa: F821
 
 
+# SQLite settings that can be tuned in the `database` configuration
+# section. Each one maps the accepted configuration values to the values
+# for the corresponding PRAGMA; `None` indicates an integer setting.
+# YAML reads a bare `off` as a boolean, so `False` is accepted too.
+SQLITE_PRAGMAS = (
+    ('journal_mode', {'delete': 'DELETE', 'truncate': 'TRUNCATE',
+                      'persist': 'PERSIST', 'memory': 'MEMORY',
+                      'wal': 'WAL', 'off': 'OFF', False: 'OFF'}),
+    ('synchronous', {'off': 'OFF', False: 'OFF', 'normal': 'NORMAL',
+                     'full': 'FULL', 'extra': 'EXTRA'}),
+    ('cache_size', None),
+    ('mmap_size', None),
+    ('temp_store', {'default': 'DEFAULT', 'file': 'FILE',
+                    'memory': 'MEMORY'}),
+)
+
+
 # The Library: interface to the database.
 
 class Library(dbcore.Database):
@@ -1322,7 +1425,21 @@ class Library(dbcore.Database):
                                '$artist/$album/$track $title'),),
                  replacements=None):
         timeout = beets.config['timeout'].as_number()
-        super(Library, self).__init__(path, timeout=timeout)
+        self.pragmas = self._configured_pragmas()
+        fts = beets.config['database']['fts'].get(bool)
+        persistent_cache = \
+            beets.config['database']['persistent_query_cache'].get(bool)
+        cached_statements = None
+        if beets.config['database']['cached_statements'].get() is not None:
+            cached_statements = \
+                beets.config['database']['cached_statements'].get(int)
+        super(Library, self).__init__(path, timeout=timeout, fts=fts,
+                                      persistent_cache=persistent_cache,
+                                      cached_statements=cached_statements)
+        if fts and not self._fts_tables:
+            log.warning(u'SQLite {0} has no FTS5 trigram tokenizer; '
+                        u'the full-text index is disabled',
+                        sqlite3.sqlite_version)
 
         self.directory = bytestring_path(normpath(directory))
         self.path_formats = path_formats
@@ -1330,9 +1447,33 @@ class Library(dbcore.Database):
 
         self._memotable = {}  # Used for template substitution performance.
 
+        cache_size = beets.config['database']['query_cache'].get(int)
+        if cache_size > 0:
+            self.query_cache = dbcore.QueryCache(cache_size)
+
+    @staticmethod
+    def _configured_pragmas():
+        """Get a list of `(name, value)` pairs for the SQLite PRAGMAs set
+        in the `database` configuration section. Unset options keep
+        SQLite's defaults.
+        """
+        pragmas = []
+        for name, choices in SQLITE_PRAGMAS:
+            view = beets.config['database'][name]
+            if view.get() is None:
+                continue
+            if choices is None:
+                value = view.get(int)
+            else:
+                value = view.as_choice(choices)
+            pragmas.append((name, value))
+        return pragmas
+
     def _create_connection(self):
         conn = super(Library, self)._create_connection()
         conn.create_function('bytelower', 1, _sqlite_bytelower)
+        for name, value in self.pragmas:
+            conn.execute('PRAGMA {0}={1}'.format(name, value))
         return conn
 
     # Adding objects to the database.
@@ -1361,22 +1502,62 @@ class Library(dbcore.Database):
 
         # Add the album structure and set the items' album_id fields.
         # Store or add the items.
-        with self.transaction():
+        with self.transaction(write=True):
             album.add(self)
             for item in items:
                 item.album_id = album.id
-                if item.id is None:
-                    item.add(self)
-                else:
-                    item.store()
+            self.add_many([item for item in items if item.id is None])
+            self.store_many([item for item in items if item.id is not None])
 
         return album
 
+    def add_many(self, objs):
+        """Add many :class:`Item` or :class:`Album` objects to the library
+        database in a single transaction, batching the SQL statements.
+        Return a list of the objects' new ids.
+        """
+        objs = list(objs)
+        super(Library, self).add_many(objs)
+        self._memotable = {}
+        for obj in objs:
+            plugins.send('database_change', lib=self, model=obj)
+        return [obj.id for obj in objs]
+
+    # Storing objects.
+
+    def store_many(self, objs, fields=None):
+        """Save the pending changes of many :class:`Item` and
+        :class:`Album` objects in a single transaction.
+
+        Like calling `store(fields)` on each object: changes to album
+        fields that are also set on items are propagated to the album's
+        items, and a `database_change` event is sent for each object.
+        """
+        objs = list(objs)
+        track_updates = [(obj, obj._track_updates()) for obj in objs
+                         if isinstance(obj, Album)]
+
+        with self.transaction(write=True):
+            super(Library, self).store_many(objs, fields)
+
+            items = []
+            for album, updates in track_updates:
+                if updates:
+                    for item in album.items():
+                        item.update(updates)
+                        items.append(item)
+            if items:
+                self.store_many(items)
+
+        for obj in objs:
+            plugins.send('database_change', lib=self, model=obj)
+
     # Querying.
 
-    def _fetch(self, model_cls, query, sort=None):
-        """Parse a query and fetch. If a order specification is present
-        in the query string the `sort` argument is ignored.
+    def _plan(self, model_cls, query=None, sort=None):
+        """Parse a query and plan its execution. If a order
+        specification is present in the query string the `sort` argument
+        is ignored.
         """
         # Parse the query, if necessary.
         try:
@@ -1393,7 +1574,7 @@ class Library(dbcore.Database):
         if parsed_sort and not isinstance(parsed_sort, dbcore.query.NullSort):
             sort = parsed_sort
 
-        return super(Library, self)._fetch(
+        return super(Library, self)._plan(
             model_cls, query, sort
         )
 
@@ -1411,15 +1592,54 @@ class Library(dbcore.Database):
         return dbcore.sort_from_strings(
             Item, beets.config['sort_item'].as_str_seq())
 
-    def albums(self, query=None, sort=None):
-        """Get :class:`Album` objects matching the query.
+    def albums(self, query=None, sort=None, fields=None,
+               limit=None, offset=None, after=None):
+        """Get :class:`Album` objects matching the query. If `fields` is
+        a list of field names, only those fields are fetched up front.
+
+        To get a page of the albums, pass the maximum number of albums
+        as `limit`, and the id of the last album on the previous page as
+        `after` (or the number of albums to skip as `offset`).
         """
-        return self._fetch(Album, query, sort or self.get_default_album_sort())
+        return self._fetch(Album, query, sort or self.get_default_album_sort(),
+                           fields, limit, offset, after)
 
-    def items(self, query=None, sort=None):
-        """Get :class:`Item` objects matching the query.
+    def items(self, query=None, sort=None, fields=None,
+              limit=None, offset=None, after=None):
+        """Get :class:`Item` objects matching the query. If `fields` is
+        a list of field names, only those fields are fetched up front.
+
+        To get a page of the items, pass the maximum number of items as
+        `limit`, and the id of the last item on the previous page as
+        `after` (or the number of items to skip as `offset`).
+        """
+        return self._fetch(Item, query, sort or self.get_default_item_sort(),
+                           fields, limit, offset, after)
+
+    def aggregate(self, query=None, sums=(), distinct=(), group_by=None,
+                  order_by=None, album=False):
+        """Compute statistics over the :class:`Item` objects (or the
+        :class:`Album` objects if `album` is true) matching the query:
+        their `count`, the totals of the fields in `sums`, and the numbers
+        of distinct values of the fields in `distinct`. If `group_by` is
+        a field, get a list of `(value, stats)` pairs for its values,
+        ordered by value or by the smallest value of `order_by`. See
+        :meth:`dbcore.db.QueryPlan.aggregate`.
         """
-        return self._fetch(Item, query, sort or self.get_default_item_sort())
+        return self._aggregate(Album if album else Item, query, sums,
+                               distinct, group_by, order_by)
+
+    def query_plan(self, model_cls, query=None, sort=None):
+        """Get the :class:`dbcore.db.QueryPlan` that :meth:`items` (for
+        `model_cls` :class:`Item`) or :meth:`albums` (for :class:`Album`)
+        executes for the query.
+        """
+        if not sort:
+            if model_cls is Album:
+                sort = self.get_default_album_sort()
+            else:
+                sort = self.get_default_item_sort()
+        return self._plan(model_cls, query, sort)
 
     # Convenience accessors.
 
@@ -22,7 +22,7 @@ import re
 import inspect
 import abc
 from collections import defaultdict
-from functools import wraps
+from functools import partial, wraps
 
 
 import beets
@@ -349,6 +349,23 @@ def types(model_cls):
     return types
 
 
+def indexes(model_cls):
+    # Gives us `item_indexes` and `album_indexes`
+    attr_name = '{0}_indexes'.format(model_cls.__name__.lower())
+    indexes = {}
+    for plugin in find_plugins():
+        plugin_indexes = getattr(plugin, attr_name, {})
+        for name in plugin_indexes:
+            if name in indexes and \
+                    tuple(plugin_indexes[name]) != tuple(indexes[name]):
+                raise PluginConflictException(
+                    u'Plugin {0} defines index {1} which has already '
+                    u'been defined on other fields.'.format(plugin.name, name)
+                )
+        indexes.update(plugin_indexes)
+    return indexes
+
+
 def named_queries(model_cls):
     # Gather `item_queries` and `album_queries` from the plugins.
     attr_name = '{0}_queries'.format(model_cls.__name__.lower())
@@ -379,20 +396,48 @@ def album_distance(items, album_info, mapping):
     return dist
 
 
+def _overriding_plugins(method):
+    """Get the loaded plugins that implement the `BeetsPlugin` method
+    called `method` themselves.
+    """
+    default = six.get_unbound_function(getattr(BeetsPlugin, method))
+    return [plugin for plugin in find_plugins()
+            if six.get_unbound_function(getattr(type(plugin), method))
+            is not default]
+
+
+def candidate_sources(items, artist, album, va_likely, extra_tags=None):
+    """Get a function for each plugin that searches for album candidates,
+    which returns that plugin's candidates when called. Plugins that do
+    not search for candidates are left out.
+    """
+    return [partial(plugin.candidates, items, artist, album, va_likely,
+                    extra_tags)
+            for plugin in _overriding_plugins('candidates')]
+
+
+def item_candidate_sources(item, artist, title):
+    """Get a function for each plugin that searches for item candidates,
+    which returns that plugin's candidates when called.
+    """
+    return [partial(plugin.item_candidates, item, artist, title)
+            for plugin in _overriding_plugins('item_candidates')]
+
+
 def candidates(items, artist, album, va_likely, extra_tags=None):
     """Gets MusicBrainz candidates for an album from each plugin.
     """
-    for plugin in find_plugins():
-        for candidate in plugin.candidates(items, artist, album, va_likely,
-                                           extra_tags):
+    for source in candidate_sources(items, artist, album, va_likely,
+                                    extra_tags):
+        for candidate in source():
             yield candidate
 
 
 def item_candidates(item, artist, title):
     """Gets MusicBrainz candidates for an item from the plugins.
     """
-    for plugin in find_plugins():
-        for item_candidate in plugin.item_candidates(item, artist, title):
+    for source in item_candidate_sources(item, artist, title):
+        for item_candidate in source():
             yield item_candidate
 
 
@@ -1141,6 +1141,10 @@ def _setup(options, lib=None):
     subcommands = list(default_commands)
     subcommands.extend(plugins.commands())
 
+    # Add indexes requested by plugins before the schema is set up.
+    library.Item._indexes.update(plugins.indexes(library.Item))
+    library.Album._indexes.update(plugins.indexes(library.Album))
+
     if lib is None:
         lib = _open_library(config)
         plugins.send("library_opened", lib=lib)
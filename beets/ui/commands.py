@@ -1061,21 +1061,58 @@ def list_items(lib, query, album, fmt=u''):
     albums instead of single items.
     """
     if album:
-        for album in lib.albums(query):
+        fields = library.Album.format_fields(fmt)
+        for album in lib.albums(query, fields=fields).stream():
             ui.print_(format(album, fmt))
     else:
-        for item in lib.items(query):
+        fields = library.Item.format_fields(fmt)
+        for item in lib.items(query, fields=fields).stream():
             ui.print_(format(item, fmt))
 
 
+def explain_query(lib, query, album):
+    """Describe how the query is executed instead of listing its
+    results: the SQL statement and SQLite's plan for it, the parts of
+    the query and sort evaluated in Python, and the time each phase of
+    the execution takes.
+    """
+    model_cls = library.Album if album else library.Item
+    plan = lib.query_plan(model_cls, query)
+    objs, timings = plan.profile()
+
+    ui.print_(u'SQL: {0}'.format(plan.sql))
+    if plan.subvals:
+        ui.print_(u'Parameters: {0}'.format(
+            u', '.join(repr(v) for v in plan.subvals)))
+    ui.print_(u'SQLite plan:')
+    for line in plan.explain():
+        ui.print_(u'  {0}'.format(line))
+    ui.print_(u'Slow query: {0!r}'.format(plan.slow_query)
+              if plan.slow_query else u'Slow query: none')
+    ui.print_(u'Slow sort: {0!r}'.format(plan.slow_sort)
+              if plan.slow_sort else u'Slow sort: none')
+    ui.print_(u'Timings:')
+    for phase, duration in timings:
+        ui.print_(u'  {0}: {1:.2f} ms'.format(phase, duration * 1000))
+    ui.print_(u'Matched {0} {1}'.format(
+        len(objs), u'albums' if album else u'items'))
+
+
 def list_func(lib, opts, args):
-    list_items(lib, decargs(args), opts.album)
+    if opts.explain:
+        explain_query(lib, decargs(args), opts.album)
+    else:
+        list_items(lib, decargs(args), opts.album)
 
 
 list_cmd = ui.Subcommand(u'list', help=u'query the library', aliases=(u'ls',))
 list_cmd.parser.usage += u"\n" \
     u'Example: %prog -f \'$album: $title\' artist:beatles'
 list_cmd.parser.add_all_common_options()
+list_cmd.parser.add_option(
+    u'--explain', action='store_true', default=False,
+    help=u'show how the query is executed instead of its results'
+)
 list_cmd.func = list_func
 default_commands.append(list_cmd)
 
@@ -1088,7 +1125,7 @@ def update_items(lib, query, album, move, pretend, fields):
     :param fields: The fields to be stored. If not specified, all fields will
     be.
     """
-    with lib.transaction():
+    with lib.transaction(write=True):
         if move and fields is not None and 'path' not in fields:
             # Special case: if an item needs to be moved, the path field has to
             # updated; otherwise the new path will not be reflected in the
@@ -1098,6 +1135,7 @@ def update_items(lib, query, album, move, pretend, fields):
 
         # Walk through the items and pick up their changes.
         affected_albums = set()
+        changed_items = []
         for item in items:
             # Item deleted?
             if not os.path.exists(syspath(item.path)):
@@ -1143,19 +1181,20 @@ def update_items(lib, query, album, move, pretend, fields):
                     if move and lib.directory in ancestry(item.path):
                         item.move(store=False)
 
-                    item.store(fields=fields)
                     affected_albums.add(item.album_id)
-                else:
-                    # The file's mtime was different, but there were no
-                    # changes to the metadata. Store the new mtime,
-                    # which is set in the call to read(), so we don't
-                    # check this again in the future.
-                    item.store(fields=fields)
+                # Otherwise, the file's mtime was different, but there
+                # were no changes to the metadata. Store the new mtime,
+                # which is set in the call to read(), so we don't check
+                # this again in the future.
+                changed_items.append(item)
 
         # Skip album changes while pretending.
         if pretend:
             return
 
+        # Save all the item changes in one batch.
+        lib.store_many(changed_items, fields=fields)
+
         # Modify affected albums to reflect changes in their items.
         for album_id in affected_albums:
             if album_id is None:  # Singletons.
@@ -1179,7 +1218,7 @@ def update_items(lib, query, album, move, pretend, fields):
                 items = list(album.items())
                 for item in items:
                     item.move(store=False, with_album=False)
-                    item.store(fields=fields)
+                lib.store_many(items, fields=fields)
                 album.move(store=False)
                 album.store(fields=fields)
 
@@ -1251,7 +1290,7 @@ def remove_items(lib, query, album, delete, force):
             return
 
     # Remove (and possibly delete) items.
-    with lib.transaction():
+    with lib.transaction(write=True):
         for obj in (albums if album else items):
             obj.remove(delete)
 
@@ -1280,29 +1319,23 @@ default_commands.append(remove_cmd)
 
 def show_stats(lib, query, exact):
     """Shows some statistics about the matched items."""
-    items = lib.items(query)
+    stats = lib.aggregate(query, sums=['length'],
+                          distinct=['artist', 'albumartist', 'album_id'])
+    total_items = stats['count']
+    total_time = stats['sum']['length']
 
     total_size = 0
-    total_time = 0.0
-    total_items = 0
-    artists = set()
-    albums = set()
-    album_artists = set()
-
-    for item in items:
-        if exact:
+    if exact:
+        for item in lib.items(query, fields=['path']).stream():
             try:
                 total_size += os.path.getsize(syspath(item.path))
             except OSError as exc:
                 log.info(u'could not get size of {}: {}', item.path, exc)
-        else:
-            total_size += int(item.length * item.bitrate / 8)
-        total_time += item.length
-        total_items += 1
-        artists.add(item.artist)
-        album_artists.add(item.albumartist)
-        if item.album_id:
-            albums.add(item.album_id)
+    else:
+        # Estimate the size from the total length at every bitrate.
+        for bitrate, group in lib.aggregate(query, sums=['length'],
+                                            group_by='bitrate'):
+            total_size += int(group['sum']['length'] * (bitrate or 0) / 8)
 
     size_str = u'' + ui.human_bytes(total_size)
     if exact:
@@ -1319,9 +1352,9 @@ Album artists: {7}""".format(
         u' ({0:.2f} seconds)'.format(total_time) if exact else '',
         u'Total size' if exact else u'Approximate total size',
         size_str,
-        len(artists),
-        len(albums),
-        len(album_artists)),
+        stats['distinct']['artist'],
+        stats['distinct']['album_id'],
+        stats['distinct']['albumartist']),
     )
 
 
@@ -1410,9 +1443,21 @@ def modify_items(lib, mods, dels, query, write, move, album, confirm):
         )
 
     # Apply changes to database and files
-    with lib.transaction():
-        for obj in changed:
-            obj.try_sync(write, move)
+    with lib.transaction(write=True):
+        if album:
+            # Store the albums first so that changes reach their items
+            # before the tags are written and the files are moved.
+            lib.store_many(changed)
+            items = [item for obj in changed for item in obj.items()]
+        else:
+            items = changed
+        # Collect the albums whose art moved along with their items.
+        albums = {}
+        for item in items:
+            moved_album = item.try_sync(write, move, store=False)
+            if moved_album is not None:
+                albums[moved_album.id] = moved_album
+        lib.store_many(items + list(albums.values()))
 
 
 def print_and_modify(obj, mods, dels):
@@ -1594,6 +1639,7 @@ def write_items(lib, query, pretend, force):
     """
     items, albums = _do_query(lib, query, False, False)
 
+    written = []
     for item in items:
         # Item deleted?
         if not os.path.exists(syspath(item.path)):
@@ -1614,7 +1660,10 @@ def write_items(lib, query, pretend, force):
         if (changed or force) and not pretend:
             # We use `try_sync` here to keep the mtime up to date in the
             # database.
-            item.try_sync(True, False)
+            item.try_sync(True, False, store=False)
+            written.append(item)
+
+    lib.store_many(written)
 
 
 def write_func(lib, opts, args):
@@ -602,6 +602,12 @@ class Template(object):
         """
         return self.expr.evaluate(Environment(values, functions))
 
+    def variables(self):
+        """Get the set of variable names that the template refers to,
+        including those in function arguments.
+        """
+        return self.expr.translate()[1]
+
     def substitute(self, values={}, functions={}):
         """Evaluate the template given the values and functions.
         """
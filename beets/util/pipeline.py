@@ -25,18 +25,28 @@ In the parallel case, the implementation transparently handles thread
 shutdown when the processing is complete and when a stage raises an
 exception. KeyboardInterrupts (^C) are also handled.
 
+The pipeline keeps statistics for each stage (see `StageStats`) that
+help find the stage that limits its throughput.
+
 When running a parallel pipeline, it is also possible to use
 multiple coroutines for the same pipeline stage; this lets you speed
 up a bottleneck stage by dividing its work among multiple threads.
 To do so, pass an iterable of coroutines to the Pipeline constructor
-in place of any single coroutine.
+in place of any single coroutine. The threads of such a stage may
+finish their messages in any order; wrap the coroutines with `ordered`
+to have their output sent on in the order the input arrived.
 """
 
 from __future__ import division, absolute_import, print_function
 
 from six.moves import queue
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+from importlib import import_module
+from functools import wraps
+import multiprocessing
 import sys
+import time
+import weakref
 import six
 
 BUBBLE = '__PIPELINE_BUBBLE__'
@@ -44,6 +54,9 @@ POISON = '__PIPELINE_POISON__'
 
 DEFAULT_QUEUE_SIZE = 16
 
+# The most precise clock available for measuring intervals.
+_clock = getattr(time, 'perf_counter', time.time)
+
 
 def _invalidate_queue(q, val=None, sync=True):
     """Breaks a Queue such that it never blocks, always has size 1,
@@ -95,6 +108,13 @@ class CountedQueue(queue.Queue):
         queue.Queue.__init__(self, maxsize)
         self.nthreads = 0
         self.poisoned = False
+        self.max_depth = 0
+
+    def _put(self, item):
+        # Called with the mutex held; record the high-water mark.
+        queue.Queue._put(self, item)
+        if len(self.queue) > self.max_depth:
+            self.max_depth = len(self.queue)
 
     def acquire(self):
         """Indicate that a thread will start putting into this queue.
@@ -135,6 +155,54 @@ class CountedQueue(queue.Queue):
                     _invalidate_queue(self, POISON, False)
 
 
+class StageStats(object):
+    """Statistics about the work of one pipeline stage, shared by all
+    the threads running it. Times are in seconds and add up over the
+    threads:
+
+    * `messages`: the number of messages the stage handled (for the
+      first stage, the number it produced).
+    * `busy`: the time spent running the stage's coroutines.
+    * `wait_in`: the time spent waiting for messages from the previous
+      stage, which means the stage is starved.
+    * `wait_out`: the time spent waiting to pass messages on to the
+      next stage, which means a later stage is the bottleneck.
+    * `max_queue`: the largest number of messages waiting in the
+      stage's input queue at any time.
+    """
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.messages = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.max_queue = 0
+        self.lock = Lock()
+
+    def add(self, busy=0.0, wait_in=0.0, wait_out=0.0):
+        """Record the handling of a message.
+        """
+        with self.lock:
+            self.messages += 1
+            self.busy += busy
+            self.wait_in += wait_in
+            self.wait_out += wait_out
+
+    def as_dict(self):
+        """Get the statistics as a dictionary, suitable for JSON.
+        """
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'messages': self.messages,
+            'busy': self.busy,
+            'wait_in': self.wait_in,
+            'wait_out': self.wait_out,
+            'max_queue': self.max_queue,
+        }
+
+
 class MultiMessage(object):
     """A message yielded by a pipeline stage encapsulating multiple
     values to be sent to the next stage.
@@ -150,6 +218,111 @@ def multiple(messages):
     return MultiMessage(messages)
 
 
+class OrderedStage(tuple):
+    """A pipeline stage made of several coroutines that process messages
+    in parallel but send their results on in the order in which the
+    messages arrived. At most `buffer_size` finished messages wait for
+    an earlier one to complete; when the buffer is full, threads
+    holding later messages block.
+    """
+    def __new__(cls, coros, buffer_size=DEFAULT_QUEUE_SIZE):
+        stage = super(OrderedStage, cls).__new__(cls, coros)
+        stage.buffer_size = buffer_size
+        return stage
+
+
+def ordered(coros, buffer_size=DEFAULT_QUEUE_SIZE):
+    """Make a parallel pipeline stage from the iterable `coros` that
+    preserves the order of messages. Use it in place of a tuple of
+    coroutines:
+
+    >>> @stage
+    ... def add(n, i):
+    ...     return i + n
+    >>> pipe = Pipeline([
+    ...     iter([1, 2, 3]),
+    ...     ordered([add(2), add(2)]),
+    ...     mutator_stage(print)(),
+    ... ])
+    >>> pipe.run_parallel()
+    3
+    4
+    5
+    """
+    return OrderedStage(coros, buffer_size)
+
+
+class ReorderBuffer(object):
+    """Puts the output of the threads of an ordered stage back into
+    the order of their input. Each message taken from the input queue
+    is tagged with a sequence number, and the results for a sequence
+    number are only sent to the output queue after those for all
+    earlier ones.
+    """
+    def __init__(self, out_queue, maxsize):
+        self.out_queue = out_queue
+        self.maxsize = maxsize
+        self.get_lock = Lock()
+        self.cond = Condition(Lock())
+        self.next_in = 0
+        self.next_out = 0
+        self.pending = {}
+        self.aborted = False
+
+    def get(self, in_queue):
+        """Get the next message from `in_queue` and its sequence number.
+        """
+        with self.get_lock:
+            msg = in_queue.get()
+            seq = self.next_in
+            self.next_in += 1
+        return seq, msg
+
+    def put(self, seq, msgs):
+        """Send the list of messages `msgs` produced for the input with
+        sequence number `seq` once all earlier results have been sent.
+        Blocks while the buffer is full and `seq` is not the next to be
+        sent.
+        """
+        with self.cond:
+            while seq != self.next_out and \
+                    len(self.pending) >= self.maxsize and not self.aborted:
+                self.cond.wait()
+            if self.aborted:
+                return
+            self.pending[seq] = msgs
+            while self.next_out in self.pending:
+                for msg in self.pending.pop(self.next_out):
+                    self.out_queue.put(msg)
+                self.next_out += 1
+            self.cond.notify_all()
+
+    def abort(self):
+        """Wake up all threads waiting to put their results.
+        """
+        with self.cond:
+            self.aborted = True
+            self.cond.notify_all()
+
+
+# The names of the functions that decorated stage coroutines run. On
+# Python 2, a generator's name is always that of its code object
+# (`coro` for all of them).
+_stage_names = weakref.WeakKeyDictionary()
+
+
+def _named_coros(func, coro_func):
+    """Wrap the generator function `coro_func` of a stage decorator so
+    that the coroutines it makes are named after `func`.
+    """
+    @wraps(func)
+    def make(*args):
+        coro = coro_func(*args)
+        _stage_names[coro] = func.__name__
+        return coro
+    return make
+
+
 def stage(func):
     """Decorate a function to become a simple stage.
 
@@ -169,7 +342,7 @@ def stage(func):
         while True:
             task = yield task
             task = func(*(args + (task,)))
-    return coro
+    return _named_coros(func, coro)
 
 
 def mutator_stage(func):
@@ -192,6 +365,96 @@ def mutator_stage(func):
         while True:
             task = yield task
             func(*(args + (task,)))
+    return _named_coros(func, coro)
+
+
+_process_pool = None
+_process_pool_lock = Lock()
+
+
+def start_process_pool(processes=None, initializer=None, initargs=()):
+    """Start the pool of worker processes that runs the functions of
+    `process_stage` stages, replacing any pool started before. There
+    are `processes` workers, or one per CPU by default. `initializer`,
+    if given, is called with `initargs` in each worker when it starts;
+    it must be picklable.
+    """
+    global _process_pool
+    stop_process_pool()
+    with _process_pool_lock:
+        _process_pool = multiprocessing.Pool(processes, initializer,
+                                             initargs)
+
+
+def stop_process_pool():
+    """Shut down the pool of worker processes, if there is one, after
+    its pending work is done.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+def _call_by_name(module, name, args):
+    """Call the function called `name` in `module` with `args`. If the
+    name refers to a `process_stage`, call the decorated function.
+    """
+    func = getattr(import_module(module), name)
+    func = getattr(func, 'stage_func', func)
+    return func(*args)
+
+
+def run_in_process(func, args=()):
+    """Call `func` with `args` in the process pool, starting a default
+    pool if needed, and return its result. The function must be defined
+    at the top level of a module, and its arguments and return value
+    must be picklable. It is sent to the worker by name, since its
+    module may have replaced it with a stage.
+    """
+    global _process_pool
+    # Check and start the pool at once, so that concurrent first calls
+    # do not each start one.
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = multiprocessing.Pool()
+        pool = _process_pool
+    return pool.apply_async(
+        _call_by_name, (func.__module__, func.__name__, args)
+    ).get()
+
+
+def process_stage(func):
+    """Decorate a function to become a simple stage that runs in the
+    pool of worker processes started by `start_process_pool`, so that
+    CPU-bound work is not limited by the global interpreter lock. The
+    function must be defined at the top level of a module, and its
+    arguments, messages and return value must be picklable. As with
+    `stage`, the return value is sent to the next stage in place of
+    the message.
+
+    Each coroutine waits for one message at a time, so use several of
+    them, for instance in an `ordered` stage, to keep several processes
+    busy:
+
+    >>> pipe = Pipeline([
+    ...     iter([1, 2, 3]),
+    ...     ordered([process_stage(abs)() for _ in range(2)]),
+    ... ])
+    >>> list(pipe.pull())
+    [1, 2, 3]
+    >>> stop_process_pool()
+    """
+
+    def coro(*args):
+        task = None
+        while True:
+            task = yield task
+            task = run_in_process(func, args + (task,))
+    coro = _named_coros(func, coro)
+    coro.stage_func = func
     return coro
 
 
@@ -209,13 +472,16 @@ def _allmsgs(obj):
 
 
 class PipelineThread(Thread):
-    """Abstract base class for pipeline-stage threads."""
-    def __init__(self, all_threads):
+    """Abstract base class for pipeline-stage threads. The thread
+    records its work in `stats`, a `StageStats` object.
+    """
+    def __init__(self, all_threads, stats=None):
         super(PipelineThread, self).__init__()
         self.abort_lock = Lock()
         self.abort_flag = False
         self.all_threads = all_threads
         self.exc_info = None
+        self.stats = stats or StageStats(None)
 
     def abort(self):
         """Shut down the thread at the next chance possible.
@@ -228,6 +494,8 @@ class PipelineThread(Thread):
                 _invalidate_queue(self.in_queue, POISON)
             if hasattr(self, 'out_queue'):
                 _invalidate_queue(self.out_queue, POISON)
+            if getattr(self, 'reorder', None):
+                self.reorder.abort()
 
     def abort_all(self, exc_info):
         """Abort all other threads in the system for an exception.
@@ -241,8 +509,8 @@ class FirstPipelineThread(PipelineThread):
     """The thread running the first stage in a parallel pipeline setup.
     The coroutine should just be a generator.
     """
-    def __init__(self, coro, out_queue, all_threads):
-        super(FirstPipelineThread, self).__init__(all_threads)
+    def __init__(self, coro, out_queue, all_threads, stats=None):
+        super(FirstPipelineThread, self).__init__(all_threads, stats)
         self.coro = coro
         self.out_queue = out_queue
         self.out_queue.acquire()
@@ -258,10 +526,12 @@ class FirstPipelineThread(PipelineThread):
                         return
 
                 # Get the value from the generator.
+                start = _clock()
                 try:
                     msg = next(self.coro)
                 except StopIteration:
                     break
+                done = _clock()
 
                 # Send messages to the next stage.
                 for msg in _allmsgs(msg):
@@ -269,6 +539,7 @@ class FirstPipelineThread(PipelineThread):
                         if self.abort_flag:
                             return
                     self.out_queue.put(msg)
+                self.stats.add(done - start, 0.0, _clock() - done)
 
         except BaseException:
             self.abort_all(sys.exc_info())
@@ -280,14 +551,17 @@ class FirstPipelineThread(PipelineThread):
 
 class MiddlePipelineThread(PipelineThread):
     """A thread running any stage in the pipeline except the first or
-    last.
+    last. If `reorder` is a `ReorderBuffer`, the output is sent through
+    it to keep the order of the input.
     """
-    def __init__(self, coro, in_queue, out_queue, all_threads):
-        super(MiddlePipelineThread, self).__init__(all_threads)
+    def __init__(self, coro, in_queue, out_queue, all_threads,
+                 reorder=None, stats=None):
+        super(MiddlePipelineThread, self).__init__(all_threads, stats)
         self.coro = coro
         self.in_queue = in_queue
         self.out_queue = out_queue
         self.out_queue.acquire()
+        self.reorder = reorder
 
     def run(self):
         try:
@@ -300,9 +574,14 @@ class MiddlePipelineThread(PipelineThread):
                         return
 
                 # Get the message from the previous stage.
-                msg = self.in_queue.get()
+                start = _clock()
+                if self.reorder:
+                    seq, msg = self.reorder.get(self.in_queue)
+                else:
+                    msg = self.in_queue.get()
                 if msg is POISON:
                     break
+                received = _clock()
 
                 with self.abort_lock:
                     if self.abort_flag:
@@ -310,13 +589,19 @@ class MiddlePipelineThread(PipelineThread):
 
                 # Invoke the current stage.
                 out = self.coro.send(msg)
+                done = _clock()
 
-                # Send messages to next stage.
-                for msg in _allmsgs(out):
-                    with self.abort_lock:
-                        if self.abort_flag:
-                            return
-                    self.out_queue.put(msg)
+                # Send messages to next stage, in order if requested.
+                if self.reorder:
+                    self.reorder.put(seq, _allmsgs(out))
+                else:
+                    for msg in _allmsgs(out):
+                        with self.abort_lock:
+                            if self.abort_flag:
+                                return
+                        self.out_queue.put(msg)
+                self.stats.add(done - received, received - start,
+                               _clock() - done)
 
         except BaseException:
             self.abort_all(sys.exc_info())
@@ -330,8 +615,8 @@ class LastPipelineThread(PipelineThread):
     """A thread running the last stage in a pipeline. The coroutine
     should yield nothing.
     """
-    def __init__(self, coro, in_queue, all_threads):
-        super(LastPipelineThread, self).__init__(all_threads)
+    def __init__(self, coro, in_queue, all_threads, stats=None):
+        super(LastPipelineThread, self).__init__(all_threads, stats)
         self.coro = coro
         self.in_queue = in_queue
 
@@ -346,9 +631,11 @@ class LastPipelineThread(PipelineThread):
                         return
 
                 # Get the message from the previous stage.
+                start = _clock()
                 msg = self.in_queue.get()
                 if msg is POISON:
                     break
+                received = _clock()
 
                 with self.abort_lock:
                     if self.abort_flag:
@@ -356,20 +643,35 @@ class LastPipelineThread(PipelineThread):
 
                 # Send to consumer.
                 self.coro.send(msg)
+                self.stats.add(_clock() - received, received - start)
 
         except BaseException:
             self.abort_all(sys.exc_info())
             return
 
 
+def _stage_name(stage, index):
+    """Get a name for a pipeline stage from its first coroutine.
+    """
+    try:
+        name = _stage_names.get(stage[0])
+    except TypeError:
+        # Not weakly referenceable.
+        name = None
+    name = name or getattr(stage[0], '__name__', None)
+    return name or u'stage {0}'.format(index)
+
+
 class Pipeline(object):
     """Represents a staged pattern of work. Each stage in the pipeline
     is a coroutine that receives messages from the previous stage and
     yields messages to be sent to the next stage.
     """
-    def __init__(self, stages):
+    def __init__(self, stages, names=None):
         """Makes a new pipeline from a list of coroutines. There must
-        be at least two stages.
+        be at least two stages. `names`, if given, is a list of names
+        for the stages used in the statistics; stages without a name
+        (None) are named after their coroutines.
         """
         if len(stages) < 2:
             raise ValueError(u'pipeline must have at least two stages')
@@ -381,12 +683,34 @@ class Pipeline(object):
                 # Default to one thread per stage.
                 self.stages.append((stage,))
 
+        names = list(names or [])
+        names += [None] * (len(self.stages) - len(names))
+        names = [name or _stage_name(stage, i)
+                 for i, (name, stage) in enumerate(zip(names, self.stages))]
+        self.stats = [StageStats(name, len(stage))
+                      for name, stage in zip(names, self.stages)]
+        self.elapsed = None
+
+    def report(self):
+        """Get the statistics of the last run as a dictionary with the
+        total `elapsed` time and a list of `stages` (see
+        `StageStats`).
+        """
+        return {
+            'elapsed': self.elapsed,
+            'stages': [stats.as_dict() for stats in self.stats],
+        }
+
     def run_sequential(self):
         """Run the pipeline sequentially in the current thread. The
         stages are run one after the other. Only the first coroutine
         in each stage is used.
         """
-        list(self.pull())
+        start = _clock()
+        try:
+            list(self.pull())
+        finally:
+            self.elapsed = _clock() - start
 
     def run_parallel(self, queue_size=DEFAULT_QUEUE_SIZE):
         """Run the pipeline in parallel using one thread per stage. The
@@ -399,22 +723,31 @@ class Pipeline(object):
 
         # Set up first stage.
         for coro in self.stages[0]:
-            threads.append(FirstPipelineThread(coro, queues[0], threads))
+            threads.append(FirstPipelineThread(coro, queues[0], threads,
+                                               self.stats[0]))
 
         # Middle stages.
         for i in range(1, queue_count):
+            reorder = None
+            if isinstance(self.stages[i], OrderedStage) and \
+                    len(self.stages[i]) > 1:
+                reorder = ReorderBuffer(queues[i],
+                                        self.stages[i].buffer_size)
             for coro in self.stages[i]:
                 threads.append(MiddlePipelineThread(
-                    coro, queues[i - 1], queues[i], threads
+                    coro, queues[i - 1], queues[i], threads, reorder,
+                    self.stats[i]
                 ))
 
         # Last stage.
         for coro in self.stages[-1]:
             threads.append(
-                LastPipelineThread(coro, queues[-1], threads)
+                LastPipelineThread(coro, queues[-1], threads,
+                                   self.stats[-1])
             )
 
         # Start threads.
+        start = _clock()
         for thread in threads:
             thread.start()
 
@@ -437,6 +770,9 @@ class Pipeline(object):
             # in normal operation, or aborted, in case of an exception.
             for thread in threads[:-1]:
                 thread.join()
+            self.elapsed = _clock() - start
+            for stats, in_queue in zip(self.stats[1:], queues):
+                stats.max_queue = in_queue.max_depth
 
         for thread in threads:
             exc_info = thread.exc_info
@@ -458,12 +794,20 @@ class Pipeline(object):
             next(coro)
 
         # Begin the pipeline.
-        for out in coros[0]:
+        while True:
+            start = _clock()
+            try:
+                out = next(coros[0])
+            except StopIteration:
+                break
+            self.stats[0].add(_clock() - start)
             msgs = _allmsgs(out)
-            for coro in coros[1:]:
+            for coro, stats in zip(coros[1:], self.stats[1:]):
                 next_msgs = []
                 for msg in msgs:
+                    start = _clock()
                     out = coro.send(msg)
+                    stats.add(_clock() - start)
                     next_msgs.extend(_allmsgs(out))
                 msgs = next_msgs
             for msg in msgs:
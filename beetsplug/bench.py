@@ -26,9 +26,20 @@ from beets.util.functemplate import Template
 from beets.autotag import match
 from beets import plugins
 from beets import importer
+from beets import config
+from beets.util import pipeline
 import cProfile
+import os
+import shutil
+import tempfile
+import time
 import timeit
 
+try:
+    import tracemalloc
+except ImportError:  # Python 2.
+    tracemalloc = None
+
 
 def aunique_benchmark(lib, prof):
     def _build_tree():
@@ -84,6 +95,177 @@ def match_benchmark(lib, prof, query=None, album_id=None):
         print('match duration:', interval)
 
 
+def _synthetic_library(size):
+    """Create an in-memory library containing `size` generated items.
+    """
+    lib = library.Library(':memory:')
+    with lib.transaction(write=True) as tx:
+        for i in range(size):
+            tx.mutate(
+                'INSERT INTO items (title, artist, album, track) '
+                'VALUES (?, ?, ?, ?)',
+                (u'title {0}'.format(i), u'artist {0}'.format(i // 100),
+                 u'album {0}'.format(i // 10), i % 10 + 1),
+            )
+    return lib
+
+
+def results_benchmark(lib, prof, sizes):
+    """Measure how iterating over query results scales with the number
+    of rows. The library itself is not used: a synthetic library is
+    generated for each size.
+    """
+    for size in sizes:
+        results_lib = _synthetic_library(size)
+
+        def _iterate():
+            for item in results_lib.items():
+                pass
+
+        def _index():
+            results = results_lib.items()
+            results[size // 2]
+            results[size // 2:size // 2 + 100]
+
+        if prof:
+            cProfile.runctx('_iterate()', {}, {'_iterate': _iterate},
+                            'results.{0}.prof'.format(size))
+        else:
+            interval = timeit.timeit(_iterate, number=1)
+            print('iterate {0} items: {1:.3f}s ({2:.2f} us/item)'.format(
+                size, interval, interval / size * 1e6))
+            interval = timeit.timeit(_index, number=1)
+            print('index into {0} items: {1:.3f}s'.format(size, interval))
+
+
+def memory_benchmark(lib, size):
+    """Measure the memory used by `size` items loaded from a synthetic
+    library, first as fetched and then with every field converted. The
+    library itself is not used.
+    """
+    if tracemalloc is None:
+        raise ui.UserError(u'the memory benchmark requires Python 3')
+    memory_lib = _synthetic_library(size)
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        items = list(memory_lib.items())
+        loaded = tracemalloc.get_traced_memory()[0] - start
+        for item in items:
+            for key in item._fields:
+                item[key]
+        converted = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    print('{0} items loaded: {1:.1f} MiB ({2:.0f} bytes/item)'.format(
+        size, loaded / 2 ** 20, loaded / size))
+    print('{0} items converted: {1:.1f} MiB ({2:.0f} bytes/item)'.format(
+        size, converted / 2 ** 20, converted / size))
+
+
+def pipeline_benchmark(lib, prof, count, delay, workers):
+    """Measure the throughput of a parallel pipeline whose middle stage
+    waits `delay` seconds for each of `count` messages, like a network
+    lookup, with each number of threads in `workers`. The stage keeps
+    the order of the messages. The library itself is not used.
+    """
+    @pipeline.mutator_stage
+    def wait(msg):
+        time.sleep(delay)
+
+    def consume():
+        while True:
+            yield
+
+    for num in workers:
+        def _run():
+            pipeline.Pipeline([
+                iter(range(count)),
+                pipeline.ordered([wait() for _ in range(num)]),
+                consume(),
+            ]).run_parallel()
+
+        if prof:
+            cProfile.runctx('_run()', {}, {'_run': _run},
+                            'pipeline.{0}.prof'.format(num))
+        else:
+            interval = timeit.timeit(_run, number=1)
+            print('{0} workers: {1:.3f}s ({2:.1f} messages/s)'.format(
+                num, interval, count / interval))
+
+
+# SQLite configurations to compare in the database benchmark.
+SQLITE_SETTINGS = [
+    ('default', {}),
+    ('wal', {'journal_mode': 'wal', 'synchronous': 'normal'}),
+    ('wal+cache', {'journal_mode': 'wal', 'synchronous': 'normal',
+                   'cache_size': -65536, 'mmap_size': 268435456,
+                   'temp_store': 'memory'}),
+]
+
+
+def sqlite_benchmark(lib, prof, size):
+    """Compare the `database` configuration settings on a synthetic
+    on-disk library with `size` items. The library itself is not used.
+    """
+    original = config['database'].get()
+    try:
+        for name, settings in SQLITE_SETTINGS:
+            options = dict((key, None) for key, _ in library.SQLITE_PRAGMAS)
+            options.update(settings)
+            config['database'].set(options)
+            _sqlite_benchmark_run(name, prof, size)
+    finally:
+        # Later commands in this process use the configured settings.
+        config['database'].set(original)
+
+
+def _sqlite_benchmark_run(name, prof, size):
+    """Time adding, storing and reading `size` items in a new on-disk
+    library with the current `database` settings, named `name`.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        bench_lib = library.Library(os.path.join(tmpdir, 'library.db'))
+
+        # Add items in album-sized transactions, like the importer.
+        def _add():
+            for start in range(0, size, 10):
+                bench_lib.add_many(
+                    library.Item(title=u'title {0}'.format(i),
+                                 artist=u'artist {0}'.format(i // 100),
+                                 album=u'album {0}'.format(i // 10),
+                                 track=i % 10 + 1)
+                    for i in range(start, min(start + 10, size))
+                )
+
+        # Store single items, each in its own transaction.
+        def _store():
+            for item in bench_lib.items()[::100]:
+                item.play_count = 1
+                item.store()
+
+        def _read():
+            for item in bench_lib.items(u'play_count:1'):
+                pass
+            for item in bench_lib.items():
+                pass
+
+        for phase, func in (('add', _add), ('store', _store),
+                            ('read', _read)):
+            if prof:
+                cProfile.runctx('func()', {}, {'func': func},
+                                'sqlite.{0}.{1}.prof'.format(name, phase))
+            else:
+                interval = timeit.timeit(func, number=1)
+                print('{0} {1}: {2:.3f}s'.format(name, phase, interval))
+        bench_lib._close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
 class BenchmarkPlugin(BeetsPlugin):
     """A plugin for performing some simple performance benchmarks.
     """
@@ -106,4 +288,62 @@ class BenchmarkPlugin(BeetsPlugin):
         match_bench_cmd.func = lambda lib, opts, args: \
             match_benchmark(lib, opts.profile, ui.decargs(args), opts.id)
 
-        return [aunique_bench_cmd, match_bench_cmd]
+        results_bench_cmd = ui.Subcommand('bench_results',
+                                          help='benchmark for iterating '
+                                               'over query results')
+        results_bench_cmd.parser.add_option('-p', '--profile',
+                                            action='store_true', default=False,
+                                            help='performance profiling')
+        results_bench_cmd.parser.add_option('-s', '--size', action='append',
+                                            type='int', dest='sizes',
+                                            help='number of items to '
+                                                 'generate (repeatable)')
+        results_bench_cmd.func = lambda lib, opts, args: \
+            results_benchmark(lib, opts.profile,
+                              opts.sizes or [25000, 50000, 100000, 200000])
+
+        sqlite_bench_cmd = ui.Subcommand('bench_sqlite',
+                                         help='benchmark for SQLite '
+                                              'database settings')
+        sqlite_bench_cmd.parser.add_option('-p', '--profile',
+                                           action='store_true', default=False,
+                                           help='performance profiling')
+        sqlite_bench_cmd.parser.add_option('-s', '--size', type='int',
+                                           default=200000,
+                                           help='number of items to generate')
+        sqlite_bench_cmd.func = lambda lib, opts, args: \
+            sqlite_benchmark(lib, opts.profile, opts.size)
+
+        memory_bench_cmd = ui.Subcommand('bench_memory',
+                                         help='benchmark for the memory '
+                                              'used by loaded items')
+        memory_bench_cmd.parser.add_option('-s', '--size', type='int',
+                                           default=100000,
+                                           help='number of items to generate')
+        memory_bench_cmd.func = lambda lib, opts, args: \
+            memory_benchmark(lib, opts.size)
+
+        pipeline_bench_cmd = ui.Subcommand('bench_pipeline',
+                                           help='benchmark for parallel '
+                                                'pipeline stages')
+        pipeline_bench_cmd.parser.add_option('-p', '--profile',
+                                             action='store_true',
+                                             default=False,
+                                             help='performance profiling')
+        pipeline_bench_cmd.parser.add_option('-n', '--count', type='int',
+                                             default=200,
+                                             help='number of messages')
+        pipeline_bench_cmd.parser.add_option('-d', '--delay', type='float',
+                                             default=0.01,
+                                             help='seconds each message '
+                                                  'waits in the stage')
+        pipeline_bench_cmd.parser.add_option('-w', '--workers',
+                                             action='append', type='int',
+                                             help='number of threads in the '
+                                                  'stage (repeatable)')
+        pipeline_bench_cmd.func = lambda lib, opts, args: \
+            pipeline_benchmark(lib, opts.profile, opts.count, opts.delay,
+                               opts.workers or [1, 2, 4, 8])
+
+        return [aunique_bench_cmd, match_bench_cmd, results_bench_cmd,
+                sqlite_bench_cmd, memory_bench_cmd, pipeline_bench_cmd]
@@ -95,7 +95,7 @@ class BPSyncPlugin(BeetsPlugin):
 
             # Apply.
             trackinfo = self.beatport_plugin.track_for_id(item.mb_trackid)
-            with lib.transaction():
+            with lib.transaction(write=True):
                 autotag.apply_item_metadata(item, trackinfo)
                 apply_item_changes(lib, item, move, pretend, write)
 
@@ -162,7 +162,7 @@ class BPSyncPlugin(BeetsPlugin):
             }
 
             self._log.info(u'applying changes to {}', album)
-            with lib.transaction():
+            with lib.transaction(write=True):
                 autotag.apply_metadata(albuminfo, item_to_trackinfo)
                 changed = False
                 # Find any changed item to apply Beatport changes to album.
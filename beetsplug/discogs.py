@@ -31,6 +31,7 @@ import beets
 import re
 import time
 import json
+import threading
 import socket
 import os
 import traceback
@@ -67,6 +68,7 @@ class DiscogsPlugin(BeetsPlugin):
         self.register_listener('import_begin', self.setup)
         self.rate_limit_per_minute = 25
         self.last_request_timestamp = 0
+        self.rate_limit_lock = threading.Lock()
 
     def setup(self, session=None):
         """Create the `discogs_client` field. Authenticate if necessary.
@@ -106,11 +108,15 @@ class DiscogsPlugin(BeetsPlugin):
     def request_start(self):
         """wait for rate limit if needed
         """
-        time_to_next_request = self._time_to_next_request()
-        if time_to_next_request > 0:
-            self._log.debug('hit rate limit, waiting for {0} seconds',
-                            time_to_next_request)
-            time.sleep(time_to_next_request)
+        # Candidates may be looked up from several threads at once, so
+        # claim the next request slot while holding the lock.
+        with self.rate_limit_lock:
+            time_to_next_request = self._time_to_next_request()
+            if time_to_next_request > 0:
+                self._log.debug('hit rate limit, waiting for {0} seconds',
+                                time_to_next_request)
+                time.sleep(time_to_next_request)
+            self.last_request_timestamp = time.time()
 
     def request_finished(self):
         """update timestamp for rate limiting
@@ -114,7 +114,6 @@ class ExportPlugin(BeetsPlugin):
         )
 
         items = []
-        data_collector = library_data if opts.library else tag_data
 
         included_keys = []
         for keys in opts.included_keys:
@@ -122,7 +121,17 @@ class ExportPlugin(BeetsPlugin):
 
         key_filter = make_key_filter(included_keys)
 
-        for data_emitter in data_collector(lib, ui.decargs(args)):
+        if opts.library:
+            # Only fetch the included keys unless they are patterns. The
+            # album id is needed to look up album-level keys.
+            fields = None
+            if included_keys and not any('*' in k for k in included_keys):
+                fields = included_keys + ['album_id']
+            data_emitters = library_data(lib, ui.decargs(args), fields)
+        else:
+            data_emitters = tag_data(lib, ui.decargs(args))
+
+        for data_emitter in data_emitters:
             try:
                 data, item = data_emitter()
             except (mediafile.UnreadableFileError, IOError) as ex:
@@ -27,6 +27,7 @@ from __future__ import division, absolute_import, print_function
 
 from beets.plugins import BeetsPlugin
 from beets import library, ui
+from beets.dbcore.db import ComputedFieldError
 from beets.ui import commands
 from operator import attrgetter
 import os
@@ -171,9 +172,20 @@ def get_set_of_values_for_field(lib, fields):
     fields_dict = {}
     for each in fields:
         fields_dict[each] = set()
-    for item in lib.items():
-        for field in fields:
-            fields_dict[field].add(wrap(item[field]))
+    computed = []
+    for field in fields:
+        try:
+            groups = lib.aggregate(group_by=field)
+        except ComputedFieldError:
+            computed.append(field)
+            continue
+        for value, _ in groups:
+            if value is not None:
+                fields_dict[field].add(wrap(value))
+    if computed:
+        for item in lib.items():
+            for field in computed:
+                fields_dict[field].add(wrap(item[field]))
     return fields_dict
 
 
@@ -58,14 +58,23 @@ def tag_data_emitter(path):
     return emitter
 
 
-def library_data(lib, args):
-    for item in lib.items(args):
-        yield library_data_emitter(item)
+def library_data(lib, args, fields=None):
+    """Generate emitters for the data of the items matching the query.
+    If `fields` is a list of field names, only those fields are fetched
+    and emitted.
+    """
+    for item in lib.items(args, fields=fields):
+        yield library_data_emitter(item, fields)
 
 
-def library_data_emitter(item):
+def library_data_emitter(item, fields=None):
     def emitter():
-        data = dict(item.formatted())
+        formatted = item.formatted()
+        if fields is None:
+            data = dict(formatted)
+        else:
+            data = dict((key, formatted[key]) for key in fields
+                        if key in formatted)
 
         return data, item
     return emitter
@@ -88,7 +88,7 @@ class MBSyncPlugin(BeetsPlugin):
                 continue
 
             # Apply.
-            with lib.transaction():
+            with lib.transaction(write=True):
                 autotag.apply_item_metadata(item, track_info)
                 apply_item_changes(lib, item, move, pretend, write)
 
@@ -152,7 +152,7 @@ class MBSyncPlugin(BeetsPlugin):
 
             # Apply.
             self._log.debug(u'applying changes to {}', album_formatted)
-            with lib.transaction():
+            with lib.transaction(write=True):
                 autotag.apply_metadata(album_info, mapping)
                 changed = False
                 # Find any changed item to apply MusicBrainz changes to album.
@@ -69,7 +69,7 @@ class SubsonicPlaylistPlugin(BeetsPlugin):
         self.config['password'].redact = True
 
     def update_tags(self, playlist_dict, lib):
-        with lib.transaction():
+        with lib.transaction(write=True):
             for query, playlist_tag in playlist_dict.items():
                 query = AndQuery([MatchQuery("artist", query[0]),
                                   MatchQuery("album", query[1]),
@@ -124,7 +124,7 @@ class SubsonicPlaylistPlugin(BeetsPlugin):
                     playlist_dict.keys())
                 for item in to_be_removed:
                     item['subsonic_playlist'] = ''
-                    with lib.transaction():
+                    with lib.transaction(write=True):
                         item.try_sync(write=True, move=False)
 
             self.update_tags(playlist_dict, lib)
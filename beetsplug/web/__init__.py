@@ -19,6 +19,7 @@ from __future__ import division, absolute_import, print_function
 from beets.plugins import BeetsPlugin
 from beets import ui
 from beets import util
+from beets.dbcore.db import ComputedFieldError, CursorError
 import beets.library
 import flask
 from flask import g
@@ -31,18 +32,24 @@ import base64
 
 # Utilities.
 
-def _rep(obj, expand=False):
+def _rep(obj, expand=False, fields=None):
     """Get a flat -- i.e., JSON-ish -- representation of a beets Item or
     Album object. For Albums, `expand` dictates whether tracks are
-    included.
+    included. If `fields` is a list of field names, the representation
+    only includes those fields and the id.
     """
-    out = dict(obj)
+    if fields is None:
+        out = dict(obj)
+    else:
+        out = dict((key, obj[key]) for key in ['id'] + fields
+                   if key in obj)
 
     if isinstance(obj, beets.library.Item):
         if app.config.get('INCLUDE_PATHS', False):
-            out['path'] = util.displayable_path(out['path'])
+            if 'path' in out:
+                out['path'] = util.displayable_path(out['path'])
         else:
-            del out['path']
+            out.pop('path', None)
 
         # Filter all bytes attributes and convert them to strings.
         for key, value in out.items():
@@ -51,38 +58,45 @@ def _rep(obj, expand=False):
 
         # Get the size (in bytes) of the backing file. This is useful
         # for the Tomahawk resolver API.
-        try:
-            out['size'] = os.path.getsize(util.syspath(obj.path))
-        except OSError:
-            out['size'] = 0
+        if fields is None or 'size' in fields:
+            try:
+                out['size'] = os.path.getsize(util.syspath(obj.path))
+            except OSError:
+                out['size'] = 0
 
         return out
 
     elif isinstance(obj, beets.library.Album):
-        del out['artpath']
+        out.pop('artpath', None)
         if expand:
             out['items'] = [_rep(item) for item in obj.items()]
         return out
 
 
-def json_generator(items, root, expand=False):
+def json_generator(items, root, expand=False, fields=None, limit=None):
     """Generator that dumps list of beets Items or Albums as JSON
 
     :param root:  root key for JSON
     :param items: list of :class:`Item` or :class:`Album` to dump
     :param expand: If true every :class:`Album` contains its items in the json
                    representation
+    :param fields: If given, the list of fields to include for each object
+    :param limit: The page size the items were fetched with. If the page is
+                  full, the id of its last object is included as
+                  ``next_after`` to request the next page
     :returns:     generator that yields strings
     """
     yield '{"%s":[' % root
-    first = True
+    count = 0
     for item in items:
-        if first:
-            first = False
-        else:
+        if count:
             yield ','
-        yield json.dumps(_rep(item, expand=expand))
-    yield ']}'
+        count += 1
+        yield json.dumps(_rep(item, expand=expand, fields=fields))
+    if limit and count == limit:
+        yield '],"next_after":%d}' % item.id
+    else:
+        yield ']}'
 
 
 def is_expand():
@@ -91,6 +105,24 @@ def is_expand():
     return flask.request.args.get('expand') is not None
 
 
+def query_options():
+    """Returns the keyword arguments for :meth:`Library.items` and
+    :meth:`Library.albums` given by the current request: the list of
+    `fields` to include, and the `limit`, `offset` and `after` cursor of
+    the requested page.
+    """
+    args = flask.request.args
+    fields = args.get('fields')
+    if fields is not None:
+        fields = [field for field in fields.split(',') if field]
+    return {
+        'fields': fields,
+        'limit': args.get('limit', type=int),
+        'offset': args.get('offset', type=int),
+        'after': args.get('after', type=int),
+    }
+
+
 def resource(name):
     """Decorates a function to handle RESTful HTTP requests for a resource.
     """
@@ -118,10 +150,16 @@ def resource_query(name):
     """
     def make_responder(query_func):
         def responder(queries):
+            options = query_options()
+            try:
+                entities = query_func(queries, **options)
+            except CursorError:
+                # The `after` cursor does not exist.
+                return flask.abort(400)
             return app.response_class(
                 json_generator(
-                    query_func(queries),
-                    root='results', expand=is_expand()
+                    entities, root='results', expand=is_expand(),
+                    fields=options['fields'], limit=options['limit']
                 ),
                 mimetype='application/json'
             )
@@ -136,8 +174,16 @@ def resource_list(name):
     """
     def make_responder(list_all):
         def responder():
+            options = query_options()
+            try:
+                entities = list_all(**options)
+            except CursorError:
+                # The `after` cursor does not exist.
+                return flask.abort(400)
             return app.response_class(
-                json_generator(list_all(), root=name, expand=is_expand()),
+                json_generator(entities, root=name, expand=is_expand(),
+                               fields=options['fields'],
+                               limit=options['limit']),
                 mimetype='application/json'
             )
         responder.__name__ = 'all_{0}'.format(name)
@@ -145,14 +191,30 @@ def resource_list(name):
     return make_responder
 
 
+def _is_known_key(model, key):
+    """Check whether `key` is a field of `model` or a flexible attribute
+    that some object has.
+    """
+    if key in model.all_keys():
+        return True
+    with g.lib.transaction() as tx:
+        rows = tx.query('SELECT 1 FROM "{0}" WHERE key = ? LIMIT 1'
+                        .format(model._flex_table), (key,))
+    return bool(rows)
+
+
 def _get_unique_table_field_values(model, field, sort_field):
     """ retrieve all unique values belonging to a key from a model """
-    if field not in model.all_keys() or sort_field not in model.all_keys():
-        raise KeyError
-    with g.lib.transaction() as tx:
-        rows = tx.query('SELECT DISTINCT "{0}" FROM "{1}" ORDER BY "{2}"'
-                        .format(field, model._table, sort_field))
-    return [row[0] for row in rows]
+    for key in (field, sort_field):
+        if not _is_known_key(model, key):
+            raise KeyError(key)
+    try:
+        groups = g.lib.aggregate(group_by=field, order_by=sort_field,
+                                 album=model is beets.library.Album)
+    except ComputedFieldError:
+        raise KeyError(field)
+    return [value for value, _ in groups
+            if value is not None or field in model._fields]
 
 
 class IdListConverter(BaseConverter):
@@ -212,8 +274,8 @@ def get_item(id):
 @app.route('/item/')
 @app.route('/item/query/')
 @resource_list('items')
-def all_items():
-    return g.lib.items()
+def all_items(**options):
+    return g.lib.items(**options)
 
 
 @app.route('/item/<int:item_id>/file')
@@ -252,8 +314,8 @@ def item_file(item_id):
 
 @app.route('/item/query/<query:queries>')
 @resource_query('items')
-def item_query(queries):
-    return g.lib.items(queries)
+def item_query(queries, **options):
+    return g.lib.items(queries, **options)
 
 
 @app.route('/item/path/<everything:path>')
@@ -288,14 +350,14 @@ def get_album(id):
 @app.route('/album/')
 @app.route('/album/query/')
 @resource_list('albums')
-def all_albums():
-    return g.lib.albums()
+def all_albums(**options):
+    return g.lib.albums(**options)
 
 
 @app.route('/album/query/<query:queries>')
 @resource_query('albums')
-def album_query(queries):
-    return g.lib.albums(queries)
+def album_query(queries, **options):
+    return g.lib.albums(queries, **options)
 
 
 @app.route('/album/<int:album_id>/art')
@@ -322,9 +384,8 @@ def album_unique_field_values(key):
 
 @app.route('/artist/')
 def all_artists():
-    with g.lib.transaction() as tx:
-        rows = tx.query("SELECT DISTINCT albumartist FROM albums")
-    all_artists = [row[0] for row in rows]
+    groups = g.lib.aggregate(group_by='albumartist', album=True)
+    all_artists = [value for value, _ in groups]
     return flask.jsonify(artist_names=all_artists)
 
 
@@ -332,13 +393,15 @@ def all_artists():
 
 @app.route('/stats')
 def stats():
-    with g.lib.transaction() as tx:
-        item_rows = tx.query("SELECT COUNT(*) FROM items")
-        album_rows = tx.query("SELECT COUNT(*) FROM albums")
-    return flask.jsonify({
-        'items': item_rows[0][0],
-        'albums': album_rows[0][0],
-    })
+    stats = {
+        'items': g.lib.aggregate()['count'],
+        'albums': g.lib.aggregate(album=True)['count'],
+    }
+    if g.lib.query_cache is not None:
+        stats['query_cache'] = g.lib.query_cache.stats()
+    if g.lib.persistent_cache is not None:
+        stats['persistent_query_cache'] = g.lib.persistent_cache.stats()
+    return flask.jsonify(stats)
 
 
 # UI.
@@ -223,8 +223,8 @@ class TestHelper(object):
         beets.plugins.load_plugins(plugins)
         beets.plugins.find_plugins()
 
-        # Take a backup of the original _types and _queries to restore
-        # when unloading.
+        # Take a backup of the original _types, _queries and _indexes to
+        # restore when unloading.
         Item._original_types = dict(Item._types)
         Album._original_types = dict(Album._types)
         Item._types.update(beets.plugins.types(Item))
@@ -235,6 +235,11 @@ class TestHelper(object):
         Item._queries.update(beets.plugins.named_queries(Item))
         Album._queries.update(beets.plugins.named_queries(Album))
 
+        Item._original_indexes = dict(Item._indexes)
+        Album._original_indexes = dict(Album._indexes)
+        Item._indexes.update(beets.plugins.indexes(Item))
+        Album._indexes.update(beets.plugins.indexes(Album))
+
     def unload_plugins(self):
         """Unload all plugins and remove the from the configuration.
         """
@@ -246,6 +251,8 @@ class TestHelper(object):
         Album._types = Album._original_types
         Item._queries = Item._original_queries
         Album._queries = Album._original_queries
+        Item._indexes = Item._original_indexes
+        Album._indexes = Album._original_indexes
 
     def create_importer(self, item_count=1, album_count=1):
         """Create files to import and return corresponding session.
@@ -18,10 +18,16 @@
 from __future__ import division, absolute_import, print_function
 
 import re
+import threading
 import unittest
+from mock import patch
+from six.moves import BaseHTTPServer, socketserver
+
+import requests
 
 from test import _common
 from beets import autotag
+from beets import plugins
 from beets.autotag import match
 from beets.autotag.hooks import Distance, string_dist
 from beets.library import Item
@@ -942,6 +948,43 @@ class StringDistanceTest(unittest.TestCase):
         self.assertEqual(dist, 0.0)
 
 
+class IdMatchTest(_common.TestCase):
+    def setUp(self):
+        super(IdMatchTest, self).setUp()
+        self.items = [Item(title=u'one', artist=u'artist', album=u'album',
+                           track=1, length=1, mb_albumid=u'id')]
+
+    def _info(self, album_id, title):
+        return AlbumInfo(album_id=album_id, album=u'album',
+                         artist=u'artist', tracks=[TrackInfo(
+                             title=title, track_id=album_id, index=1,
+                             length=1)])
+
+    def _tag_album(self, id_info, others):
+        with patch('beets.autotag.match.match_by_id',
+                   return_value=id_info), \
+            patch('beets.autotag.hooks.album_candidates',
+                  return_value=others) as search, \
+            patch('beets.autotag.match._add_candidate',
+                  wraps=match._add_candidate) as score:
+            _, _, prop = match.tag_album(self.items)
+        return prop, search.call_count, score.call_count
+
+    def test_strong_id_match_skips_search(self):
+        prop, searches, scores = self._tag_album(
+            self._info(u'id', u'one'), [])
+        self.assertEqual((searches, scores), (0, 1))
+        self.assertEqual(prop.recommendation, match.Recommendation.strong)
+
+    def test_weak_id_match_scored_once(self):
+        id_info = self._info(u'id', u'two')
+        prop, searches, scores = self._tag_album(
+            id_info, [self._info(u'other', u'one'), id_info])
+        self.assertEqual((searches, scores), (1, 2))
+        self.assertEqual(sorted(c.info.album_id for c in prop.candidates),
+                         [u'id', u'other'])
+
+
 class EnumTest(_common.TestCase):
     """
     Test Enum Subclasses defined in beets.util.enumeration
@@ -956,6 +999,102 @@ class EnumTest(_common.TestCase):
         self.assertGreater(OrderedEnumClass.c, OrderedEnumClass.b)
 
 
+class _StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers each request once a second request has arrived (or a
+    timeout has passed), telling whether the two overlapped.
+    """
+    def do_GET(self):
+        server = self.server
+        with server.cond:
+            server.arrived += 1
+            server.cond.notify_all()
+            deadline = 2.0
+            while server.arrived < 2 and deadline > 0:
+                server.cond.wait(0.1)
+                deadline -= 0.1
+            concurrent = server.arrived >= 2
+        body = b'yes' if concurrent else b'no'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _HTTPSource(plugins.BeetsPlugin):
+    def __init__(self, url):
+        super(_HTTPSource, self).__init__()
+        self.url = url
+
+    def candidates(self, items, artist, album, va_likely, extra_tags=None):
+        overlapped = requests.get(self.url).text
+        return [AlbumInfo(album=overlapped, tracks=[])]
+
+
+class _ListSource(plugins.BeetsPlugin):
+    def __init__(self, infos):
+        super(_ListSource, self).__init__()
+        self.infos = infos
+
+    def candidates(self, items, artist, album, va_likely, extra_tags=None):
+        if isinstance(self.infos, Exception):
+            raise self.infos
+        return self.infos
+
+
+class ParallelSourcesTest(_common.TestCase):
+    def _candidates(self, sources):
+        with patch('beets.plugins.find_plugins', return_value=sources):
+            return list(autotag.hooks.album_candidates(
+                [], None, None, False, None
+            ))
+
+    def _serve(self):
+        server = _StubServer(('127.0.0.1', 0), _StubHandler)
+        server.cond = threading.Condition()
+        server.arrived = 0
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return 'http://127.0.0.1:{0}/'.format(server.server_address[1])
+
+    def test_sources_queried_concurrently(self):
+        config['import']['parallel_sources'] = True
+        url = self._serve()
+        infos = self._candidates([_HTTPSource(url), _HTTPSource(url)])
+        self.assertEqual([info.album for info in infos], [u'yes', u'yes'])
+
+    def test_sources_queried_one_by_one_by_default(self):
+        url = self._serve()
+        infos = self._candidates([_HTTPSource(url), _HTTPSource(url)])
+        self.assertEqual([info.album for info in infos], [u'no', u'yes'])
+
+    def test_results_keep_source_order(self):
+        first = [AlbumInfo(album=u'a', tracks=[]),
+                 AlbumInfo(album=u'b', tracks=[])]
+        second = [AlbumInfo(album=u'c', tracks=[])]
+        for parallel in (True, False):
+            config['import']['parallel_sources'] = parallel
+            infos = self._candidates([_ListSource(first),
+                                      plugins.BeetsPlugin(),
+                                      _ListSource(second)])
+            self.assertEqual([info.album for info in infos],
+                             [u'a', u'b', u'c'])
+
+    def test_source_exception_is_raised(self):
+        config['import']['parallel_sources'] = True
+        sources = [_ListSource([]), _ListSource(ValueError(u'broken'))]
+        self.assertRaises(ValueError, self._candidates, sources)
+
+
 def suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
 
@@ -18,10 +18,14 @@
 from __future__ import division, absolute_import, print_function
 
 import os
+import pickle
 import shutil
 import sqlite3
+import threading
+import time
 import unittest
 from six import assertRaisesRegex
+from mock import patch
 
 from test import _common
 from beets import dbcore
@@ -147,6 +151,18 @@ class DatabaseFixtureTwoModels(dbcore.Database):
     pass
 
 
+class ModelFixtureIndexed(ModelFixture1):
+    _indexes = {
+        'field_one': ('field_one',),
+        'both': ('field_one', 'field_two'),
+    }
+
+
+class DatabaseFixtureIndexed(dbcore.Database):
+    _models = (ModelFixtureIndexed,)
+    pass
+
+
 class ModelFixtureWithGetters(dbcore.Model):
 
     @classmethod
@@ -224,6 +240,37 @@ class MigrationTest(unittest.TestCase):
         except sqlite3.OperationalError:
             self.fail("select failed")
 
+    def _indexes(self, db):
+        conn = db._connection()
+        indexes = {}
+        for row in conn.execute('PRAGMA index_list(test)'):
+            info = conn.execute('PRAGMA index_info({0})'.format(row['name']))
+            indexes[row['name']] = tuple(r['name'] for r in info)
+        return indexes
+
+    def test_open_with_indexes_creates_indexes(self):
+        new_lib = DatabaseFixtureIndexed(self.libfile)
+        indexes = self._indexes(new_lib)
+        self.assertEqual(indexes['test_by_field_one'], ('field_one',))
+        self.assertEqual(indexes['test_by_both'], ('field_one', 'field_two'))
+
+    def test_open_with_changed_index_replaces_it(self):
+        DatabaseFixtureIndexed(self.libfile)
+        new_lib = DatabaseFixture2(self.libfile)
+        new_lib._make_indexes('test', {'both': ('field_two',)})
+        indexes = self._indexes(new_lib)
+        self.assertEqual(indexes['test_by_both'], ('field_two',))
+        self.assertEqual(indexes['test_by_field_one'], ('field_one',))
+
+    def test_open_without_indexes_keeps_them(self):
+        old_lib = DatabaseFixture2(self.libfile)
+        old_lib._connection().execute('CREATE INDEX mine ON test (field_two)')
+        old_lib._connection().commit()
+        DatabaseFixtureIndexed(self.libfile)
+        new_lib = DatabaseFixture2(self.libfile)
+        self.assertEqual(sorted(self._indexes(new_lib)),
+                         ['mine', 'test_by_both', 'test_by_field_one'])
+
 
 class ModelTest(unittest.TestCase):
     def setUp(self):
@@ -288,6 +335,85 @@ class ModelTest(unittest.TestCase):
         model = self.db._get(ModelFixture1, model.id)
         self.assertFalse('foo' in model)
 
+    def test_add_many(self):
+        models = []
+        for i in range(3):
+            model = ModelFixture1()
+            model.field_one = i
+            model.foo = 'bar{0}'.format(i)
+            models.append(model)
+        self.db.add_many(models)
+
+        self.assertEqual(len(set(model.id for model in models)), 3)
+        for i, model in enumerate(models):
+            self.assertFalse(model._dirty)
+            other_model = self.db._get(ModelFixture1, model.id)
+            self.assertEqual(other_model.field_one, i)
+            self.assertEqual(other_model.foo, 'bar{0}'.format(i))
+
+    def test_add_many_after_existing_rows(self):
+        model = ModelFixture1()
+        model.add(self.db)
+        models = [ModelFixture1(), ModelFixture1()]
+        self.db.add_many(models)
+        self.assertEqual([m.id for m in models], [model.id + 1, model.id + 2])
+        rows = self.db._connection().execute('select * from test').fetchall()
+        self.assertEqual(len(rows), 3)
+
+    def test_store_many(self):
+        models = []
+        for i in range(3):
+            model = ModelFixture1()
+            model.add(self.db)
+            models.append(model)
+        models[0].field_one = 1
+        models[1].field_one = 2
+        models[1].field_two = 'two'
+        models[2].foo = 'bar'
+        self.db.store_many(models)
+
+        self.assertEqual(self.db._get(ModelFixture1, models[0].id).field_one,
+                         1)
+        other_model = self.db._get(ModelFixture1, models[1].id)
+        self.assertEqual(other_model.field_one, 2)
+        self.assertEqual(other_model.field_two, 'two')
+        self.assertEqual(self.db._get(ModelFixture1, models[2].id).foo,
+                         'bar')
+        for model in models:
+            self.assertFalse(model._dirty)
+
+    def test_store_many_deletes_flexattr(self):
+        model = ModelFixture1()
+        model.foo = 'bar'
+        model.add(self.db)
+        del model['foo']
+        self.db.store_many([model])
+
+        model = self.db._get(ModelFixture1, model.id)
+        self.assertFalse('foo' in model)
+
+    def test_store_many_only_given_fields(self):
+        model = ModelFixture1()
+        model.add(self.db)
+        model.field_one = 1
+        model.field_two = 'two'
+        self.db.store_many([model], fields=['field_one'])
+
+        model = self.db._get(ModelFixture1, model.id)
+        self.assertEqual(model.field_one, 1)
+        self.assertEqual(model.field_two, '')
+
+    def test_store_all_results(self):
+        for i in range(3):
+            ModelFixture1().add(self.db)
+        results = self.db._fetch(ModelFixture1)
+        for model in results:
+            model.field_one = 5
+        results.store_all()
+
+        for model in self.db._fetch(ModelFixture1):
+            self.assertEqual(model.field_one, 5)
+
     def test_delete_non_existent_attribute(self):
         model = ModelFixture1()
         with self.assertRaises(KeyError):
@@ -370,6 +496,184 @@ class ModelTest(unittest.TestCase):
             dbcore.Model._parse(None, 42)
 
 
+class FixedValuesTest(unittest.TestCase):
+    def test_values_converted_on_access(self):
+        values = dbcore.db.FixedValues(ModelFixture1)
+        values.init({'id': 1, 'field_one': u'3', 'other': 4})
+        self.assertEqual(values['field_one'], 3)
+        self.assertEqual(set(values.keys()), set(['id', 'field_one']))
+        self.assertNotIn('field_two', values)
+        self.assertIsNone(values['field_two'])
+
+    def test_delete_and_copy(self):
+        values = dbcore.db.FixedValues(ModelFixture1)
+        values['field_two'] = u'x'
+        copy = values.copy()
+        del values['field_two']
+        self.assertNotIn('field_two', values)
+        self.assertEqual(copy['field_two'], u'x')
+
+    def test_init_missing_keeps_values(self):
+        values = dbcore.db.FixedValues(ModelFixture1)
+        values['field_one'] = 5
+        values.init_missing({'field_one': 1, 'field_two': u'y'})
+        self.assertEqual(values['field_one'], 5)
+        self.assertEqual(values['field_two'], u'y')
+
+    def test_pickle_model(self):
+        db = DatabaseFixture1(':memory:')
+        model = ModelFixture1(field_one=1, some_flex=u'x')
+        model.add(db)
+        copy = pickle.loads(pickle.dumps(model, 2))
+        self.assertIsNone(copy._db)
+        self.assertEqual(copy.field_one, 1)
+        self.assertEqual(copy.some_flex, u'x')
+        self.assertNotIn('field_two', copy._values_fixed)
+        db._connection().close()
+
+    def test_positions_shared_and_extended(self):
+        class Extended(ModelFixture1):
+            _fields = dict(ModelFixture1._fields)
+
+        model = Extended(field_one=1)
+        positions = Extended._field_positions()
+        Extended._fields['field_three'] = dbcore.types.STRING
+        model.field_three = u'z'
+        self.assertIs(Extended._field_positions(), positions)
+        self.assertEqual(model.field_one, 1)
+        self.assertEqual(model.field_three, u'z')
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = mkstemp()
+        os.close(fd)
+        self.db = DatabaseFixture1(self.path)
+        ModelFixture1().add(self.db)
+
+    def tearDown(self):
+        self.db._close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def _read_in_thread(self):
+        """Start a thread that reads from the database and return an
+        event that is set when the read has completed.
+        """
+        done = threading.Event()
+
+        def read():
+            with self.db.transaction() as tx:
+                tx.query('SELECT * FROM test')
+            done.set()
+        threading.Thread(target=read).start()
+        return done
+
+    def test_query_does_not_take_write_lock(self):
+        with self.db.transaction() as tx:
+            tx.query('SELECT * FROM test')
+            self.assertIsNone(self.db._db_lock._writer)
+
+    def test_mutate_takes_write_lock_until_root_exits(self):
+        with self.db.transaction():
+            with self.db.transaction() as tx:
+                tx.mutate('UPDATE test SET field_one=1')
+            self.assertIsNotNone(self.db._db_lock._writer)
+        self.assertIsNone(self.db._db_lock._writer)
+
+    def test_concurrent_readers(self):
+        with self.db._db_lock.reading():
+            self.assertTrue(self._read_in_thread().wait(5))
+
+    def test_read_lock_held_until_root_exits(self):
+        with self.db.transaction() as tx:
+            before = tx.query('SELECT field_one FROM test')[0][0]
+            done = threading.Event()
+
+            def write():
+                with self.db.transaction() as tx:
+                    tx.mutate('UPDATE test SET field_one=field_one+1')
+                done.set()
+            threading.Thread(target=write).start()
+
+            self.assertFalse(done.wait(0.1))
+            after = tx.query('SELECT field_one FROM test')[0][0]
+            self.assertEqual(before, after)
+        self.assertTrue(done.wait(5))
+
+    def test_write_after_read_in_same_transaction(self):
+        with self.db.transaction() as tx:
+            tx.query('SELECT * FROM test')
+            tx.mutate('UPDATE test SET field_one=1')
+            self.assertEqual(self.db._db_lock._readers, 0)
+        self.assertIsNone(self.db._db_lock._writer)
+
+    def test_write_transaction_takes_write_lock_up_front(self):
+        with self.db.transaction(write=True) as tx:
+            self.assertIsNotNone(self.db._db_lock._writer)
+            tx.query('SELECT * FROM test')
+            self.assertEqual(self.db._db_lock._readers, 0)
+        self.assertIsNone(self.db._db_lock._writer)
+
+    def test_concurrent_read_then_write_keeps_both_writes(self):
+        errors = []
+
+        def increment():
+            try:
+                with self.db.transaction(write=True) as tx:
+                    value = tx.query('SELECT field_one FROM test')[0][0]
+                    # Give the other thread a chance to read the same
+                    # value.
+                    time.sleep(0.05)
+                    tx.mutate('UPDATE test SET field_one=?', (value + 1,))
+            except dbcore.db.WriteConflictError as exc:
+                errors.append(exc)
+
+        with self.db.transaction(write=True) as tx:
+            tx.mutate('UPDATE test SET field_one=0')
+        threads = [threading.Thread(target=increment) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(errors, [])
+        with self.db.transaction() as tx:
+            value = tx.query('SELECT field_one FROM test')[0][0]
+        self.assertEqual(value, 2)
+
+    def test_write_after_concurrent_write_conflicts(self):
+        lock = self.db._db_lock
+        acquire_write = lock.acquire_write
+        main = threading.current_thread()
+        done = threading.Event()
+
+        def write():
+            with self.db.transaction() as tx:
+                tx.mutate('UPDATE test SET field_one=5')
+            done.set()
+
+        def acquire_after_writer(blocking=True):
+            # Let the other thread's write in while we upgrade.
+            if threading.current_thread() is main:
+                done.wait(5)
+            return acquire_write(blocking)
+
+        with patch.object(lock, 'acquire_write', acquire_after_writer):
+            with self.assertRaises(dbcore.db.WriteConflictError):
+                with self.db.transaction() as tx:
+                    tx.query('SELECT * FROM test')
+                    threading.Thread(target=write).start()
+                    tx.mutate('UPDATE test SET field_one=1')
+        self.assertTrue(done.is_set())
+        with self.db.transaction() as tx:
+            value = tx.query('SELECT field_one FROM test')[0][0]
+        self.assertEqual(value, 5)
+        self.assertIsNone(lock._writer)
+        self.assertEqual(lock._readers, 0)
+
+
 class FormatTest(unittest.TestCase):
     def test_format_fixed_field_integer(self):
         model = ModelFixture1()
@@ -714,6 +1018,502 @@ class ResultsIteratorTest(unittest.TestCase):
         self.assertIsNone(self.db._fetch(
             ModelFixture1, dbcore.query.FalseQuery()).get())
 
+    def test_iterate_across_chunks(self):
+        for i in range(5):
+            model = ModelFixture1()
+            model['foo'] = 'qux{0}'.format(i)
+            model.add(self.db)
+        objs = self.db._fetch(ModelFixture1)
+        objs.chunk_size = 2
+        self.assertEqual([o.foo for o in objs],
+                         ['baz', 'bar'] + ['qux{0}'.format(i)
+                                           for i in range(5)])
+
+    def test_slow_query_across_chunks(self):
+        for i in range(5):
+            model = ModelFixture1()
+            model['foo'] = 'qux{0}'.format(i)
+            model.add(self.db)
+        q = dbcore.query.SubstringQuery('foo', 'qux', False)
+        objs = self.db._fetch(ModelFixture1, q)
+        objs.chunk_size = 2
+        self.assertEqual(len(objs), 5)
+        self.assertEqual(objs[4].foo, 'qux4')
+
+    def test_stream_does_not_keep_objects(self):
+        for i in range(5):
+            model = ModelFixture1()
+            model['foo'] = 'qux{0}'.format(i)
+            model.add(self.db)
+        q = dbcore.query.SubstringQuery('foo', 'qux', False)
+        objs = self.db._fetch(ModelFixture1, q)
+        objs.chunk_size = 2
+        self.assertEqual([o.foo for o in objs.stream()],
+                         ['qux{0}'.format(i) for i in range(5)])
+        self.assertEqual(objs._slots, [None] * 7)
+
+    def test_negative_subscript(self):
+        objs = self.db._fetch(ModelFixture1)
+        self.assertEqual(objs[-1].foo, 'bar')
+
+    def test_random_access_fetches_one_chunk(self):
+        for i in range(5):
+            model = ModelFixture1()
+            model['foo'] = 'qux{0}'.format(i)
+            model.add(self.db)
+        objs = self.db._fetch(ModelFixture1)
+        objs.chunk_size = 2
+        self.assertEqual(objs[5].foo, 'qux3')
+        self.assertEqual(objs._slots[:4], [None] * 4)
+
+    def test_slice(self):
+        for i in range(5):
+            model = ModelFixture1()
+            model['foo'] = 'qux{0}'.format(i)
+            model.add(self.db)
+        objs = self.db._fetch(ModelFixture1)
+        objs.chunk_size = 2
+        self.assertEqual([o.foo for o in objs[3:5]], ['qux1', 'qux2'])
+        self.assertEqual(objs._slots[:2], [None] * 2)
+        self.assertEqual([o.foo for o in objs[::3]],
+                         ['baz', 'qux1', 'qux4'])
+
+    def test_slow_query_slice(self):
+        q = dbcore.query.SubstringQuery('foo', 'bar', False)
+        objs = self.db._fetch(ModelFixture1, q)
+        self.assertEqual([o.foo for o in objs[0:5]], ['bar'])
+        self.assertEqual([o.foo for o in objs[-1:]], ['bar'])
+
+    def test_slow_sort_slice(self):
+        s = dbcore.query.SlowFieldSort('foo')
+        objs = self.db._fetch(ModelFixture1, sort=s)
+        self.assertEqual([o.foo for o in objs[:1]], ['bar'])
+
+    def test_removed_row_is_skipped(self):
+        objs = self.db._fetch(ModelFixture1)
+        self.db._fetch(ModelFixture1).get().remove()
+        self.assertEqual([o.foo for o in objs], ['bar'])
+
+
+class ProjectionTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture1(':memory:')
+        model = ModelFixture1()
+        model.field_one = 1
+        model.field_two = u'two'
+        model.foo = u'bar'
+        model.baz = u'qux'
+        model.add(self.db)
+
+    def tearDown(self):
+        self.db._connection().close()
+
+    def fetch(self, fields):
+        return self.db._fetch(ModelFixture1, fields=fields).get()
+
+    def test_fetches_only_requested_fields(self):
+        obj = self.fetch(['field_one', 'foo'])
+        self.assertEqual(set(obj._values_fixed.keys()),
+                         set(['id', 'field_one']))
+        self.assertEqual(obj._values_flex.keys(), ['foo'])
+        self.assertEqual(obj.field_one, 1)
+        self.assertEqual(obj.foo, u'bar')
+
+    def test_unrequested_fields_load_on_access(self):
+        obj = self.fetch(['field_one'])
+        self.assertEqual(obj.field_two, u'two')
+        self.assertEqual(obj.baz, u'qux')
+        self.assertFalse(obj._partial)
+
+    def test_contains_loads_flex_attributes(self):
+        obj = self.fetch(['field_one'])
+        self.assertIn('field_two', obj)
+        self.assertTrue(obj._partial)
+        self.assertIn('baz', obj)
+        self.assertNotIn('missing', obj)
+
+    def test_keys_are_complete(self):
+        obj = self.fetch([])
+        self.assertEqual(set(obj.keys()), set(self.fetch(None).keys()))
+        self.assertIn('baz', obj.keys())
+
+    def test_assignment_survives_loading(self):
+        obj = self.fetch(['field_one'])
+        obj.field_two = u'new'
+        obj.foo = u'new'
+        self.assertEqual(obj.baz, u'qux')
+        self.assertEqual(obj.field_two, u'new')
+        self.assertEqual(obj.foo, u'new')
+
+    def test_store_unrequested_field(self):
+        obj = self.fetch(['field_one'])
+        obj.field_two = u'new'
+        obj.store()
+        stored = self.db._get(ModelFixture1, obj.id)
+        self.assertEqual(stored.field_two, u'new')
+        self.assertEqual(stored.foo, u'bar')
+
+    def test_delete_unrequested_flex_attribute(self):
+        obj = self.fetch(['field_one'])
+        del obj.foo
+        obj.store()
+        self.assertNotIn('foo', self.db._get(ModelFixture1, obj.id))
+
+    def test_slow_query_fetches_all_fields(self):
+        q = dbcore.query.SubstringQuery('foo', 'ba', False)
+        obj = self.db._fetch(ModelFixture1, q, fields=['field_one']).get()
+        self.assertFalse(obj._partial)
+        self.assertIn('baz', obj._values_flex)
+
+
+class PaginationTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture1(':memory:')
+        for value in (u'b', None, u'a', u'b', u'A', u'c'):
+            model = ModelFixture1()
+            model.field_two = value
+            model.add(self.db)
+
+    def tearDown(self):
+        self.db._connection().close()
+
+    def pages(self, sort, size):
+        """Collect the ids on consecutive pages using keyset pagination.
+        """
+        ids = []
+        after = None
+        while True:
+            page = [o.id for o in self.db._fetch(ModelFixture1, sort=sort,
+                                                 limit=size, after=after)]
+            ids += page
+            if len(page) < size:
+                return ids
+            after = page[-1]
+
+    def test_pages_follow_sort_order(self):
+        for ascending in (True, False):
+            sort = dbcore.query.FixedFieldSort('field_two', ascending)
+            all_ids = [o.id for o in self.db._fetch(ModelFixture1, sort=sort)]
+            for size in (1, 2, 4):
+                ids = self.pages(sort, size)
+                self.assertEqual(ids, all_ids)
+                self.assertEqual(len(set(ids)), 6)
+
+    def test_pages_by_multiple_sort(self):
+        sort = dbcore.query.MultipleSort([
+            dbcore.query.FixedFieldSort('field_two', False),
+            dbcore.query.FixedFieldSort('id', False),
+        ])
+        self.assertEqual(self.pages(sort, 2), [6, 4, 1, 5, 3, 2])
+
+    def test_limit_and_offset(self):
+        objs = self.db._fetch(ModelFixture1, limit=2, offset=3)
+        self.assertEqual([o.id for o in objs], [4, 5])
+
+    def test_page_is_selected_in_sql(self):
+        plan = self.db._plan(ModelFixture1)
+        sql, subvals = plan._page_sql(limit=2, after=1)
+        self.assertIn(u'LIMIT', sql)
+
+    def test_slow_sort_pages_in_python(self):
+        sort = dbcore.query.SlowFieldSort('field_two')
+        all_ids = [o.id for o in self.db._fetch(ModelFixture1, sort=sort)]
+        self.assertEqual(self.pages(sort, 4), all_ids)
+
+    def test_unknown_cursor(self):
+        with self.assertRaises(ValueError):
+            self.db._fetch(ModelFixture1, limit=2, after=99)
+
+
+class AggregateTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture1(':memory:')
+        for one, two, flex in ((1, u'a', u'x'), (2, u'b', u'x'),
+                               (3, u'a', None), (4, u'b', u'y')):
+            model = ModelFixture1()
+            model.field_one = one
+            model.field_two = two
+            if flex:
+                model.foo = flex
+                model.some_float_field = one / 2.0
+            model.add(self.db)
+
+    def tearDown(self):
+        self.db._connection().close()
+
+    def test_count_sum_distinct(self):
+        stats = self.db._aggregate(ModelFixture1, sums=['field_one'],
+                                   distinct=['field_two', 'foo'])
+        self.assertEqual(stats, {'count': 4, 'sum': {'field_one': 10},
+                                 'distinct': {'field_two': 2, 'foo': 2}})
+
+    def test_sum_typed_flex_field(self):
+        stats = self.db._aggregate(ModelFixture1, sums=['some_float_field'])
+        self.assertEqual(stats['sum']['some_float_field'], 3.5)
+
+    def test_sum_flex_field_without_sql_cast(self):
+        class PythonFloat(dbcore.types.Float):
+            def sql_cast(self, expr):
+                return None
+
+        with patch.dict(ModelFixture1._types,
+                        {'some_float_field': PythonFloat()}):
+            stats = self.db._aggregate(ModelFixture1,
+                                       sums=['some_float_field'])
+        self.assertEqual(stats['sum']['some_float_field'], 3.5)
+
+    def test_query(self):
+        q = dbcore.query.NumericQuery('field_one', '2..')
+        stats = self.db._aggregate(ModelFixture1, q, sums=['field_one'])
+        self.assertEqual((stats['count'], stats['sum']['field_one']),
+                         (3, 9))
+
+    def test_group_by_fixed_field(self):
+        groups = self.db._aggregate(ModelFixture1, sums=['field_one'],
+                                    group_by='field_two')
+        self.assertEqual([(value, stats['count'], stats['sum']['field_one'])
+                          for value, stats in groups],
+                         [(u'a', 2, 4), (u'b', 2, 6)])
+
+    def test_group_by_flex_field(self):
+        groups = self.db._aggregate(ModelFixture1, group_by='foo')
+        self.assertEqual([(value, stats['count']) for value, stats in groups],
+                         [(None, 1), (u'x', 2), (u'y', 1)])
+
+    def test_group_order(self):
+        groups = self.db._aggregate(ModelFixture1, group_by='field_two',
+                                    order_by='field_one')
+        self.assertEqual([value for value, _ in groups], [u'a', u'b'])
+        groups = self.db._aggregate(ModelFixture1, group_by='foo',
+                                    order_by='field_one')
+        self.assertEqual([value for value, _ in groups], [u'x', None, u'y'])
+
+    def test_slow_query_matches_sql(self):
+        fast = dbcore.query.TrueQuery()
+        slow = dbcore.query.SubstringQuery('field_two', u'', False)
+        for group_by in (None, 'field_two'):
+            self.assertEqual(
+                self.db._aggregate(ModelFixture1, fast, ['field_one'],
+                                   ['foo'], group_by),
+                self.db._aggregate(ModelFixture1, slow, ['field_one'],
+                                   ['foo'], group_by),
+            )
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture1(':memory:')
+        for i, foo in enumerate(['baz', 'bar', 'bar']):
+            model = ModelFixture1()
+            model.field_one = i
+            model['foo'] = foo
+            model.add(self.db)
+
+    def tearDown(self):
+        self.db._connection().close()
+
+    def test_fast_query_has_no_residue(self):
+        q = dbcore.query.NumericQuery('field_one', '1..')
+        plan = self.db._plan(ModelFixture1, q)
+        self.assertIn('field_one', plan.sql)
+        self.assertIsNone(plan.slow_query)
+        self.assertIsNone(plan.slow_sort)
+
+    def test_conjunction_splits_into_sql_and_residue(self):
+        slow = dbcore.query.SubstringQuery('foo', 'bar', False)
+        q = dbcore.query.AndQuery([
+            dbcore.query.NumericQuery('field_one', '1..'), slow,
+        ])
+        plan = self.db._plan(ModelFixture1, q)
+        self.assertIn('field_one', plan.sql)
+        self.assertEqual(plan.slow_query, dbcore.query.AndQuery([slow]))
+        self.assertEqual([o.field_one for o in plan.results()], [1, 2])
+
+    def test_slow_sort(self):
+        s = dbcore.query.SlowFieldSort('foo')
+        plan = self.db._plan(ModelFixture1, sort=s)
+        self.assertEqual(plan.slow_sort, s)
+        self.assertNotIn('ORDER BY', plan.sql)
+
+    def test_explain(self):
+        plan = self.db._plan(ModelFixture1,
+                             dbcore.query.MatchQuery('id', 1))
+        lines = plan.explain()
+        self.assertTrue(lines)
+        self.assertIn('test', lines[0])
+
+    def test_explain_without_nesting(self):
+        # The columns of EXPLAIN QUERY PLAN before SQLite 3.24.
+        rows = self.db._connection().execute(
+            "SELECT 0 AS selectid, 0 AS \"order\", 0 AS \"from\", "
+            "'SCAN TABLE test' AS detail"
+        ).fetchall()
+        plan = self.db._plan(ModelFixture1)
+        with patch.object(dbcore.db.Transaction, 'query', return_value=rows):
+            self.assertEqual(plan.explain(), ['SCAN TABLE test'])
+
+    def test_profile(self):
+        q = dbcore.query.SubstringQuery('foo', 'bar', False)
+        plan = self.db._plan(ModelFixture1, q,
+                             dbcore.query.SlowFieldSort('field_one', False))
+        objs, timings = plan.profile()
+        self.assertEqual([o.field_one for o in objs], [2, 1])
+        self.assertEqual([phase for phase, _ in timings],
+                         ['fetch', 'materialize', 'filter', 'sort'])
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture1(':memory:')
+        self.db.query_cache = dbcore.QueryCache(2)
+        for i in range(3):
+            model = ModelFixture1()
+            model.field_one = i
+            model.add(self.db)
+
+    def tearDown(self):
+        self.db._connection().close()
+
+    def query(self, pattern='1..'):
+        q = dbcore.query.NumericQuery('field_one', pattern)
+        return [o.field_one for o in self.db._fetch(ModelFixture1, q)]
+
+    def test_repeated_query_hits(self):
+        self.assertEqual(self.query(), [1, 2])
+        self.assertEqual(self.query(), [1, 2])
+        stats = self.db.query_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_modification_invalidates(self):
+        self.query()
+        model = ModelFixture1()
+        model.field_one = 5
+        model.add(self.db)
+        self.assertEqual(self.query(), [1, 2, 5])
+        self.assertEqual(self.db.query_cache.stats()['misses'], 2)
+
+    def test_store_invalidates(self):
+        self.query()
+        model = self.db._get(ModelFixture1, 1)
+        model.field_one = 9
+        model.store()
+        self.assertEqual(sorted(self.query()), [1, 2, 9])
+
+    def test_least_recently_used_is_evicted(self):
+        self.query('1..')
+        self.query('2..')
+        self.query('1..')
+        self.query('0..')
+        self.query('1..')
+        self.query('2..')
+        stats = self.db.query_cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual((stats['hits'], stats['misses']), (2, 4))
+
+
+class PersistentQueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = mkstemp()
+        os.close(fd)
+        self.db = DatabaseFixture1(self.path, persistent_cache=True)
+        for i in range(3):
+            model = ModelFixture1()
+            model.field_one = i
+            model.add(self.db)
+
+    def tearDown(self):
+        self.db._close()
+        os.remove(self.path)
+
+    def query(self, db):
+        q = dbcore.query.NumericQuery('field_one', '1..')
+        return [o.field_one for o in db._fetch(ModelFixture1, q)]
+
+    def test_results_reused_by_other_database(self):
+        self.assertEqual(self.query(self.db), [1, 2])
+        other = DatabaseFixture1(self.path, persistent_cache=True)
+        self.assertEqual(self.query(other), [1, 2])
+        self.assertEqual(other.persistent_cache.stats()['hits'], 1)
+
+    def test_modification_by_other_database_invalidates(self):
+        self.query(self.db)
+        other = DatabaseFixture1(self.path, persistent_cache=True)
+        model = other._get(ModelFixture1, 1)
+        model.field_one = 9
+        model.store()
+        self.assertEqual(sorted(self.query(self.db)), [1, 2, 9])
+        self.assertEqual(self.db.persistent_cache.stats()['misses'], 2)
+
+    def test_flex_attribute_change_invalidates(self):
+        self.query(self.db)
+        with self.db.transaction() as tx:
+            counter = self.db.persistent_cache.counter(tx)
+        model = self.db._get(ModelFixture1, 1)
+        model.some_flex = u'value'
+        model.store()
+        with self.db.transaction() as tx:
+            self.assertGreater(self.db.persistent_cache.counter(tx), counter)
+
+    def test_storing_does_not_invalidate_memory_cache(self):
+        self.db.query_cache = dbcore.QueryCache(2)
+        self.query(self.db)
+        self.query(self.db)
+        self.assertEqual(self.db.query_cache.stats()['hits'], 1)
+
+    def test_open_does_not_write_when_set_up(self):
+        with self.db.transaction() as tx:
+            counter = self.db.persistent_cache.counter(tx)
+        with patch.object(dbcore.db.Transaction, 'script') as script:
+            DatabaseFixture1(self.path, persistent_cache=True)
+        for args, kwargs in script.call_args_list:
+            self.assertNotIn('query_cache', args[0])
+        with self.db.transaction() as tx:
+            self.assertEqual(self.db.persistent_cache.counter(tx), counter)
+
+    def test_reads_while_other_process_writes(self):
+        writer = sqlite3.connect(self.path)
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            other = DatabaseFixture1(self.path, timeout=0.1,
+                                     persistent_cache=True)
+            self.assertEqual(self.query(other), [1, 2])
+            self.assertEqual(other.persistent_cache.stats()['size'], 0)
+        finally:
+            writer.rollback()
+            writer.close()
+        self.assertEqual(self.query(other), [1, 2])
+        self.assertEqual(other.persistent_cache.stats()['size'], 1)
+
+    def test_size_is_bounded(self):
+        self.db.persistent_cache.size = 2
+        for i in range(4):
+            q = dbcore.query.NumericQuery('field_one', '{0}..'.format(i))
+            list(self.db._fetch(ModelFixture1, q))
+        self.assertEqual(self.db.persistent_cache.stats()['size'], 2)
+
+    def test_disabling_drops_cache(self):
+        self.query(self.db)
+        DatabaseFixture1(self.path)
+        with self.db.transaction() as tx:
+            rows = tx.query("SELECT name FROM sqlite_master "
+                            "WHERE name LIKE '%query_cache%' "
+                            "OR name LIKE '%_count_%'")
+        self.assertEqual(rows, [])
+
+
+class StatementCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture1(':memory:')
+
+    def tearDown(self):
+        self.db._connection().close()
+
+    def test_cached_statements_passed_to_connection(self):
+        db = DatabaseFixture1(':memory:', cached_statements=7)
+        with patch('sqlite3.connect', wraps=sqlite3.connect) as connect:
+            db._create_connection().close()
+        self.assertEqual(connect.call_args[1]['cached_statements'], 7)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
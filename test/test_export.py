@@ -19,12 +19,15 @@
 from __future__ import division, absolute_import, print_function
 
 import unittest
+from mock import patch
 from test.helper import TestHelper
 import re  # used to test csv format
 import json
 from xml.etree.ElementTree import Element
 from xml.etree import ElementTree
 
+from beets.library import Item
+
 
 class ExportPluginTest(unittest.TestCase, TestHelper):
     def setUp(self):
@@ -94,6 +97,19 @@ class ExportPluginTest(unittest.TestCase, TestHelper):
                 self.assertTrue(tag in self.test_values, msg=tag)
                 self.assertEqual(self.test_values[tag], txt, msg=txt)
 
+    def test_library_album_key_without_reload(self):
+        item1 = self.create_item()
+        album = self.lib.add_album([item1])
+        album.mood = u'xmood'
+        album.store()
+        with patch.object(Item, '_load_missing') as load:
+            out = self.run_with_output(
+                'export', '-l', '-i', 'title,mood', item1.artist
+            )
+        self.assertFalse(load.called)
+        json_data = json.loads(out)[0]
+        self.assertEqual(json_data, {'title': u'xtitle', 'mood': u'xmood'})
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
@@ -18,6 +18,7 @@ from __future__ import division, absolute_import, print_function
 """Tests for the general importer functionality.
 """
 import os
+import json
 import re
 import shutil
 import unicodedata
@@ -1376,6 +1377,186 @@ class TagLogTest(_common.TestCase):
         self.assertIn(u'status caf\xe9', sio.getvalue())
 
 
+class ImportWorkersTest(_common.TestCase, ImportHelper):
+    def setUp(self):
+        self.setup_beets(disk=True)
+        self._create_import_dir(2)
+        self._setup_import_session()
+        self.matcher = AutotagStub().install()
+        self.matcher.matching = AutotagStub.GOOD
+
+    def tearDown(self):
+        self.teardown_beets()
+        self.matcher.restore()
+
+    def test_workers_number_applies_to_all_stages(self):
+        config['threaded'] = True
+        config['import']['workers'] = 3
+        self.importer.set_config(config['import'])
+        self.assertEqual(self.importer.stage_workers('lookup_candidates'), 3)
+        self.assertEqual(self.importer.stage_workers('fetchart'), 3)
+
+    def test_workers_mapping_by_stage_name(self):
+        config['threaded'] = True
+        config['import']['workers'] = {'lookup_candidates': 4}
+        self.importer.set_config(config['import'])
+        self.assertEqual(self.importer.stage_workers('lookup_candidates'), 4)
+        self.assertEqual(self.importer.stage_workers('fetchart'), 1)
+
+    def test_single_worker_when_not_threaded(self):
+        config['import']['workers'] = 3
+        self.importer.set_config(config['import'])
+        self.assertEqual(self.importer.stage_workers('lookup_candidates'), 1)
+
+    def test_parallel_stages_are_ordered(self):
+        config['threaded'] = True
+        config['import']['workers'] = {'lookup_candidates': 2}
+        self.importer.set_config(config['import'])
+        stages = self.importer._ordered_stages([
+            ('lookup_candidates', lambda: None),
+            ('fetchart', lambda: None),
+        ])
+        self.assertIsInstance(stages[0], importer.pipeline.OrderedStage)
+        self.assertEqual(len(stages[0]), 2)
+        self.assertIsNone(stages[1])
+
+    @patch('beets.autotag.hooks.album_candidates')
+    @patch('beets.autotag.match_by_id')
+    def test_weak_id_match_scored_once_after_lookup(self, match_by_id,
+                                                    album_candidates):
+        def info(album_id, title):
+            return AlbumInfo(album_id=album_id, album=u'album',
+                             artist=u'artist', tracks=[TrackInfo(
+                                 title=title, track_id=album_id, index=1,
+                                 length=1)])
+        match_by_id.return_value = info(u'id', u'two')
+        album_candidates.return_value = [info(u'other', u'one'),
+                                         match_by_id.return_value]
+        items = [_common.item()]
+        items[0].update({'title': u'one', 'artist': u'artist',
+                         'album': u'album', 'mb_albumid': u'id'})
+        task = importer.ImportTask(None, None, items)
+
+        with patch('beets.autotag.match._add_candidate',
+                   wraps=autotag.match._add_candidate) as score:
+            task.lookup_candidates(score=False)
+            self.assertEqual(album_candidates.call_count, 0)
+            while task.candidate_infos is not None:
+                task.score_candidates()
+        self.assertEqual((album_candidates.call_count, score.call_count),
+                         (1, 2))
+        self.assertEqual(sorted(c.info.album_id for c in task.candidates),
+                         [u'id', u'other'])
+
+    def test_scoring_processes(self):
+        config['import']['processes'] = 2
+        self.importer.set_config(config['import'])
+        self.assertEqual(self.importer.scoring_processes(), 0)
+        config['threaded'] = True
+        self.assertEqual(self.importer.scoring_processes(), 2)
+        config['import']['processes'] = 'auto'
+        self.assertGreater(self.importer.scoring_processes(), 0)
+
+    def test_apply_match_scored_in_processes(self):
+        config['threaded'] = True
+        config['import']['processes'] = 2
+        self.matcher.matching = AutotagStub.IDENT
+        self.importer.add_choice(importer.action.APPLY)
+        with patch.object(self.importer, 'choose_match',
+                          wraps=self.importer.choose_match) as choose:
+            self.importer.run()
+        task = choose.call_args[0][0]
+        self.assertEqual(set(map(id, task.candidates[0].mapping)),
+                         set(map(id, task.items)))
+        self.assertEqual(self.lib.albums().get().album, u'Applied Album')
+        self.assertEqual(
+            sorted(i.title for i in self.lib.items()),
+            [u'Applied Title 1', u'Applied Title 2'],
+        )
+        self.assert_file_in_lib(
+            b'Applied Artist', b'Applied Album', b'Applied Title 1.mp3')
+
+    def test_reimport_library_scored_in_processes(self):
+        self.matcher.matching = AutotagStub.IDENT
+        self.importer.add_choice(importer.action.ASIS)
+        self.importer.run()
+
+        config['threaded'] = True
+        config['import']['processes'] = 2
+        self.importer = ImportSessionFixture(
+            self.lib, loghandler=None, query=[u'Tag Album'], paths=[]
+        )
+        self.importer.add_choice(importer.action.APPLY)
+        choose_match = self.importer.choose_match
+        dbs = []
+
+        def record(task):
+            dbs.extend(item._db for item in task.items)
+            return choose_match(task)
+        with patch.object(self.importer, 'choose_match',
+                          side_effect=record) as choose:
+            self.importer.run()
+        self.assertEqual(dbs, [self.lib, self.lib])
+        task = choose.call_args[0][0]
+        self.assertEqual(set(map(id, task.candidates[0].mapping)),
+                         set(map(id, task.items)))
+        self.assertEqual(len(self.lib.albums()), 1)
+        self.assertEqual(self.lib.albums().get().album, u'Applied Album')
+        self.assertEqual(
+            sorted(i.title for i in self.lib.items()),
+            [u'Applied Title 1', u'Applied Title 2'],
+        )
+        self.assert_file_in_lib(
+            b'Applied Artist', b'Applied Album', b'Applied Title 1.mp3')
+
+    @patch('beets.importer.ImportTask.lookup_candidates')
+    def test_threaded_import_with_processes(self, lookup):
+        config['threaded'] = True
+        config['import']['processes'] = 2
+        self.importer.add_choice(importer.action.ASIS)
+        self.importer.run()
+        lookup.assert_called_once_with(score=False)
+        self.assertEqual(self.lib.albums().get().album, u'Tag Album')
+        self.assertEqual(len(self.lib.items()), 2)
+
+    @patch('beets.importer.ImportTask.lookup_candidates')
+    def test_threaded_import_with_workers(self, lookup):
+        config['threaded'] = True
+        config['import']['workers'] = 2
+        self.importer.add_choice(importer.action.ASIS)
+        self.importer.run()
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(self.lib.albums().get().album, u'Tag Album')
+        self.assertEqual(len(self.lib.items()), 2)
+
+    @patch('beets.importer.ImportTask.lookup_candidates')
+    def test_pipeline_report(self, lookup):
+        config['threaded'] = True
+        path = os.path.join(self.temp_dir, b'report.json')
+        config['import']['pipeline_report'] = py3_path(path)
+        self.importer.add_choice(importer.action.ASIS)
+        self.importer.run()
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertGreater(report['elapsed'], 0)
+        stages = dict((s['name'], s) for s in report['stages'])
+        self.assertEqual(stages['lookup_candidates']['messages'], 2)
+        self.assertEqual(stages['manipulate_files']['messages'], 2)
+
+    @patch('beets.importer.ImportTask.lookup_candidates')
+    def test_pipeline_statistics_in_import_log(self, lookup):
+        sio = StringIO()
+        handler = logging.StreamHandler(sio)
+        # Without verbose output, as the import log is usually written.
+        handler.setLevel(logging.INFO)
+        self.importer.logger.handlers = [handler]
+        self.importer.add_choice(importer.action.ASIS)
+        self.importer.run()
+        self.assertIn(u'import pipeline finished', sio.getvalue())
+        self.assertIn(u'stage lookup_candidates', sio.getvalue())
+
+
 class ResumeImportTest(unittest.TestCase, TestHelper):
 
     def setUp(self):
@@ -36,8 +36,10 @@ from beets import plugins
 from beets import config
 from mediafile import MediaFile, UnreadableFileError
 from beets.util import syspath, bytestring_path
-from test.helper import TestHelper
+from test.helper import TestHelper, capture_log
 import six
+import confuse
+from mock import patch
 
 # Shortcut to path normalization.
 np = util.normpath
@@ -81,6 +83,125 @@ class StoreTest(_common.LibTestCase):
         self.assertTrue('composer' not in self.i._dirty)
 
 
+class StoreManyTest(_common.LibTestCase):
+    def test_store_many_changes_database_values(self):
+        i2 = item(self.lib)
+        self.i.year = 1987
+        i2.year = 1988
+        self.lib.store_many([self.i, i2])
+        self.assertEqual(self.lib.get_item(self.i.id).year, 1987)
+        self.assertEqual(self.lib.get_item(i2.id).year, 1988)
+
+    def test_store_many_album_changes_affect_items(self):
+        album = self.lib.add_album([self.i])
+        album.album = u'myNewAlbum'
+        self.lib.store_many([album])
+        self.assertEqual(self.lib.get_item(self.i.id).album, u'myNewAlbum')
+
+    def test_store_many_sends_database_change(self):
+        i2 = item(self.lib)
+        self.i.year = 1987
+        i2.year = 1988
+        with patch('beets.plugins.send') as send:
+            self.lib.store_many([self.i, i2])
+        send.assert_any_call('database_change', lib=self.lib, model=self.i)
+        send.assert_any_call('database_change', lib=self.lib, model=i2)
+
+
+class DatabaseConfigTest(_common.TestCase):
+    def _pragma(self, lib, name):
+        return lib._connection().execute(
+            'PRAGMA {0}'.format(name)).fetchone()[0]
+
+    def test_defaults_leave_pragmas_unset(self):
+        lib = beets.library.Library(':memory:')
+        self.assertEqual(lib.pragmas, [])
+
+    def test_pragmas_applied_to_connection(self):
+        config['database']['journal_mode'] = u'wal'
+        config['database']['synchronous'] = u'normal'
+        config['database']['cache_size'] = -4096
+        path = os.path.join(self.temp_dir, b'pragmas.db')
+        lib = beets.library.Library(path)
+        self.assertEqual(self._pragma(lib, 'journal_mode'), u'wal')
+        self.assertEqual(self._pragma(lib, 'synchronous'), 1)
+        self.assertEqual(self._pragma(lib, 'cache_size'), -4096)
+        lib._connection().close()
+
+    def test_yaml_off_is_accepted(self):
+        config['database']['synchronous'] = False
+        lib = beets.library.Library(':memory:')
+        self.assertEqual(self._pragma(lib, 'synchronous'), 0)
+
+    def test_invalid_choice_raises(self):
+        config['database']['journal_mode'] = u'bogus'
+        with self.assertRaises(confuse.ConfigValueError):
+            beets.library.Library(':memory:')
+
+
+class FullTextSearchTest(_common.TestCase):
+    def setUp(self):
+        super(FullTextSearchTest, self).setUp()
+        config['database']['fts'] = True
+        self.path = os.path.join(self.temp_dir, b'fts.db')
+        self.lib = beets.library.Library(self.path)
+        if 'items' not in self.lib._fts_tables:
+            self.skipTest('SQLite lacks FTS5 trigram support')
+        self.i = item(self.lib)
+
+    def _titles(self, query):
+        return [i.title for i in self.lib.items(query)]
+
+    def test_query_served_from_index(self):
+        query, _ = beets.library.parse_query_string(
+            u'heart', beets.library.Item)
+        query = beets.dbcore.query.FullTextQuery.rewrite(
+            query, *self.lib._fts_tables['items'])
+        self.assertIsInstance(query.subqueries[0],
+                              beets.dbcore.query.FullTextQuery)
+        self.assertIn(u'items_fts', query.clause()[0])
+
+    def test_substring_match(self):
+        self.assertEqual(self._titles(u'HE TI'), [u'the title'])
+        self.assertEqual(self._titles(u'tit ^xyz'), [u'the title'])
+        self.assertEqual(self._titles(u'xyz'), [])
+
+    def test_short_pattern_falls_back(self):
+        self.assertEqual(self._titles(u'ti'), [u'the title'])
+
+    def test_index_follows_store_and_remove(self):
+        self.i.title = u'new name'
+        self.i.store()
+        self.assertEqual(self._titles(u'title'), [])
+        self.assertEqual(self._titles(u'new nam'), [u'new name'])
+        self.i.remove()
+        self.assertEqual(self._titles(u'new nam'), [])
+
+    def test_index_built_for_existing_rows(self):
+        config['database']['fts'] = False
+        beets.library.Library(self.path)
+        config['database']['fts'] = True
+        lib = beets.library.Library(self.path)
+        self.assertEqual([i.id for i in lib.items(u'the tit')], [self.i.id])
+
+    def test_disabling_drops_index(self):
+        config['database']['fts'] = False
+        lib = beets.library.Library(self.path)
+        tables = [row[0] for row in lib._connection().execute(
+            'SELECT name FROM sqlite_master')]
+        self.assertNotIn('items_fts', tables)
+        self.assertEqual(lib._fts_tables, {})
+
+    def test_missing_trigram_support_logs_warning(self):
+        with patch.object(beets.library.Library, '_make_fts_table',
+                          return_value=None):
+            with capture_log() as logs:
+                lib = beets.library.Library(':memory:')
+        self.assertEqual(lib._fts_tables, {})
+        self.assertTrue(any(u'full-text index is disabled' in line
+                            for line in logs))
+
+
 class AddTest(_common.TestCase):
     def setUp(self):
         super(AddTest, self).setUp()
@@ -94,6 +215,18 @@ class AddTest(_common.TestCase):
             'where composer="the composer"').fetchone()['grouping']
         self.assertEqual(new_grouping, self.i.grouping)
 
+    def test_add_many_inserts_rows(self):
+        i2 = item()
+        i2.title = u'another title'
+        ids = self.lib.add_many([self.i, i2])
+        self.assertEqual(ids, [self.i.id, i2.id])
+        self.assertEqual(self.lib.get_item(i2.id).title, u'another title')
+        self.assertEqual(len(self.lib.items()), 2)
+
+    def test_add_many_sets_added(self):
+        self.lib.add_many([self.i])
+        self.assertGreater(self.lib.get_item(self.i.id).added, 0)
+
     def test_library_add_path_inserts_row(self):
         i = beets.library.Item.from_path(
             os.path.join(_common.RSRC, b'full.mp3')
@@ -125,6 +258,10 @@ class GetSetTest(_common.TestCase):
         self.i.comp = not self.i.comp
         self.assertTrue('comp' in self.i._dirty)
 
+    def test_items_are_slotted(self):
+        self.assertFalse(hasattr(self.i, '__dict__'))
+        self.assertFalse(hasattr(self.i._values_fixed, '__dict__'))
+
     def test_set_does_not_dirty_if_value_unchanged(self):
         self.i.title = self.i.title
         self.assertTrue('title' not in self.i._dirty)
@@ -1094,6 +1231,38 @@ class TemplateTest(_common.LibTestCase):
         self.assertEqual(u"{0}".format(item), u"bar bar")
         self.assertEqual(u"{0:$tagada}".format(item), u"togodo")
 
+    def test_format_fields(self):
+        config['format_item'] = u'$artist - %upper{$title}'
+        self.assertEqual(beets.library.Item.format_fields(),
+                         ['albumartist', 'artist', 'title'])
+        self.assertEqual(beets.library.Album.format_fields(u'$album $foo'),
+                         ['album', 'foo'])
+
+    def test_projected_item_format(self):
+        self.i.foo = u'bar'
+        self.i.store()
+        item = self.lib.items(fields=['title']).get()
+        self.assertEqual(format(item, u'$title $foo'),
+                         u'{0} bar'.format(self.i.title))
+
+    def test_projection_does_not_reload_for_missing_keys(self):
+        album = self.lib.add_album([self.i])
+        album.foo = u'baz'
+        album.store()
+        spec = u'$title $foo $nosuchfield'
+        fields = beets.library.Item.format_fields(spec)
+        item = self.lib.items(fields=fields).get()
+        with patch.object(beets.library.Item, '_load_missing') as load:
+            self.assertEqual(format(item, spec),
+                             u'{0} baz $nosuchfield'.format(self.i.title))
+        self.assertFalse(load.called)
+        self.assertTrue(item._partial)
+
+    def test_format_fields_with_computed_field_fetches_all(self):
+        self.assertIsNone(
+            beets.library.Item.format_fields(u'$title $filesize')
+        )
+
 
 class UnicodePathTest(_common.LibTestCase):
     def test_unicode_path(self):
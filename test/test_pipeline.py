@@ -17,8 +17,13 @@
 """
 from __future__ import division, absolute_import, print_function
 
+import multiprocessing
+import os
 import six
+import threading
+import time
 import unittest
+from mock import patch
 
 from beets.util import pipeline
 
@@ -98,6 +103,34 @@ class SimplePipelineTest(unittest.TestCase):
         self.assertEqual(list(pl2.pull()), [0, 4, 8, 12, 16])
 
 
+# A worker that takes longer for earlier messages, so that parallel
+# threads finish them out of order.
+def _slow_work(num=5):
+    i = None
+    while True:
+        i = yield i
+        time.sleep((num - i) * 0.002)
+        i *= 2
+
+
+# Stages that run in worker processes.
+@pipeline.process_stage
+def _proc_work(i):
+    return i * 2
+
+
+@pipeline.process_stage
+def _proc_pid(i):
+    return os.getpid()
+
+
+@pipeline.process_stage
+def _proc_exc_work(num, i):
+    if i == num:
+        raise ExceptionFixture()
+    return i * 2
+
+
 class ParallelStageTest(unittest.TestCase):
     def setUp(self):
         self.l = []
@@ -216,6 +249,109 @@ class MultiMessageTest(unittest.TestCase):
         self.assertEqual(list(pl.pull()), [0, 0, 1, -1, 2, -2, 3, -3, 4, -4])
 
 
+class OrderedStageTest(unittest.TestCase):
+    def test_run_sequential(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(), pipeline.ordered([_work(), _work()]), _consume(l)
+        ))
+        pl.run_sequential()
+        self.assertEqual(l, [0, 2, 4, 6, 8])
+
+    def test_run_parallel_preserves_order(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(20),
+            pipeline.ordered([_slow_work(20) for _ in range(4)]),
+            _consume(l),
+        ))
+        pl.run_parallel()
+        self.assertEqual(l, [i * 2 for i in range(20)])
+
+    def test_constrained_buffer(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(200),
+            pipeline.ordered([_work() for _ in range(4)], buffer_size=1),
+            _consume(l),
+        ))
+        pl.run_parallel(1)
+        self.assertEqual(l, [i * 2 for i in range(200)])
+
+    def test_bubble_and_multiple(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(), pipeline.ordered([_bub_work(), _bub_work()]),
+            pipeline.ordered([_multi_work(), _multi_work()]), _consume(l)
+        ))
+        pl.run_parallel()
+        self.assertEqual(l, [0, 0, 2, -2, 4, -4, 8, -8])
+
+    def test_exception(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(1000), pipeline.ordered([_exc_work(), _exc_work()], 1),
+            _consume(l)
+        ))
+        self.assertRaises(ExceptionFixture, pl.run_parallel, 1)
+
+    def test_pull(self):
+        pl = pipeline.Pipeline((
+            _produce(), pipeline.ordered([_work(), _work()])
+        ))
+        self.assertEqual(list(pl.pull()), [0, 2, 4, 6, 8])
+
+
+class ProcessStageTest(unittest.TestCase):
+    def setUp(self):
+        pipeline.start_process_pool(2)
+
+    def tearDown(self):
+        pipeline.stop_process_pool()
+
+    def test_pull(self):
+        pl = pipeline.Pipeline((_produce(), _proc_work()))
+        self.assertEqual(list(pl.pull()), [0, 2, 4, 6, 8])
+
+    def test_runs_in_other_process(self):
+        pl = pipeline.Pipeline((_produce(), _proc_pid()))
+        self.assertNotIn(os.getpid(), list(pl.pull()))
+
+    def test_run_parallel_ordered(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(50), pipeline.ordered([_proc_work(), _proc_work()]),
+            _consume(l)
+        ))
+        pl.run_parallel()
+        self.assertEqual(l, [i * 2 for i in range(50)])
+
+    def test_exception(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(), _proc_exc_work(3), _consume(l)
+        ))
+        self.assertRaises(ExceptionFixture, pl.run_parallel)
+
+    def test_default_pool(self):
+        pipeline.stop_process_pool()
+        pl = pipeline.Pipeline((_produce(), _proc_work()))
+        self.assertEqual(list(pl.pull()), [0, 2, 4, 6, 8])
+
+    def test_default_pool_started_once(self):
+        pipeline.stop_process_pool()
+        with patch('multiprocessing.Pool',
+                   wraps=multiprocessing.Pool) as pool:
+            threads = [threading.Thread(target=pipeline.run_in_process,
+                                        args=(abs, (-1,)))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(pool.call_count, 1)
+
+
 class StageDecoratorTest(unittest.TestCase):
 
     def test_stage_decorator(self):
@@ -242,6 +378,74 @@ class StageDecoratorTest(unittest.TestCase):
                          [{'x': True}, {'a': False, 'x': True}])
 
 
+class StageStatsTest(unittest.TestCase):
+    def test_names(self):
+        @pipeline.stage
+        def add(n, i):
+            return i + n
+
+        pl = pipeline.Pipeline([iter([1]), _work(), add(1)],
+                               [None, u'double'])
+        self.assertEqual([s.name for s in pl.stats],
+                         [u'stage 0', u'double', u'add'])
+
+    def test_names_of_decorated_stages(self):
+        @pipeline.stage
+        def add(n, i):
+            return i + n
+
+        @pipeline.mutator_stage
+        def setkey(key, item):
+            item[key] = True
+
+        coros = [add(1), setkey(u'x')]
+        for coro in coros:
+            # What Python 2 calls every decorated stage's generator.
+            coro.__name__ = 'coro'
+        pl = pipeline.Pipeline([iter([{}])] + coros)
+        self.assertEqual([s.name for s in pl.stats][1:], [u'add', u'setkey'])
+
+    def test_run_sequential_counts(self):
+        l = []
+        pl = pipeline.Pipeline((_produce(), _work(), _consume(l)))
+        pl.run_sequential()
+        self.assertEqual([s.messages for s in pl.stats], [5, 5, 5])
+        self.assertIsNotNone(pl.elapsed)
+
+    def test_run_parallel_counts(self):
+        l = []
+        pl = pipeline.Pipeline((
+            _produce(20), pipeline.ordered([_work(), _work()]),
+            _multi_work(), _consume(l)
+        ))
+        pl.run_parallel()
+        self.assertEqual([s.messages for s in pl.stats], [20, 20, 20, 40])
+        self.assertEqual(pl.stats[1].workers, 2)
+
+    def test_slow_stage_is_busy(self):
+        l = []
+        pl = pipeline.Pipeline((_produce(), _slow_work(), _consume(l)))
+        pl.run_parallel()
+        slow, last = pl.stats[1], pl.stats[2]
+        self.assertGreater(slow.busy, 0.02)
+        self.assertGreater(last.wait_in, slow.wait_in)
+
+    def test_queue_depth(self):
+        l = []
+        pl = pipeline.Pipeline((_produce(20), _slow_work(20), _consume(l)))
+        pl.run_parallel(4)
+        self.assertGreater(pl.stats[1].max_queue, 0)
+        self.assertLessEqual(pl.stats[1].max_queue, 4)
+
+    def test_report(self):
+        pl = pipeline.Pipeline((_produce(), _work()))
+        list(pl.pull())
+        report = pl.report()
+        self.assertEqual(report['elapsed'], None)
+        self.assertEqual(report['stages'][1]['name'], u'_work')
+        self.assertEqual(report['stages'][1]['messages'], 5)
+
+
 def suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
 
@@ -24,7 +24,7 @@ import unittest
 from beets.importer import SingletonImportTask, SentinelImportTask, \
     ArchiveImportTask, action
 from beets import plugins, config, ui
-from beets.library import Item
+from beets.library import Item, Library
 from beets.dbcore import types
 from mediafile import MediaFile
 from beets.util import displayable_path, bytestring_path, syspath
@@ -164,6 +164,42 @@ class ItemTypeConflictTest(unittest.TestCase, TestHelper):
         self.assertNotEqual(None, plugins.types(Item))
 
 
+class ItemIndexesTest(unittest.TestCase, TestHelper):
+
+    def setUp(self):
+        self.setup_plugin_loader()
+        self.original_indexes = dict(Item._indexes)
+
+    def tearDown(self):
+        Item._indexes = self.original_indexes
+        self.teardown_plugin_loader()
+        self.teardown_beets()
+
+    def test_plugin_index_created(self):
+        class IndexPlugin(plugins.BeetsPlugin):
+            item_indexes = {'title': ('title',)}
+
+        self.register_plugin(IndexPlugin)
+        self.assertEqual(plugins.indexes(Item), {'title': ('title',)})
+
+        Item._indexes.update(plugins.indexes(Item))
+        lib = Library(':memory:')
+        rows = lib._connection().execute('PRAGMA index_list(items)')
+        self.assertIn('items_by_title', [row['name'] for row in rows])
+
+    def test_conflicting_indexes(self):
+        class IndexPlugin(plugins.BeetsPlugin):
+            item_indexes = {'dup': ('title',)}
+
+        class OtherIndexPlugin(plugins.BeetsPlugin):
+            item_indexes = {'dup': ('artist',)}
+
+        self.register_plugin(IndexPlugin)
+        self.register_plugin(OtherIndexPlugin)
+        self.assertRaises(plugins.PluginConflictException,
+                          plugins.indexes, Item)
+
+
 class EventsTest(unittest.TestCase, ImportHelper, TestHelper):
 
     def setUp(self):
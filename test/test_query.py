@@ -175,6 +175,25 @@ class GetTest(DummyDataTestCase):
         results = self.lib.items(q)
         self.assert_items_matched(results, [u'foo bar'])
 
+    def test_regexp_runs_in_sql(self):
+        query, _ = beets.library.parse_query_string(u'artist::t.+r', Item)
+        clause, subvals = query.clause()
+        self.assertIn(u'REGEXP', clause)
+        self.assertEqual(subvals, [u't.+r'])
+
+    def test_regexp_on_integer_field(self):
+        q = u'year::^200[12]$'
+        results = self.lib.items(q)
+        self.assert_items_matched(results, [u'foo bar', u'baz qux'])
+
+    def test_flex_regexp(self):
+        item = self.lib.items(u'title:qux').get()
+        item.flexattr = u'catalog'
+        item.store()
+        q = u'flexattr::^c.*g$'
+        results = self.lib.items(q)
+        self.assert_items_matched(results, [u'baz qux'])
+
     def test_term_case_insensitive_with_key(self):
         q = u'artist:thrEE'
         results = self.lib.items(q)
@@ -325,6 +344,16 @@ class MatchTest(_common.TestCase):
         q = dbcore.query.RegexpQuery('album', u'^the album$')
         self.assertTrue(q.match(self.item))
 
+    def test_sqlite_regexp_caches_patterns(self):
+        regexp = dbcore.query.RegexpQuery
+        self.assertTrue(regexp.sqlite_regexp(u'^the', u'the album'))
+        self.assertFalse(regexp.sqlite_regexp(u'^the', None))
+        self.assertTrue(regexp.sqlite_regexp(u'^20', 2001))
+        for i in range(regexp._compiled_size + 10):
+            regexp.sqlite_regexp(u'pattern{0}'.format(i), u'')
+        self.assertEqual(len(regexp._compiled), regexp._compiled_size)
+        self.assertNotIn(u'^the', regexp._compiled)
+
     def test_regex_match_negative(self):
         q = dbcore.query.RegexpQuery('album', u'^album$')
         self.assertFalse(q.match(self.item))
@@ -788,6 +817,156 @@ class NoneQueryTest(unittest.TestCase, TestHelper):
         self.assertInResult(item, matched)
 
 
+class FlexQueryTest(unittest.TestCase, TestHelper):
+    """Test queries on flexible attributes that are evaluated in SQL.
+    """
+
+    def setUp(self):
+        self.lib = Library(':memory:')
+
+    def tearDown(self):
+        Item._types = {}
+
+    def parse(self, query_string):
+        query, _ = beets.library.parse_query_string(query_string, Item)
+        return query
+
+    def test_flex_query_has_clause(self):
+        clause, subvals = self.parse(u'myflex:foo').clause()
+        self.assertIn(u'item_attributes', clause)
+        self.assertIn(u'myflex', subvals)
+
+    def test_computed_field_query_is_slow(self):
+        clause, _ = self.parse(u'filesize:1').clause()
+        self.assertIsNone(clause)
+
+    def test_substring_match(self):
+        item = self.add_item(myflex=u'Foobar')
+        other = self.add_item(myflex=u'baz')
+        matched = self.lib.items(u'myflex:foo')
+        self.assertInResult(item, matched)
+        self.assertNotInResult(other, matched)
+
+    def test_empty_substring_matches_missing(self):
+        item = self.add_item()
+        matched = self.lib.items(u'myflex:')
+        self.assertInResult(item, matched)
+
+    def test_negated_match_includes_missing(self):
+        item = self.add_item(myflex=u'foo')
+        missing = self.add_item()
+        matched = self.lib.items(u'^myflex:foo')
+        self.assertNotInResult(item, matched)
+        self.assertInResult(missing, matched)
+
+    def test_typed_range_compares_numbers(self):
+        Item._types = {'myint': types.Integer()}
+        small = self.add_item(myint=9)
+        big = self.add_item(myint=10)
+        self.assertIsNotNone(self.parse(u'myint:10..').clause()[0])
+        matched = self.lib.items(u'myint:10..')
+        self.assertInResult(big, matched)
+        self.assertNotInResult(small, matched)
+
+    def test_typed_date_range(self):
+        Item._types = {'played': beets.library.DateType()}
+        old = self.add_item(played=1262304000.0)  # 2010-01-01
+        new = self.add_item(played=1577880000.0)  # 2020-01-01
+        query = self.parse(u'played:2015..')
+        self.assertIsNone(query.clause()[0])
+        matched = self.lib.items(query)
+        self.assertInResult(new, matched)
+        self.assertNotInResult(old, matched)
+
+    def test_typed_duration_range(self):
+        Item._types = {'intro': beets.library.DurationType()}
+        short = self.add_item(intro=9.5)
+        long = self.add_item(intro=75.0)
+        matched = self.lib.items(u'intro:1:00..')
+        self.assertInResult(long, matched)
+        self.assertNotInResult(short, matched)
+
+    def test_typed_int_sql_agrees_with_match(self):
+        Item._types = {'myint': types.Integer()}
+        items = {}
+        for value in (u'2.5', u'3.5', u'-2.5', u'3', u'-3', u'+4', u'4x'):
+            item = self.add_item()
+            self.lib._connection().execute(
+                "INSERT INTO item_attributes (entity_id, key, value) "
+                "VALUES (?, 'myint', ?)", (item.id, value))
+            items[value] = self.lib.get_item(item.id)
+        for pattern in (u'0', u'2', u'3', u'4', u'-2', u'-3', u'-3..3'):
+            query = self.parse(u'myint:{0}'.format(pattern))
+            self.assertIsNotNone(query.clause()[0])
+            expected = set(item.id for item in items.values()
+                           if query.match(item))
+            self.assertEqual(set(i.id for i in self.lib.items(query)),
+                             expected)
+
+    def test_typed_float_sql_agrees_with_match(self):
+        Item._types = {'myfloat': types.Float(),
+                       'mynullfloat': types.NullFloat()}
+        items = {}
+        for value in (u'2.5', u'-.5', u'+3', u'1e1', u'4x', u'abc',
+                      u'2019-01-01', u'1:30', u'1.2.3'):
+            item = self.add_item()
+            for field in ('myfloat', 'mynullfloat'):
+                self.lib._connection().execute(
+                    "INSERT INTO item_attributes (entity_id, key, value) "
+                    "VALUES (?, ?, ?)", (item.id, field, value))
+            items[value] = self.lib.get_item(item.id)
+        for field in ('myfloat', 'mynullfloat'):
+            for pattern in (u'0', u'2.5', u'-0.5', u'3', u'10', u'4',
+                            u'2019', u'..0', u'1..3'):
+                query = self.parse(u'{0}:{1}'.format(field, pattern))
+                self.assertIsNotNone(query.clause()[0])
+                expected = set(item.id for item in items.values()
+                               if query.match(item))
+                self.assertEqual(set(i.id for i in self.lib.items(query)),
+                                 expected)
+
+    def test_typed_bool_accepts_stored_words(self):
+        Item._types = {'flexbool': types.Boolean()}
+        item = self.add_item()
+        self.lib._connection().execute(
+            "INSERT INTO item_attributes (entity_id, key, value) "
+            "VALUES (?, 'flexbool', 'True')", (item.id,))
+        self.assertInResult(item, self.lib.items(u'flexbool:true'))
+
+    def test_string_query_on_typed_field_matches_text(self):
+        Item._types = {'myint': types.Integer()}
+        item = self.add_item(myint=12)
+        self.assertInResult(item, self.lib.items(u'myint::^1'))
+
+    def test_string_query_on_typed_field_agrees_with_match(self):
+        Item._types = {'myint': types.Integer()}
+        items = []
+        for value in (u'1e3', u'12', u' 15', u'x1'):
+            item = self.add_item()
+            self.lib._connection().execute(
+                "INSERT INTO item_attributes (entity_id, key, value) "
+                "VALUES (?, 'myint', ?)", (item.id, value))
+            items.append(self.lib.get_item(item.id))
+        for pattern in (u'myint::^1', u'myint:1', u'myint::x'):
+            query = self.parse(pattern)
+            expected = set(item.id for item in items if query.match(item))
+            self.assertEqual(set(i.id for i in self.lib.items(query)),
+                             expected)
+
+    def test_none_query_matches_missing(self):
+        item = self.add_item()
+        query = NoneQuery(u'myflex', fast=False)
+        query.use_flex_table('items', 'item_attributes')
+        self.assertInResult(item, self.lib.items(query))
+
+    def test_album_flex_match(self):
+        album = self.add_album()
+        album.myflex = u'foo'
+        album.store()
+        self.assertEqual(len(self.lib.albums(u'myflex:foo')), 1)
+        self.assertEqual(len(self.lib.albums(u'myflex:bar')), 0)
+
+
 class NotQueryMatchTest(_common.TestCase):
     """Test `query.NotQuery` matching against a single item, using the same
     cases and assertions as on `MatchTest`, plus assertion on the negated
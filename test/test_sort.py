@@ -21,6 +21,7 @@ import unittest
 from test import _common
 import beets.library
 from beets import dbcore
+from beets.dbcore import types
 from beets import config
 
 
@@ -205,6 +206,45 @@ class SortFlexFieldTest(DummyDataTestCase):
         for r1, r2 in zip(results, results2):
             self.assertEqual(r1.id, r2.id)
 
+    def test_parsed_sort_is_fast(self):
+        _, sort = beets.library.parse_query_string(u'flex2- year+',
+                                                   beets.library.Item)
+        self.assertFalse(sort.is_slow())
+        self.assertEqual(len(sort._sql_sorts()), 2)
+        self.assertIn(u'item_attributes', sort.order_clause())
+
+    def test_sort_mixed_fields(self):
+        results = list(self.lib.items(u'flex2- year-'))
+        self.assertEqual([r.year for r in results], [2002, 2001, 2004, 2003])
+
+    def test_typed_sort_is_numeric(self):
+        beets.library.Item._types = {'myint': types.Integer()}
+        try:
+            items = self.lib.items(u'id+')
+            for item, value in zip(items, [10, 9, 100, 2]):
+                item.myint = value
+                item.store()
+            results = self.lib.items(u'myint+')
+            self.assertEqual([r.myint for r in results], [2, 9, 10, 100])
+        finally:
+            beets.library.Item._types = {}
+
+    def test_typed_sort_puts_missing_values_first(self):
+        beets.library.Item._types = {'myint': types.Integer()}
+        try:
+            items = list(self.lib.items(u'id+'))
+            for item, value in zip(items, [3, None, -5, -1]):
+                if value is not None:
+                    item.myint = value
+                    item.store()
+            expected = [items[i].id for i in (1, 2, 3, 0)]
+            results = self.lib.items(u'myint+')
+            self.assertEqual([r.id for r in results], expected)
+            results = self.lib.items(u'myint-')
+            self.assertEqual([r.id for r in results], expected[::-1])
+        finally:
+            beets.library.Item._types = {}
+
 
 class SortAlbumFixedFieldTest(DummyDataTestCase):
     def test_sort_asc(self):
@@ -285,6 +285,10 @@ class EvalTest(unittest.TestCase):
     def test_function_call_with_empty_arg(self):
         self.assertEqual(self._eval(u"%len{}"), u"0")
 
+    def test_variables(self):
+        template = functemplate.Template(u"$foo %lower{$bar $foo} $$baz")
+        self.assertEqual(template.variables(), set([u'foo', u'bar']))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
@@ -82,6 +82,17 @@ class ListTest(unittest.TestCase):
         stdout = self._run_list(album=True, fmt=u'$path')
         self.assertEqual(stdout.getvalue().strip(), u'xxx')
 
+    def test_list_explain(self):
+        with capture_stdout() as stdout:
+            commands.explain_query(self.lib, [u'title:the', u'foo:bar'],
+                                   False)
+        out = stdout.getvalue()
+        self.assertIn(u'SQL: SELECT id FROM items WHERE', out)
+        self.assertIn(u'SQLite plan:', out)
+        self.assertIn(u'Slow query: none', out)
+        self.assertIn(u'materialize:', out)
+        self.assertIn(u'Matched 0 items', out)
+
     def test_list_album_omits_title(self):
         stdout = self._run_list(album=True)
         self.assertNotIn(u'the title', stdout.getvalue())
@@ -278,6 +289,24 @@ class ModifyTest(unittest.TestCase, TestHelper):
         item.read()
         self.assertIn(b'newAlbum', item.path)
 
+    def test_album_move_stores_in_batches(self):
+        artpath = os.path.join(os.path.dirname(self.item.path), b'cover.jpg')
+        with open(syspath(artpath), 'wb'):
+            pass
+        self.album.artpath = artpath
+        self.album.store()
+
+        store_changes = self.lib._store_changes
+        with patch.object(self.lib, '_store_changes',
+                          wraps=store_changes) as batches:
+            self.modify(u"--album", u"album=newAlbum")
+        # One batch for the album, one for its changes reaching the items
+        # and one for the moved items along with the album's art path.
+        self.assertEqual(batches.call_count, 3)
+        album = self.lib.albums().get()
+        self.assertIn(b'newAlbum', album.artpath)
+        self.assertTrue(os.path.exists(syspath(album.artpath)))
+
     def test_album_not_move(self):
         self.modify(u"--nomove", u"--album", u"album=newAlbum")
         item = self.lib.items().get()
@@ -10,6 +10,7 @@ import os.path
 from six import assertCountEqual
 
 from test import _common
+from beets import dbcore
 from beets.library import Item, Album
 from beetsplug import web
 
@@ -140,6 +141,87 @@ class WebPluginTest(_common.LibTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(res_json['albums']), 2)
 
+    def test_get_item_query_fields(self):
+        response = self.client.get('/item/query/another?fields=title')
+        res_json = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(res_json['results'],
+                         [{'id': 2, 'title': u'another title'}])
+
+    def test_get_all_albums_fields(self):
+        response = self.client.get('/album/?fields=album')
+        res_json = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(response.status_code, 200)
+        for album in res_json['albums']:
+            self.assertEqual(set(album), set(['id', 'album']))
+
+    def test_get_items_by_page(self):
+        response = self.client.get('/item/?limit=1')
+        res_json = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(res_json['items']), 1)
+        first_id = res_json['items'][0]['id']
+        self.assertEqual(res_json['next_after'], first_id)
+
+        response = self.client.get('/item/?limit=1&after=%d' % first_id)
+        res_json = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(res_json['items']), 1)
+        self.assertNotEqual(res_json['items'][0]['id'], first_id)
+
+        response = self.client.get(
+            '/item/?limit=1&after=%d' % res_json['next_after'])
+        res_json = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(res_json, {'items': []})
+
+    def test_get_items_unknown_cursor(self):
+        response = self.client.get('/item/query/title?limit=1&after=9')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_item_values(self):
+        response = self.client.get('/item/values/title')
+        res_json = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(res_json['values'], [u'another title', u'title'])
+
+    def test_get_item_values_unknown_key(self):
+        response = self.client.get('/item/values/nosuchkey')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/item/values/title?sort_key=nosuchkey')
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_item_values_computed_field(self):
+        response = self.client.get('/item/values/filesize')
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_item_values_flex_attribute(self):
+        item = self.lib.get_item(1)
+        item.mood = u'calm'
+        item.store()
+        response = self.client.get('/item/values/mood')
+        res_json = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(res_json['values'], [u'calm'])
+
+    def test_stats(self):
+        response = self.client.get('/stats')
+        res_json = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(res_json, {'items': 2, 'albums': 2})
+
+    def test_stats_include_query_cache(self):
+        self.lib.query_cache = dbcore.QueryCache(8)
+        self.client.get('/item/query/title')
+        self.client.get('/item/query/title')
+        response = self.client.get('/stats')
+        res_json = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(res_json['query_cache']['hits'], 1)
+        self.assertEqual(res_json['query_cache']['misses'], 1)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromName(__name__)